@@ -0,0 +1,95 @@
+"""
+Per-turn audio preparation benchmark: what audio_util.process_recording
+removes before STT and what it costs.
+
+Each turn is a recording as Asterisk makes it (8 kHz, ended by 3 s of
+silence, capped at 5 s): either the WAV files given on the command line or
+synthetic turns of line noise, speech-like bursts and trailing silence. For
+each it reports the bytes and seconds recorded and sent to STT (trimmed,
+at 16 kHz), and the processing time. Run from the repository root:
+
+    python benchmarks/bench_audio.py --turns 500
+    python benchmarks/bench_audio.py recordings/*.wav
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+import wave
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [os.path.join(ROOT, 'src'), os.path.join(ROOT, 'src', 'ivr')]
+
+import numpy as np  # noqa: E402
+
+from audio_util import process_recording  # noqa: E402
+
+RATE = 8000
+MAX_SECONDS = 5.0
+SILENCE_SECONDS = 3.0
+
+def synthetic_turn(rng):
+    """A recording with 0-3.5 s of speech (a tenth are silent) after 0.2-1 s of line noise."""
+    speech_seconds = 0.0 if rng.random() < 0.1 else rng.uniform(0.6, 3.5)
+    lead = rng.uniform(0.2, 1.0)
+    total = min(MAX_SECONDS, lead + speech_seconds + SILENCE_SECONDS)
+    samples = rng.normal(0, rng.uniform(10, 60), int(total * RATE))
+    start, stop = int(lead * RATE), int(min(total, lead + speech_seconds) * RATE)
+    t = np.arange(stop - start) / RATE
+    envelope = np.abs(np.sin(np.pi * rng.uniform(3, 5) * t))
+    pitch = rng.uniform(100, 250)
+    samples[start:stop] += envelope * (rng.uniform(1500, 6000) * np.sin(2 * np.pi * pitch * t)
+                                       + rng.normal(0, 600, stop - start))
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as recording:
+        recording.setnchannels(1)
+        recording.setsampwidth(2)
+        recording.setframerate(RATE)
+        recording.writeframes(np.clip(samples, -32768, 32767).astype('<i2').tobytes())
+    return out.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-turn audio preparation benchmark")
+    parser.add_argument('recordings', nargs='*', help="WAV recordings to use instead of synthetic turns")
+    parser.add_argument('--turns', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--stt-rate', type=int, default=16000, help="Sample rate sent to STT")
+    args = parser.parse_args()
+
+    if args.recordings:
+        turns = []
+        for path in args.recordings:
+            with open(path, 'rb') as f:
+                turns.append(f.read())
+    else:
+        rng = np.random.default_rng(args.seed)
+        turns = [synthetic_turn(rng) for _ in range(args.turns)]
+
+    recorded_bytes = sent_bytes = 0
+    recorded_seconds = sent_seconds = 0.0
+    silent = 0
+    timings = []
+    for data in turns:
+        start = time.perf_counter()
+        utterance = process_recording(data, target_rate=args.stt_rate)
+        timings.append((time.perf_counter() - start) * 1000)
+        recorded_bytes += utterance.recorded_bytes
+        recorded_seconds += utterance.recorded_seconds
+        sent_bytes += len(utterance.pcm)
+        sent_seconds += utterance.seconds
+        silent += not utterance.has_speech
+
+    n = len(turns)
+    print(f"turns:             {n} ({silent} without speech, not sent to STT)")
+    print(f"recorded per turn: {recorded_seconds / n:.2f}s  {recorded_bytes / n / 1024:.1f} KiB (8 kHz)")
+    print(f"sent per turn:     {sent_seconds / n:.2f}s  {sent_bytes / n / 1024:.1f} KiB ({args.stt_rate / 1000:g} kHz)")
+    print(f"saved per turn:    {(recorded_seconds - sent_seconds) / n:.2f}s  "
+          f"{(recorded_bytes - sent_bytes) / n / 1024:.1f} KiB "
+          f"({1 - sent_seconds / recorded_seconds:.0%} of the audio)")
+    print(f"processing ms:     median {statistics.median(timings):.2f}  max {max(timings):.2f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Call flow benchmark: transitions/s and memory per active call for the
+compiled flows (call_state.CallState over config/call_flows.yml) against
+the old style of state machine.
+
+  dict     - states as strings, each transition checked by membership in a
+             list copied from the parsed YAML and counted with labels(),
+             state held in a per-call object with an instance __dict__
+  compiled - CallState: integer state, one tuple lookup per transition,
+             visit counts in a bytearray and fixed __slots__
+
+Each call walks its flow the way a caller who says nothing until the last
+try would (ask, no_speech, ... classify, transfer). Memory is measured
+with tracemalloc over --calls live call states, each with a short history.
+Run from the repository root:
+
+    python benchmarks/bench_call_flow.py --calls 10000 --flow caller_unknown
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+from prometheus_client import Counter
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [os.path.join(ROOT, 'src'), os.path.join(ROOT, 'src', 'ivr')]
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+from call_state import CallState, get_call_flow  # noqa: E402
+from utils.config_registry import FLOW_OUTCOMES  # noqa: E402
+
+SPEECH, SILENCE, NEXT, TRANSFER = (FLOW_OUTCOMES.index(o) for o in ('speech', 'silence', 'next', 'transfer'))
+
+BASELINE_TRANSITIONS = Counter('bench_dict_transitions_total', 'Baseline transitions', ['from_state', 'to_state'])
+
+class DictCallState:
+    """The per-call state machine as it was before flows were compiled."""
+
+    def __init__(self, states):
+        self.states = states
+        self.current_state = 'ask'
+        self.context = {}
+        self.last_response = None
+        self.retry_count = 0
+        self.previous_state = None
+        self.history = []
+
+    def transition(self, new_state):
+        state = self.states.get(self.current_state)
+        if new_state not in (list(state['transitions']) if state else []):
+            raise ValueError(f"Invalid transition {self.current_state}→{new_state}")
+        self.previous_state = self.current_state
+        BASELINE_TRANSITIONS.labels(from_state=self.current_state, to_state=new_state).inc()
+        self.current_state = new_state
+        self.retry_count = 0
+
+def dict_states(flow):
+    """The flow as the old parser kept it: state name → {'transitions': [names]}."""
+    return {name: {'prompt': flow.prompts[i], 'transitions': list(flow.targets(name))}
+            for i, name in enumerate(flow.states)}
+
+def walk(flow):
+    """The outcomes of one call: silent until the last try, then a transfer."""
+    silent = (flow.max_visits[flow.start] or 1) - 1
+    return [SILENCE, NEXT] * silent + [SPEECH, TRANSFER]
+
+def run_compiled(flow, outcomes, calls):
+    for _ in range(calls):
+        state = CallState(flow)
+        state.enter()
+        for outcome in outcomes:
+            state.advance(outcome)
+            state.enter()
+
+def run_dict(flow, outcomes, calls):
+    states = dict_states(flow)
+    path = []
+    state = CallState(flow)
+    state.enter()
+    for outcome in outcomes:
+        state.advance(outcome)
+        state.enter()
+        path.append(state.current_state)
+    for _ in range(calls):
+        call = DictCallState(states)
+        for name in path:
+            call.transition(name)
+
+def per_call_bytes(make, calls):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    live = [make() for _ in range(calls)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del live
+    return used / calls
+
+def with_history(state):
+    state.history.append({"role": "user", "content": "I'd like to speak to someone"})
+    return state
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=10000)
+    parser.add_argument('--flow', default='caller_unknown')
+    args = parser.parse_args()
+
+    flow = get_call_flow(args.flow)
+    outcomes = walk(flow)
+    states = dict_states(flow)
+    print(f"flow {flow.name}: {len(flow.states)} states, {len(outcomes)} transitions per call")
+    for name, run, make in (
+            ('dict', run_dict, lambda: with_history(DictCallState(states))),
+            ('compiled', run_compiled, lambda: with_history(CallState(flow)))):
+        run(flow, outcomes, min(args.calls, 100))  # warm up
+        started = time.perf_counter()
+        run(flow, outcomes, args.calls)
+        elapsed = time.perf_counter() - started
+        rate = args.calls * len(outcomes) / elapsed
+        print(f"{name:>8}: {rate:12,.0f} transitions/s  {per_call_bytes(make, args.calls):7,.0f} bytes per call")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Caller directory build and lookup benchmark.
+
+Builds a directory from a synthetic config with --numbers exact entries and
+--prefixes blocklist prefixes, then times exact hits, prefix-rule hits and
+misses, alongside the old `caller_id in list` scan for comparison. Run from
+the repository root:
+
+    python benchmarks/bench_caller_directory.py --numbers 100000 --prefixes 5000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import yaml
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [os.path.join(ROOT, 'src'), os.path.join(ROOT, 'src', 'ivr')]
+
+from caller_directory import CallerDirectory  # noqa: E402
+from utils.config_registry import ConfigRegistry  # noqa: E402
+
+def per_lookup_ns(fn, numbers):
+    start = time.perf_counter()
+    for number in numbers:
+        fn(number)
+    return (time.perf_counter() - start) / len(numbers) * 1e9
+
+def main():
+    parser = argparse.ArgumentParser(description="Caller directory benchmark")
+    parser.add_argument('--numbers', type=int, default=100000)
+    parser.add_argument('--prefixes', type=int, default=5000)
+    parser.add_argument('--lookups', type=int, default=200000)
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    allowed = [f"+1{rng.randrange(2000000000, 9999999999)}" for _ in range(args.numbers)]
+    # Prefixes in the 1800 NPA so they never shadow the exact numbers above
+    prefixes = [f"+1800{rng.randrange(100, 999)}{rng.randrange(0, 9)}" for _ in range(args.prefixes)]
+    with tempfile.TemporaryDirectory() as config_dir:
+        with open(os.path.join(config_dir, 'allowed_callers.yml'), 'w') as f:
+            yaml.safe_dump({'allowed_callers': allowed}, f)
+        with open(os.path.join(config_dir, 'owner_callers.yml'), 'w') as f:
+            yaml.safe_dump({'owner_callers': allowed[:2]}, f)
+        with open(os.path.join(config_dir, 'blocked_callers.yml'), 'w') as f:
+            yaml.safe_dump({'blocked_prefixes': prefixes,
+                            'blocked_ranges': [{'start': '+15550100000', 'end': '+15550199999'}]}, f)
+
+        start = time.perf_counter()
+        directory = CallerDirectory(registry=ConfigRegistry(config_dir, check_interval=3600), check_interval=3600)
+        build_s = time.perf_counter() - start
+
+    # National-format hits exercise normalization as well as the hash lookup.
+    hits = [rng.choice(allowed)[2:] for _ in range(args.lookups)]
+    prefix_hits = [f"{rng.choice(prefixes)}{rng.randrange(1000, 9999)}"[:12] for _ in range(args.lookups)]
+    misses = [f"+44{rng.randrange(1000000000, 9999999999)}" for _ in range(args.lookups)]
+    assert directory.category(hits[0]) == 'allowed'
+    assert directory.category(prefix_hits[0]) == 'blocked'
+    assert directory.category(misses[0]) == 'unknown'
+
+    print(f"entries:          {len(directory)} exact, {args.prefixes} prefixes + 1 range")
+    print(f"build:            {build_s * 1000:.0f} ms (YAML parse included)")
+    print(f"exact hit:        {per_lookup_ns(directory.lookup, hits):.0f} ns/lookup")
+    print(f"prefix-rule hit:  {per_lookup_ns(directory.lookup, prefix_hits):.0f} ns/lookup")
+    print(f"miss:             {per_lookup_ns(directory.lookup, misses):.0f} ns/lookup")
+    sample = ['+1' + n for n in hits[:200]]
+    print(f"old list scan:    {per_lookup_ns(lambda n: n in allowed, sample):.0f} ns/lookup")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+Recent-history read benchmark on a large chat_history table (SQLite).
+
+Fills a throwaway database with --rows turns, half of them belonging to a few
+long-standing callers, then times:
+
+  old query   - ORM rows, oldest 10 first, single-column idx_caller_cli
+  new query   - Database.get_conversation_history (latest 10, three columns)
+                before and after the idx_caller_cli_timestamp migration
+  redis cache - HistoryCache hits, when --redis-url points at a server
+
+Run from the repository root:
+
+    python benchmarks/bench_history.py --rows 2000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [os.path.join(ROOT, 'src'), os.path.join(ROOT, 'src', 'ivr')]
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from db.db import Database  # noqa: E402
+from db.history_cache import HistoryCache  # noqa: E402
+from db.models import Base, ChatHistory  # noqa: E402
+
+def old_history(db, caller_cli, limit=10):
+    """The query get_conversation_history ran before the migration."""
+    session = db.get_session()
+    try:
+        entries = session.query(ChatHistory).filter_by(caller_cli=caller_cli)\
+            .order_by(ChatHistory.timestamp.asc()).limit(limit).all()
+        return [{"role": e.role, "message": e.message,
+                 "timestamp": e.timestamp.isoformat() if e.timestamp else None} for e in entries]
+    finally:
+        session.close()
+
+def fill(engine, rows, callers, heavy_callers, rng):
+    start = datetime(2024, 1, 1)
+    clis = [f"+1555{i:07d}" for i in range(callers)]
+    heavy = clis[:heavy_callers]
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        batch = []
+        for i in range(rows):
+            cli = rng.choice(heavy) if i % 2 else rng.choice(clis)
+            batch.append((cli, f"call-{i // 6}", 'user' if i % 2 else 'llm',
+                          f"turn {i} lorem ipsum dolor sit amet", start + timedelta(seconds=i)))
+            if len(batch) == 50000:
+                cursor.executemany("INSERT INTO chat_history (caller_cli, call_id, role, message, timestamp) "
+                                   "VALUES (?, ?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            cursor.executemany("INSERT INTO chat_history (caller_cli, call_id, role, message, timestamp) "
+                               "VALUES (?, ?, ?, ?, ?)", batch)
+        conn.commit()
+    finally:
+        conn.close()
+    return clis, heavy
+
+def time_ms(fn, clis, samples):
+    timings = []
+    for cli in clis[:samples]:
+        start = time.perf_counter()
+        fn(cli)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), max(timings)
+
+def report(label, result):
+    print(f"{label:<36} median {result[0]:8.3f} ms   max {result[1]:8.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="chat_history recent-turns benchmark")
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--callers', type=int, default=20000)
+    parser.add_argument('--heavy-callers', type=int, default=20)
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--redis-url', help="e.g. redis://localhost:6379/15 to time cache hits")
+    args = parser.parse_args()
+    rng = random.Random(7)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/history.db")
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            # Start from the pre-migration index layout.
+            conn.execute(text("DROP INDEX idx_caller_cli_timestamp"))
+            conn.execute(text("CREATE INDEX idx_caller_cli ON chat_history (caller_cli)"))
+        start = time.perf_counter()
+        clis, heavy = fill(engine, args.rows, args.callers, args.heavy_callers, rng)
+        print(f"filled {args.rows} rows in {time.perf_counter() - start:.1f}s "
+              f"({args.heavy_callers} callers hold half of them)")
+
+        db = Database(startup_mode='skip', engine=engine)
+        sample = rng.sample(clis, min(args.samples, len(clis)))
+        heavy_sample = [rng.choice(heavy) for _ in range(args.samples)]
+
+        report("old query, typical caller", time_ms(lambda c: old_history(db, c), sample, args.samples))
+        report("old query, long-standing caller", time_ms(lambda c: old_history(db, c), heavy_sample, args.samples))
+        report("new query, old index, long-standing",
+               time_ms(db.get_conversation_history, heavy_sample, args.samples))
+
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            conn.execute(text("CREATE INDEX idx_caller_cli_timestamp ON chat_history (caller_cli, timestamp, id)"))
+            conn.execute(text("DROP INDEX idx_caller_cli"))
+        print(f"migration (composite index build): {time.perf_counter() - start:.1f}s")
+
+        report("new query, typical caller", time_ms(db.get_conversation_history, sample, args.samples))
+        report("new query, long-standing caller", time_ms(db.get_conversation_history, heavy_sample, args.samples))
+
+        if args.redis_url:
+            from redis import Redis
+            redis_client = Redis.from_url(args.redis_url)
+            cache = HistoryCache(redis_client, lambda: db)
+            for cli in set(heavy_sample):
+                redis_client.delete(cache.key(cli))
+                cache.recent(cli)  # Read-through fill
+            report("redis cache hit, long-standing", time_ms(cache.recent, heavy_sample, args.samples))
+            for cli in set(heavy_sample):
+                redis_client.delete(cache.key(cli))
+        engine.dispose()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Offline accuracy and latency benchmark for the local intent fast path.
+
+Replays the labelled transcripts in benchmarks/data/intent_transcripts.yml
+through the matcher compiled from config/*_caller_intents.yml and reports the
+fast-path hit rate, how often a fast-path hit was the right intent, how often
+it fired on a transcript that should have gone to the LLM, and per-match
+latency. Run from the repository root:
+
+    python benchmarks/bench_intent_matcher.py --iterations 2000
+"""
+import argparse
+import os
+import sys
+import time
+import yaml
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [os.path.join(ROOT, 'src'), os.path.join(ROOT, 'src', 'ivr')]
+os.chdir(ROOT)
+
+from intent_matcher import get_intent_matcher  # noqa: E402
+
+def evaluate(caller_type, samples, iterations):
+    matcher = get_intent_matcher(caller_type)
+    hits = correct = false_routes = 0
+    for sample in samples:
+        intent, confidence = matcher.match(sample['text'])
+        routed = intent if intent is not None and confidence >= matcher.threshold else None
+        if routed is None:
+            continue
+        hits += 1
+        if routed == sample['intent']:
+            correct += 1
+        elif sample['intent'] is None:
+            false_routes += 1
+        else:
+            print(f"  wrong: {sample['text']!r} -> {routed} (expected {sample['intent']})")
+    routable = sum(1 for s in samples if s['intent'] is not None)
+
+    texts = [s['text'] for s in samples]
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for text in texts:
+            matcher.match(text)
+    per_match_us = (time.perf_counter() - start) / (iterations * len(texts)) * 1e6
+
+    print(f"{caller_type}: {len(samples)} transcripts, threshold {matcher.threshold}")
+    print(f"  fast-path hit rate:   {hits / len(samples):.0%} of all, {correct / max(routable, 1):.0%} of routable")
+    print(f"  fast-path precision:  {correct / max(hits, 1):.0%}")
+    print(f"  routed instead of LLM: {false_routes}")
+    print(f"  latency:              {per_match_us:.1f} us/match")
+    return correct == hits
+
+def main():
+    parser = argparse.ArgumentParser(description="Local intent matcher benchmark")
+    parser.add_argument('--data', default=os.path.join('benchmarks', 'data', 'intent_transcripts.yml'))
+    parser.add_argument('--iterations', type=int, default=1000)
+    args = parser.parse_args()
+    with open(args.data) as f:
+        data = yaml.safe_load(f)
+    ok = all([evaluate(caller_type, samples, args.iterations) for caller_type, samples in data.items()])
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
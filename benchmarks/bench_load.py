@@ -0,0 +1,518 @@
+"""
+Concurrent-call load test: how many simultaneous calls one worker sustains.
+
+Virtual callers (owner, allowed and unknown, scripted in
+benchmarks/data/load_callers.yml) call IVRHandler.handle_call over fake AGI
+channels, in closed loop, at each concurrency level in turn. Everything on
+the call path runs for real - Redis, the rate limiter, caches, budgets and
+breakers, the LLM client's HTTP pool, history writes (to SQLite) - except
+the backends:
+
+  llm    - FakeLLMServer in a child process, answering each utterance with
+           its scripted reply
+  stt    - the Speech SDK call behind stt.azure_stt, replaced by a delay
+           that returns the caller's next line; the recordings themselves
+           are written and trimmed as usual
+  tts    - the same for tts.azure_tts, writing a short silent file
+
+Each backend's latency is log-normal, given as "median,p95" seconds, and
+fails at its --*-error-rate. Callers speak and prompts play in real time
+multiplied by --time-scale.
+
+Per level it reports calls/s, p50/p95/p99 turn latency (from the end of the
+caller's speech, or of the owner greeting, to the start of the reply audio),
+failed calls, RSS above the idle process per concurrent call and how many
+calls and requests admission control shed (--slots overrides the configured
+slots, e.g. llm=8,stt=16). The
+saturation point is the first level whose p95 exceeds --slo-ms or whose
+failed-call share exceeds --max-error-rate; the level before it is the
+capacity. It uses Redis database 15 by default and deletes the breaker and
+admission keys it may leave behind. Run from the repository root:
+
+    python benchmarks/bench_load.py --concurrency 10,50,100,200,400 --step-seconds 30
+
+By default the LLM response cache is off, so scripted lines repeated across
+calls still reach the LLM, and the per-caller and global LLM rate limits are
+lifted (they bound spend, not capacity); --production-limits keeps both.
+"""
+import argparse
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import wave
+from functools import lru_cache
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [os.path.join(ROOT, 'src'), os.path.join(ROOT, 'src', 'ivr')]
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+import numpy as np  # noqa: E402
+import yaml  # noqa: E402
+from redis import Redis  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+
+import prompts  # noqa: E402
+from agi_handler import IVRHandler  # noqa: E402
+from caller_directory import ALLOWED, OWNER, UNKNOWN, CallerEntry  # noqa: E402
+from db.db import Database  # noqa: E402
+from db.models import Base  # noqa: E402
+from llm.fake_server import FakeLLMServer  # noqa: E402
+from resources import SharedResources  # noqa: E402
+from stt import azure_stt  # noqa: E402
+from tts import azure_tts, cache as tts_cache  # noqa: E402
+from prometheus_client import REGISTRY  # noqa: E402
+from utils.admission import configure_admission  # noqa: E402
+from utils.rate_limiter import Rate  # noqa: E402
+from utils.tracing import get_trace  # noqa: E402
+
+CALLERS_FILE = os.path.join(ROOT, 'benchmarks', 'data', 'load_callers.yml')
+CATEGORIES = {'owner': OWNER, 'allowed': ALLOWED, 'unknown': UNKNOWN}
+# Caller IDs are +1555<digit><index>, one digit per caller type.
+NUMBER_DIGITS = {'owner': '1', 'allowed': '2', 'unknown': '3'}
+SECONDS_PER_WORD = 0.35  # Speaking rate, for both callers and prompts
+FAILED = ('fallback', 'error')
+
+class Latency:
+    """Log-normal delay given its median and 95th percentile in seconds, e.g. "0.6,1.5"."""
+    def __init__(self, median, p95=None, seed=None):
+        self.median = float(median)
+        p95 = float(p95) if p95 is not None else self.median
+        self.sigma = math.log(p95 / self.median) / 1.645 if self.median > 0 and p95 > self.median else 0.0
+        self._random = random.Random(seed)
+
+    @classmethod
+    def parse(cls, text, seed=None):
+        return cls(*text.split(','), seed=seed)
+
+    def sample(self):
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(self.sigma * self._random.gauss(0, 1))
+
+    def __str__(self):
+        p95 = self.median * math.exp(1.645 * self.sigma)
+        return f"median {self.median * 1000:.0f}ms p95 {p95 * 1000:.0f}ms"
+
+def load_callers(path):
+    """(default_reply, {caller type: (weight, scripts)}, {utterance: reply}) from the callers file."""
+    with open(path) as f:
+        config = yaml.safe_load(f)
+    replies = {}
+    callers = {}
+    for kind, spec in config['callers'].items():
+        if kind not in CATEGORIES:
+            raise ValueError(f"{path}: unknown caller type {kind!r}")
+        scripts = []
+        for script in spec['scripts']:
+            turns = []
+            for turn in script.get('turns') or []:
+                turns.append(turn['say'])
+                if turn.get('reply') is not None:
+                    replies[turn['say']] = json.dumps(turn['reply'])
+            scripts.append(turns)
+        callers[kind] = (float(spec.get('weight', 1)), scripts)
+    return json.dumps(config['default_reply']), callers, replies
+
+@lru_cache(maxsize=64)
+def fake_recording(speech_seconds, silence_seconds):
+    """What Asterisk would record: line noise, speech-like bursts, then silence until it stops."""
+    rng = np.random.default_rng(int(speech_seconds * 100))
+    rate = 8000
+    lead, speech, tail = int(0.3 * rate), int(speech_seconds * rate), int(silence_seconds * rate)
+    samples = rng.normal(0, 40, lead + speech + tail)
+    t = np.arange(speech) / rate
+    syllables = np.abs(np.sin(np.pi * 4 * t))  # About four syllables a second
+    samples[lead:lead + speech] += syllables * (3000 * np.sin(2 * np.pi * 180 * t) + rng.normal(0, 800, speech))
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as recording:
+        recording.setnchannels(1)
+        recording.setsampwidth(2)
+        recording.setframerate(rate)
+        recording.writeframes(np.clip(samples, -32768, 32767).astype('<i2').tobytes())
+    return out.getvalue()
+
+def serve_llm(default_reply, replies, latency, token_delay, error_rate, ready):
+    """Child process: a FakeLLMServer answering the last user message with its scripted reply."""
+    def reply(body):
+        for message in reversed(body.get('messages') or []):
+            if message.get('role') == 'user':
+                return replies.get(message.get('content'), default_reply)
+        return default_reply
+
+    server = FakeLLMServer(reply, first_token_delay=latency.sample, token_delay=token_delay,
+                           error_rate=error_rate).start()
+    ready.send(server.url)
+    threading.Event().wait()
+
+class ScriptedCall:
+    """
+    A fake AGI channel for one call. Prompts "play" and the caller "speaks"
+    for as long as their words would take (scaled), and the gap between the
+    caller finishing and the next audio is recorded as a turn latency.
+    """
+    def __init__(self, call_id, number, turns, owner, time_scale):
+        self.env = {
+            'agi_uniqueid': call_id,
+            'agi_callerid': number,
+            'agi_channel': f"PJSIP/load-{call_id}",
+            'agi_enhanced': '0.0',
+        }
+        self.turns = list(turns)
+        self.time_scale = time_scale
+        self.turn_latencies = []
+        self.outcome = 'completed'
+        self.heard = ""
+        self._next_turn = 0
+        self._last_text = ''
+        self._waiting_since = None
+        # The owner flow has no caller input: the wait starts after the greeting.
+        self._reply_after_greeting = owner
+
+    def _speak(self, text):
+        time.sleep(len(text.split()) * SECONDS_PER_WORD * self.time_scale)
+
+    def next_utterance(self):
+        if self._next_turn >= len(self.turns):
+            return ""
+        text = self.turns[self._next_turn]
+        self._next_turn += 1
+        return text
+
+    def verbose(self, message, level=1):
+        self._last_text = message
+        if message == prompts.SERVICE_UNAVAILABLE:
+            self.outcome = 'fallback'
+
+    def stream_file(self, filename, escape_digits='', sample_offset=0):
+        if self._waiting_since is not None:
+            self.turn_latencies.append(time.monotonic() - self._waiting_since)
+            self._waiting_since = None
+        self._speak(self._last_text)
+        if self._reply_after_greeting:
+            self._reply_after_greeting = False
+            self._waiting_since = time.monotonic()
+        return ''
+
+    def record_file(self, filename, format='gsm', escape_digits='#', timeout=-1, offset=0,
+                    beep='beep', silence=0):
+        text = self.heard = self.next_utterance()
+        speech_seconds = min(len(text.split()) * SECONDS_PER_WORD, timeout / 1000 - silence)
+        time.sleep((speech_seconds + silence) * self.time_scale)  # Recording ends on silence
+        with open(f"{filename}.{format}", 'wb') as f:
+            f.write(fake_recording(round(speech_seconds, 2), silence))
+        self._waiting_since = time.monotonic()
+        return ''
+
+    def wait_for_digit(self, timeout=-1):
+        time.sleep(timeout / 1000 * self.time_scale)  # Load callers never use the keypad
+        return ''
+
+    def set_variable(self, name, value):
+        if name == 'TRANSFER_EXTENSION':
+            self.outcome = 'transfer'
+
+    def get_variable(self, name):
+        return ''
+
+    def hangup(self, channel=''):
+        if self.outcome == 'completed':
+            self.outcome = 'hangup'
+
+class FakeSpeech:
+    """Stands in for the Speech SDK calls behind stt.azure_stt and tts.azure_tts."""
+    def __init__(self, calls, stt_latency, tts_latency, stt_error_rate, tts_error_rate, seed=None):
+        self.calls = calls
+        self.stt_latency = stt_latency
+        self.tts_latency = tts_latency
+        self.stt_error_rate = stt_error_rate
+        self.tts_error_rate = tts_error_rate
+        self._random = random.Random(seed)
+
+    def install(self):
+        # Only the SDK round trips are replaced; budgets and breakers still apply.
+        azure_stt._recognize_pcm = self.recognize
+        azure_tts._synthesize = self.synthesize
+
+    def _wait(self, latency, error_rate, timeout, what):
+        delay = latency.sample()
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"{what} did not finish within {timeout:.2f}s")
+        time.sleep(delay)
+        if error_rate and self._random.random() < error_rate:
+            raise Exception(f"Speech {what} request canceled: injected failure")
+
+    def recognize(self, pcm, sample_rate, timeout):
+        call = self.calls[get_trace().call_id]
+        self._wait(self.stt_latency, self.stt_error_rate, timeout, 'stt')
+        return call.heard
+
+    def synthesize(self, text, output_file, voice, audio_format, timeout):
+        self._wait(self.tts_latency, self.tts_error_rate, timeout, 'tts')
+        with wave.open(output_file, 'wb') as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(8000)
+            out.writeframes(b'\0\0' * 800)
+        return True
+
+class ScriptedDirectory:
+    """Caller directory holding the virtual callers' numbers."""
+    def __init__(self):
+        self.categories = {}
+
+    def lookup(self, raw_number):
+        return CallerEntry(raw_number, self.categories.get(raw_number, UNKNOWN))
+
+def shed_total():
+    """Calls sent to a shed flow plus LLM and STT requests refused a slot, so far."""
+    return sum(sample.value for metric in REGISTRY.collect() if metric.name == 'admission_shed'
+               for sample in metric.samples if sample.name == 'admission_shed_total')
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+class Step:
+    """Results of one concurrency level."""
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.lock = threading.Lock()
+        self.completed = 0
+        self.outcomes = {}
+        self.turn_latencies = []
+        self.active = 0
+        self.peak_active = 0
+        self.peak_rss = 0
+        self.shed = 0
+
+    def call_started(self):
+        with self.lock:
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+
+    def call_finished(self, call, in_window):
+        with self.lock:
+            self.active -= 1
+            self.outcomes[call.outcome] = self.outcomes.get(call.outcome, 0) + 1
+            self.turn_latencies.extend(call.turn_latencies)
+            if in_window:
+                self.completed += 1
+
+    def summary(self, seconds, baseline_rss):
+        calls = sum(self.outcomes.values())
+        failed = sum(self.outcomes.get(outcome, 0) for outcome in FAILED)
+        latencies_ms = [latency * 1000 for latency in self.turn_latencies]
+        return {
+            "concurrency": self.concurrency,
+            "calls": calls,
+            "calls_per_second": self.completed / seconds,
+            "turns": len(latencies_ms),
+            "p50_ms": percentile(latencies_ms, 50),
+            "p95_ms": percentile(latencies_ms, 95),
+            "p99_ms": percentile(latencies_ms, 99),
+            "failed_share": failed / calls if calls else 0.0,
+            "outcomes": dict(sorted(self.outcomes.items())),
+            "shed": int(self.shed),
+            "rss_per_call_kb": max(0, self.peak_rss - baseline_rss) / max(1, self.peak_active) / 1024,
+        }
+
+class LoadTest:
+    def __init__(self, args, resources, callers, speech):
+        self.args = args
+        self.resources = resources
+        self.callers = callers
+        self.speech = speech
+        self.kinds = list(callers)
+        self.weights = [callers[kind][0] for kind in self.kinds]
+        self._ids = iter(range(10 ** 12))
+        self._ids_lock = threading.Lock()
+
+    def _call_id(self):
+        with self._ids_lock:
+            return f"load-{os.getpid()}-{next(self._ids)}"
+
+    def virtual_caller(self, index, step, stop_at, rng):
+        kind = rng.choices(self.kinds, self.weights)[0]
+        number = f"+1555{NUMBER_DIGITS[kind]}{index:06d}"
+        self.resources.caller_directory.categories[number] = CATEGORIES[kind]
+        time.sleep(rng.uniform(0, self.args.ramp_seconds))
+        while time.monotonic() < stop_at:
+            call_id = self._call_id()
+            call = ScriptedCall(call_id, number, rng.choice(self.callers[kind][1]), kind == 'owner',
+                                self.args.time_scale)
+            self.speech.calls[call_id] = call
+            step.call_started()
+            try:
+                IVRHandler(agi=call, resources=self.resources).handle_call()
+            except Exception:
+                call.outcome = 'error'
+            finally:
+                del self.speech.calls[call_id]
+                step.call_finished(call, time.monotonic() < stop_at)
+
+    def run_step(self, concurrency, baseline_rss):
+        step = Step(concurrency)
+        shed_before = shed_total()
+        started = time.monotonic()
+        stop_at = started + self.args.step_seconds
+        threads = [
+            threading.Thread(target=self.virtual_caller,
+                             args=(i, step, stop_at, random.Random(self.args.seed * 1000003 + i)), daemon=True)
+            for i in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            step.peak_rss = max(step.peak_rss, rss_bytes())
+            time.sleep(0.25)
+        step.shed = shed_total() - shed_before
+        return step.summary(self.args.step_seconds, baseline_rss)
+
+def build_resources(args, redis_client, tmp):
+    engine = create_engine(f"sqlite:///{tmp}/history.db")
+    Base.metadata.create_all(engine)
+    resources = SharedResources(redis_client=redis_client,
+                                database=Database(startup_mode='skip', engine=engine))
+    if args.slots is not None:
+        configure_admission(redis_client, slots=dict(
+            (name, int(limit)) for name, limit in (item.split('=') for item in args.slots.split(',') if item)))
+    resources.caller_directory = ScriptedDirectory()
+    llm_client = resources.llm_client
+    if not args.production_limits:
+        llm_client.response_cache = None
+        llm_client.caller_rate = llm_client.global_rate = Rate(10 ** 6, 1)
+    tts_cache._cache = tts_cache.TTSCache(cache_dir=os.path.join(tmp, 'tts'))
+    return resources
+
+def report(result, slo_ms, max_error_rate):
+    outcomes = ' '.join(f"{name}={count}" for name, count in result['outcomes'].items())
+    print(f"{result['concurrency']:>6} {result['calls_per_second']:>8.1f} {result['p50_ms']:>8.0f} "
+          f"{result['p95_ms']:>8.0f} {result['p99_ms']:>8.0f} {result['failed_share']:>7.1%} "
+          f"{result['rss_per_call_kb']:>9.0f} {result['shed']:>6}  {outcomes}"
+          + ("  <- over SLO" if not within_slo(result, slo_ms, max_error_rate) else ""))
+
+def within_slo(result, slo_ms, max_error_rate):
+    return result['p95_ms'] <= slo_ms and result['failed_share'] <= max_error_rate
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-call load test")
+    parser.add_argument('--concurrency', default='10,50,100,200,400',
+                        help="Comma-separated concurrency levels, run in order")
+    parser.add_argument('--step-seconds', type=float, default=30.0)
+    parser.add_argument('--ramp-seconds', type=float, default=2.0,
+                        help="Virtual callers start at random within this window")
+    parser.add_argument('--time-scale', type=float, default=0.1,
+                        help="Multiplier on speaking and prompt playback time")
+    parser.add_argument('--callers', default=CALLERS_FILE)
+    parser.add_argument('--redis-url', default=os.getenv('REDIS_URL', 'redis://localhost:6379/15'))
+    parser.add_argument('--llm-url', help="Use this chat-completions endpoint instead of the stub")
+    parser.add_argument('--llm-latency', default='0.6,1.5', help="Stub time to first token: median,p95 seconds")
+    parser.add_argument('--llm-token-delay', type=float, default=0.02)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--stt-latency', default='0.3,0.8')
+    parser.add_argument('--stt-error-rate', type=float, default=0.0)
+    parser.add_argument('--tts-latency', default='0.15,0.4')
+    parser.add_argument('--tts-error-rate', type=float, default=0.0)
+    parser.add_argument('--slo-ms', type=float, default=2500.0, help="p95 turn latency objective")
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help="Failed-call share objective")
+    parser.add_argument('--slots', help="Cluster-wide admission slots, e.g. llm=8,stt=16, in place of "
+                        "config/resilience.yml's (an empty value turns admission control off)")
+    parser.add_argument('--production-limits', action='store_true',
+                        help="Keep the LLM response cache and rate limits as configured")
+    parser.add_argument('--keep-going', action='store_true', help="Run every level even past saturation")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    redis_client = Redis.from_url(args.redis_url)
+    try:
+        redis_client.ping()
+    except Exception as e:
+        print(f"Redis not reachable at {args.redis_url}: {e}")
+        return 1
+    for pattern in ('breaker:*', 'admission:*'):
+        for key in redis_client.scan_iter(pattern):
+            redis_client.delete(key)
+
+    default_reply, callers, replies = load_callers(args.callers)
+    llm_process = None
+    if args.llm_url:
+        os.environ['LLM_API_ENDPOINT'] = args.llm_url
+    else:
+        # A separate process, so the stub's own CPU does not count against the worker.
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        llm_process = multiprocessing.Process(
+            target=serve_llm, daemon=True,
+            args=(default_reply, replies, Latency.parse(args.llm_latency, args.seed),
+                  args.llm_token_delay, args.llm_error_rate, sender))
+        llm_process.start()
+        os.environ['LLM_API_ENDPOINT'] = receiver.recv()
+
+    speech = FakeSpeech({}, Latency.parse(args.stt_latency, args.seed + 1),
+                        Latency.parse(args.tts_latency, args.seed + 2),
+                        args.stt_error_rate, args.tts_error_rate, seed=args.seed)
+    speech.install()
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            resources = build_resources(args, redis_client, tmp)
+            load = LoadTest(args, resources, callers, speech)
+            print(f"llm {args.llm_url or Latency.parse(args.llm_latency)}; stt {Latency.parse(args.stt_latency)}; "
+                  f"tts {Latency.parse(args.tts_latency)}; time scale {args.time_scale}")
+            print(f"{'calls':>6} {'calls/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                  f"{'failed':>7} {'RSS/call':>9} {'shed':>6}  outcomes")
+            baseline_rss = rss_bytes()
+            for concurrency in levels:
+                result = load.run_step(concurrency, baseline_rss)
+                results.append(result)
+                report(result, args.slo_ms, args.max_error_rate)
+                if not within_slo(result, args.slo_ms, args.max_error_rate) and not args.keep_going:
+                    break
+            resources.close()
+    finally:
+        if llm_process is not None:
+            llm_process.terminate()
+
+    saturated = next((r for r in results if not within_slo(r, args.slo_ms, args.max_error_rate)), None)
+    healthy = [r for r in results if within_slo(r, args.slo_ms, args.max_error_rate)
+               and (saturated is None or r['concurrency'] < saturated['concurrency'])]
+    capacity = healthy[-1] if healthy else None
+    if saturated:
+        print(f"saturation: {saturated['concurrency']} concurrent calls "
+              f"(p95 {saturated['p95_ms']:.0f}ms, {saturated['failed_share']:.1%} failed)")
+    else:
+        print(f"saturation: not reached at {levels[-1]} concurrent calls")
+    if capacity:
+        print(f"capacity:   {capacity['concurrency']} concurrent calls, "
+              f"{capacity['calls_per_second']:.1f} calls/s, p95 {capacity['p95_ms']:.0f}ms")
+    else:
+        print("capacity:   none of the levels met the objectives")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"levels": results, "saturation": saturated and saturated['concurrency'],
+                       "capacity": capacity and capacity['concurrency'],
+                       "slo_ms": args.slo_ms, "max_error_rate": args.max_error_rate}, f, indent=2)
+    return 0 if capacity else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
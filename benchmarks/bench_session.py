@@ -0,0 +1,170 @@
+"""
+Call session storage benchmark: the old whole-blob format versus
+SessionManager's per-field hash.
+
+  blob   - json.dumps + Fernet over the whole session, SETEX on every save,
+           GET + decrypt + json.loads on every read
+  hash   - msgpack + AES-GCM per field in a Redis hash; a state transition
+           rewrites only the fields that changed
+
+Without a server it times the encode/decode work and counts the bytes each
+format would store. With --redis-url it also times save/load round trips
+(the keys it creates are deleted afterwards).
+
+Run from the repository root:
+
+    python benchmarks/bench_session.py --calls 2000 --redis-url redis://localhost:6379/15
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [os.path.join(ROOT, 'src'), os.path.join(ROOT, 'src', 'ivr')]
+
+from cryptography.fernet import Fernet  # noqa: E402
+
+os.environ.setdefault('SESSION_KEY', Fernet.generate_key().decode())
+
+from session_manger import SessionManager  # noqa: E402
+
+def make_session(turns):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"caller utterance number {i} about my appointment"})
+        history.append({"role": "assistant", "content": f"assistant reply {i}, anything else I can help with?"})
+    return {
+        "current_state": "processing",
+        "context": {"caller_type": "unknown", "language": "en-US", "chat_history": history,
+                    "last_intent": "schedule_appointment", "confidence": 0.87},
+        "retry_count": 0,
+        "last_response": history[-1]["content"] if history else None,
+    }
+
+def transition(session, n):
+    """What a state change writes: new state, reset retries, new response."""
+    session = dict(session)
+    session["current_state"] = "initial" if n % 2 else "processing"
+    session["retry_count"] = 0
+    session["last_response"] = f"prompt {n}"
+    return session
+
+class BlobSessions:
+    """The whole-blob format SessionManager used before the hash layout."""
+    def __init__(self, redis_client, ttl_seconds=3600):
+        self.redis = redis_client
+        self.cipher = Fernet(os.environ['SESSION_KEY'])
+        self.ttl_seconds = ttl_seconds
+
+    def encode(self, data):
+        return self.cipher.encrypt(json.dumps(data).encode())
+
+    def decode(self, blob):
+        return json.loads(self.cipher.decrypt(blob).decode())
+
+    def save_session(self, call_id, data):
+        self.redis.setex(f"bench-blob:{call_id}", self.ttl_seconds, self.encode(data))
+
+    def get_session(self, call_id):
+        blob = self.redis.get(f"bench-blob:{call_id}")
+        return self.decode(blob) if blob else {}
+
+def per_op_us(fn, count):
+    start = time.perf_counter()
+    for i in range(count):
+        fn(i)
+    return (time.perf_counter() - start) / count * 1e6
+
+def latencies_ms(fn, count):
+    timings = []
+    for i in range(count):
+        start = time.perf_counter()
+        fn(i)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+def report(label, blob, hashed, unit):
+    print(f"{label:<34} blob {blob:10.1f} {unit}   hash {hashed:10.1f} {unit}")
+
+def main():
+    parser = argparse.ArgumentParser(description="session storage benchmark")
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--turns', type=int, default=6, help="chat turns kept in the session context")
+    parser.add_argument('--redis-url', help="e.g. redis://localhost:6379/15 to time round trips")
+    args = parser.parse_args()
+
+    session = make_session(args.turns)
+    blob = BlobSessions(None)
+    manager = SessionManager(None)
+
+    # Bytes stored per session, and per transition written.
+    blob_bytes = len(blob.encode(session))
+    fields = {name: manager._seal("call-0", name, manager._pack(value)) for name, value in session.items()}
+    hash_bytes = sum(len(name) + len(value) for name, value in fields.items()) + 2 + 16
+    changed = ("current_state", "retry_count", "last_response")
+    update_bytes = sum(len(name) + len(fields[name]) for name in changed) + 2 + 16
+    print(f"session with {args.turns} turns of context")
+    report("bytes stored", blob_bytes, hash_bytes, "B ")
+    report("bytes written per transition", blob_bytes, update_bytes, "B ")
+
+    # Codec CPU per operation, no network.
+    report("encode whole session", per_op_us(lambda i: blob.encode(session), args.calls),
+           per_op_us(lambda i: {n: manager._seal("call-0", n, manager._pack(v)) for n, v in session.items()},
+                     args.calls), "us")
+    report("encode one transition", per_op_us(lambda i: blob.encode(transition(session, i)), args.calls),
+           per_op_us(lambda i: {n: manager._seal("call-0", n, manager._pack(v))
+                                for n, v in transition(session, i).items() if n in changed}, args.calls), "us")
+    sealed_blob = blob.encode(session)
+    report("decode whole session", per_op_us(lambda i: blob.decode(sealed_blob), args.calls),
+           per_op_us(lambda i: {n: manager._unpack(manager._open("call-0", n, v)) for n, v in fields.items()},
+                     args.calls), "us")
+    report("decode current_state only", per_op_us(lambda i: blob.decode(sealed_blob)["current_state"], args.calls),
+           per_op_us(lambda i: manager._unpack(manager._open("call-0", "current_state", fields["current_state"])),
+                     args.calls), "us")
+
+    if not args.redis_url:
+        print("(pass --redis-url to time Redis round trips)")
+        return 0
+
+    from redis import Redis
+    redis_client = Redis.from_url(args.redis_url)
+    redis_client.ping()
+    blob = BlobSessions(redis_client)
+    manager = SessionManager(redis_client)
+    reader = SessionManager(redis_client)  # Another worker, with its own cache
+    picker = SessionManager(redis_client)  # Only ever reads single fields, so never caches
+    calls = [f"bench-{i}" for i in range(args.calls)]
+    try:
+        for call_id in calls:
+            blob.save_session(call_id, session)
+            manager.save_session(call_id, session)
+        memory = sum(redis_client.memory_usage(f"bench-blob:{c}") or 0 for c in calls[:100]) / min(100, len(calls))
+        memory_hash = sum(redis_client.memory_usage(manager.key(c)) or 0 for c in calls[:100]) / min(100, len(calls))
+        report("redis memory per session", memory, memory_hash, "B ")
+
+        def timed(label, blob_fn, hash_fn):
+            b, h = latencies_ms(blob_fn, args.calls), latencies_ms(hash_fn, args.calls)
+            print(f"{label:<34} blob p50 {b[0]:.3f} p99 {b[1]:.3f} ms   hash p50 {h[0]:.3f} p99 {h[1]:.3f} ms")
+
+        timed("save after transition",
+              lambda i: blob.save_session(calls[i], transition(session, i)),
+              lambda i: manager.save_session(calls[i], transition(session, i)))
+        timed("load, other worker (cold cache)",
+              lambda i: blob.get_session(calls[i]), lambda i: reader.get_session(calls[i]))
+        timed("load, unchanged (warm cache)",
+              lambda i: blob.get_session(calls[i]), lambda i: reader.get_session(calls[i]))
+        timed("load current_state, other worker",
+              lambda i: blob.get_session(calls[i])["current_state"],
+              lambda i: picker.get_session(calls[i], ["current_state"]))
+    finally:
+        for start in range(0, len(calls), 500):
+            chunk = calls[start:start + 500]
+            redis_client.delete(*[f"bench-blob:{c}" for c in chunk], *[manager.key(c) for c in chunk])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
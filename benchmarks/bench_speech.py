@@ -0,0 +1,213 @@
+"""
+Speech engine benchmark: turn latency and CPU per concurrent call for each
+STT and TTS backend (stt.providers, tts.providers).
+
+Each backend handles --turns requests at each concurrency level: STT
+engines transcribe one utterance, TTS engines render one reply sentence.
+Per level it reports p50/p95 latency, requests/s, CPU time per request and
+CPU per concurrent call (cores kept busy by one call doing nothing but
+this), counting this process, its engine pool processes and any engine
+subprocesses. Engines that are not set up here (no Azure key, no model,
+package or binary) are skipped with the reason. Run from the repository
+root:
+
+    python benchmarks/bench_speech.py --concurrency 1,4,16 --turns 64
+    python benchmarks/bench_speech.py --engines vosk,piper --utterance hello.wav
+
+The utterance is --utterance (a WAV recording), or --phrase rendered by the
+first local TTS engine available, or else a synthetic speech-like turn
+(which ASR will not transcribe, but which costs the same to process).
+Cloud latency includes the WAN round trip from this box; local engine pools
+are started, and their models loaded, before timing.
+"""
+import argparse
+import importlib.util
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [os.path.join(ROOT, 'src'), os.path.join(ROOT, 'src', 'ivr')]
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+import numpy as np  # noqa: E402
+
+from audio_util import STT_RATE, process_recording  # noqa: E402
+from bench_audio import synthetic_turn  # noqa: E402
+from stt import azure_stt, vosk_stt  # noqa: E402
+from tts import local_tts  # noqa: E402
+from tts.providers import synthesize_speech_to_file, voice_for  # noqa: E402
+from utils.cpu_pool import close_cpu_pools  # noqa: E402
+
+STT_BACKENDS = ('azure', 'vosk')
+TTS_BACKENDS = ('azure', 'piper', 'espeak')
+
+def cpu_seconds():
+    """CPU time of this process, its exited children and its live children (engine pools)."""
+    times = os.times()
+    total = times.user + times.system + times.children_user + times.children_system
+    ticks = os.sysconf('SC_CLK_TCK')
+    for stat in os.listdir('/proc'):
+        if not stat.isdigit():
+            continue
+        try:
+            with open(f'/proc/{stat}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == os.getpid():
+            total += (int(fields[11]) + int(fields[12])) / ticks
+    return total
+
+def unavailable(engine):
+    """Why engine cannot run here, or None; starts local pools so timing excludes model loading."""
+    try:
+        if engine == 'azure':
+            if not (os.getenv('SPEECH_KEY') and os.getenv('SPEECH_REGION')):
+                return "SPEECH_KEY and SPEECH_REGION not set"
+            if importlib.util.find_spec('azure.cognitiveservices.speech') is None:
+                return "azure-cognitiveservices-speech not installed"
+        elif engine == 'vosk':
+            vosk_stt.get_vosk_pool().start()
+        elif engine == 'piper':
+            local_tts.get_piper_pool(voice_for('piper').partition(':')[2]).start()
+        elif engine == 'espeak':
+            if shutil.which(local_tts.engine_settings('espeak')['executable']) is None:
+                return "espeak-ng not installed"
+    except Exception as e:
+        return str(e)
+    return None
+
+def load_utterance(args):
+    """16-bit PCM at STT_RATE: the given recording, a rendered phrase or a synthetic turn."""
+    if args.utterance:
+        with open(args.utterance, 'rb') as f:
+            return process_recording(f.read()).pcm, args.utterance
+    for engine in ('piper', 'espeak'):
+        if unavailable(engine) is None:
+            fd, path = tempfile.mkstemp(suffix='.wav')
+            os.close(fd)
+            try:
+                synthesize_speech_to_file(args.phrase, path, voice_for(engine))
+                with open(path, 'rb') as f:
+                    pcm = process_recording(f.read()).pcm
+                if pcm:
+                    return pcm, f"{args.phrase!r} spoken by {engine}"
+            except Exception as e:
+                print(f"Could not render the phrase with {engine}: {e}")
+            finally:
+                os.unlink(path)
+    return process_recording(synthetic_turn(np.random.default_rng(args.seed))).pcm, "synthetic turn"
+
+def stt_request(engine, pcm):
+    recognize = azure_stt.recognize_speech_from_pcm if engine == 'azure' else vosk_stt.recognize_speech_from_pcm
+    return lambda: recognize(pcm, STT_RATE)
+
+def tts_request(engine, text, out_dir):
+    voice = voice_for(engine)
+    counter = iter(range(10 ** 9))
+    lock = threading.Lock()
+
+    def request():
+        with lock:
+            path = os.path.join(out_dir, f"{engine}-{next(counter)}.wav")
+        try:
+            synthesize_speech_to_file(text, path, voice)
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+    return request
+
+def run_level(request, concurrency, turns):
+    latencies = []
+    errors = []
+
+    def timed(_):
+        start = time.perf_counter()
+        try:
+            request()
+        except Exception as e:
+            errors.append(e)
+            return
+        latencies.append(time.perf_counter() - start)
+
+    cpu_before = cpu_seconds()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, range(turns)))
+    wall = time.perf_counter() - started
+    cpu = cpu_seconds() - cpu_before
+    return {
+        'concurrency': concurrency,
+        'requests': turns,
+        'errors': len(errors),
+        'first_error': str(errors[0]) if errors else None,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else None,
+        'p95_ms': float(np.percentile(latencies, 95)) * 1000 if latencies else None,
+        'per_second': turns / wall,
+        'cpu_ms_per_request': cpu / turns * 1000,
+        'cores_per_call': cpu / wall / concurrency,
+    }
+
+def report(kind, engine, results):
+    print(f"\n{kind} {engine}")
+    print(f"{'concurrency':>11} {'p50 ms':>8} {'p95 ms':>8} {'req/s':>7} {'cpu ms/req':>10} "
+          f"{'cores/call':>10} {'errors':>6}")
+    for r in results:
+        p50 = f"{r['p50_ms']:.0f}" if r['p50_ms'] is not None else '-'
+        p95 = f"{r['p95_ms']:.0f}" if r['p95_ms'] is not None else '-'
+        print(f"{r['concurrency']:>11} {p50:>8} {p95:>8} {r['per_second']:>7.1f} "
+              f"{r['cpu_ms_per_request']:>10.1f} {r['cores_per_call']:>10.3f} {r['errors']:>6}")
+        if r['first_error']:
+            print(f"{'':>11} first error: {r['first_error']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Speech engine latency and CPU benchmark")
+    parser.add_argument('--engines', default=','.join(dict.fromkeys(STT_BACKENDS + TTS_BACKENDS)),
+                        help="Comma-separated engines to run (azure runs as both STT and TTS)")
+    parser.add_argument('--concurrency', default='1,4,16', help="Comma-separated concurrency levels")
+    parser.add_argument('--turns', type=int, default=64, help="Requests per engine and level")
+    parser.add_argument('--utterance', help="WAV recording of a caller utterance to transcribe")
+    parser.add_argument('--phrase', default="I'd like to speak to Dad please",
+                        help="Utterance to render with a local TTS engine when no --utterance is given")
+    parser.add_argument('--text', default="Thanks for calling. I'll let them know you rang.",
+                        help="Reply sentence for TTS engines")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    engines = args.engines.split(',')
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    print(f"{os.cpu_count()} CPU(s); concurrency {levels}; {args.turns} requests per level")
+    pcm = None
+    with tempfile.TemporaryDirectory() as out_dir:
+        for kind, backends in (('stt', STT_BACKENDS), ('tts', TTS_BACKENDS)):
+            for engine in backends:
+                if engine not in engines:
+                    continue
+                reason = unavailable(engine)
+                if reason:
+                    print(f"\n{kind} {engine}: skipped ({reason})")
+                    continue
+                if kind == 'stt':
+                    if pcm is None:
+                        pcm, source = load_utterance(args)
+                        print(f"utterance: {source}, {len(pcm) / 2 / STT_RATE:.2f}s")
+                    request = stt_request(engine, pcm)
+                else:
+                    request = tts_request(engine, args.text, out_dir)
+                try:
+                    request()  # Warm up connections
+                except Exception as e:
+                    print(f"\n{kind} {engine}: skipped ({e})")
+                    continue
+                report(kind, engine, [run_level(request, level, args.turns) for level in levels])
+    close_cpu_pools()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+Cold-start benchmark for the per-call AGI entry point.
+
+Each sample runs in a fresh interpreter (as Asterisk would spawn it) and
+reports how long importing agi_handler and constructing IVRHandler take, plus
+which heavy SDKs were loaded along the way. Run from the repository root:
+
+    python benchmarks/bench_startup.py --runs 20 --budget-ms 250
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+HEAVY_MODULES = ['azure.cognitiveservices.speech', 'alembic', 'sqlalchemy', 'prometheus_client', 'requests']
+
+SAMPLE = r'''
+import json, sys, time
+start = time.perf_counter()
+import agi_handler
+imported = time.perf_counter()
+
+class FakeAGI:
+    env = {"agi_uniqueid": "bench.1", "agi_callerid": "+15559990000"}
+
+agi_handler.IVRHandler(agi=FakeAGI())
+done = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "init_ms": (done - imported) * 1000,
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+''' % (HEAVY_MODULES,)
+
+def run_sample():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.join(ROOT, 'src'), os.path.join(ROOT, 'src', 'ivr')])
+    env.setdefault('LOG_LEVEL', 'ERROR')
+    out = subprocess.run([sys.executable, '-c', SAMPLE], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help="Exit non-zero if median import+init exceeds this")
+    args = parser.parse_args()
+
+    samples = [run_sample() for _ in range(args.runs)]
+    imports = [s['import_ms'] for s in samples]
+    inits = [s['init_ms'] for s in samples]
+    totals = [a + b for a, b in zip(imports, inits)]
+    print(f"runs:            {args.runs}")
+    print(f"import ms:       median {statistics.median(imports):.1f}  max {max(imports):.1f}")
+    print(f"IVRHandler ms:   median {statistics.median(inits):.1f}  max {max(inits):.1f}")
+    print(f"total ms:        median {statistics.median(totals):.1f}")
+    print(f"heavy modules:   {', '.join(samples[-1]['loaded']) or 'none'}")
+    if args.budget_ms is not None and statistics.median(totals) > args.budget_ms:
+        print(f"FAIL: over budget of {args.budget_ms:.0f} ms")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+One-time schema bootstrap, run at deploy time rather than on every call:
+
+    PYTHONPATH=src python -m db.bootstrap
+
+Creates missing tables, applies Alembic migrations up to head and records the
+resulting revision in a small cache file. Call handlers only compare that
+cached revision against models.SCHEMA_REVISION, so they never import Alembic
+or touch the migration machinery.
+"""
+import os
+import sys
+import tempfile
+from utils.logger import logger
+from .models import SCHEMA_REVISION
+
+SCHEMA_VERSION_FILE = os.getenv('DB_SCHEMA_VERSION_FILE', 'config/.schema_version')
+
+_schema_ok = None  # Per-process cache of the check below
+
+def read_schema_version(path=SCHEMA_VERSION_FILE):
+    """Return the revision recorded by the last bootstrap, or None."""
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def write_schema_version(revision, path=SCHEMA_VERSION_FILE):
+    """Atomically record the bootstrapped revision."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.schema_version.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(f"{revision}\n")
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+def check_schema_version(path=SCHEMA_VERSION_FILE):
+    """
+    Compare the cached revision with the one this code expects. The result is
+    cached for the life of the process; a mismatch is logged, not raised, so a
+    stale deploy degrades instead of dropping calls.
+    """
+    global _schema_ok
+    if _schema_ok is None:
+        recorded = read_schema_version(path)
+        _schema_ok = recorded == SCHEMA_REVISION
+        if recorded is None:
+            logger.error(f"Database schema not bootstrapped ({path} missing); run `python -m db.bootstrap`")
+        elif not _schema_ok:
+            logger.error(f"Database schema at {recorded}, code expects {SCHEMA_REVISION}; run `python -m db.bootstrap`")
+    return _schema_ok
+
+def bootstrap_schema(engine, path=SCHEMA_VERSION_FILE):
+    """Create tables, upgrade to the Alembic head and record the revision."""
+    from alembic import command
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+    from sqlalchemy import inspect
+    from .models import Base
+
+    fresh = not inspect(engine).has_table('chat_history')
+    Base.metadata.create_all(engine)
+    alembic_cfg = Config("alembic.ini")
+    alembic_cfg.set_main_option("script_location", "src/db/migrations")
+    try:
+        with engine.begin() as connection:
+            alembic_cfg.attributes['connection'] = connection
+            if fresh:
+                # create_all just built the current schema; only record it.
+                command.stamp(alembic_cfg, "head")
+            else:
+                command.upgrade(alembic_cfg, "head")
+    except Exception as e:
+        logger.error(f"Migration failed: {e}")
+        raise
+    head = ScriptDirectory.from_config(alembic_cfg).get_current_head() or "base"
+    if head != SCHEMA_REVISION:
+        logger.warning(f"Alembic head {head} differs from models.SCHEMA_REVISION {SCHEMA_REVISION}")
+    write_schema_version(head, path)
+    global _schema_ok
+    _schema_ok = head == SCHEMA_REVISION
+    logger.info(f"Database schema bootstrapped at revision {head}")
+    return head
+
+def main():
+    from .db import Database
+    db = Database(startup_mode='skip')
+    bootstrap_schema(db.engine)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
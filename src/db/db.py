@@ -1,58 +1,70 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, func, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import QueuePool
-from .models import Base, Caller, ChatHistory
-import yaml
+from .models import Caller, ChatHistory
+from .bootstrap import bootstrap_schema, check_schema_version
+from .history_writer import ChatHistoryWriter
+from datetime import datetime
 import os
 from utils.logger import logger
-from alembic.config import Config
-from alembic import command
+from utils.config_registry import ConfigError, get_config
+from utils.resilience import guarded
+from utils.tracing import stage
 
 class Database:
-    def __init__(self):
-        with open('config/db_config.yml') as f:
-            config = yaml.safe_load(f)['database']
-        
-        # Build the connection string
-        connection_string = (
-            f"{config['dialect']}+{config['driver']}://"
-            f"{config['username']}:{config['password']}@"
-            f"{config['host']}:{config['port']}/"
-            f"{config['database_name']}"
-        )
+    def __init__(self, startup_mode=None, engine=None):
+        """
+        startup_mode (or DB_STARTUP_MODE) controls schema handling:
+          check   - default; only compare the cached schema version with the code
+          migrate - run create_all and Alembic upgrades in-process (development)
+          skip    - do nothing (used by the bootstrap command itself)
+        engine replaces the one built from config/db_config.yml (benchmarks, tooling).
+        """
+        self.engine = engine
+        if engine is None:
+            config = get_config().database
+            if config is None:
+                raise ConfigError("config/db_config.yml: no database section")
+
+            # Build the connection string
+            connection_string = (
+                f"{config.dialect}+{config.driver}://"
+                f"{config.username}:{config.password}@"
+                f"{config.host}:{config.port}/"
+                f"{config.database_name}"
+            )
         
-        # Append SSL parameters if environment variables are set
-        ssl_params = []
-        if os.getenv("DB_SSL_CA"):
-            ssl_params.append(f"ssl_ca={os.getenv('DB_SSL_CA')}")
-        if os.getenv("DB_SSL_CERT"):
-            ssl_params.append(f"ssl_cert={os.getenv('DB_SSL_CERT')}")
-        if os.getenv("DB_SSL_KEY"):
-            ssl_params.append(f"ssl_key={os.getenv('DB_SSL_KEY')}")
-        if ssl_params:
-            connection_string += "?" + "&".join(ssl_params)
+            # Append SSL parameters if environment variables are set
+            ssl_params = []
+            if os.getenv("DB_SSL_CA"):
+                ssl_params.append(f"ssl_ca={os.getenv('DB_SSL_CA')}")
+            if os.getenv("DB_SSL_CERT"):
+                ssl_params.append(f"ssl_cert={os.getenv('DB_SSL_CERT')}")
+            if os.getenv("DB_SSL_KEY"):
+                ssl_params.append(f"ssl_key={os.getenv('DB_SSL_KEY')}")
+            if ssl_params:
+                connection_string += "?" + "&".join(ssl_params)
         
-        self.engine = create_engine(
-            connection_string,
-            poolclass=QueuePool,
-            pool_size=10,
-            max_overflow=2,
-            pool_timeout=30,
-            pool_recycle=3600  # Pre-ping can be added if desired (pool_pre_ping=True)
-        )
+            self.engine = create_engine(
+                connection_string,
+                poolclass=QueuePool,
+                pool_size=10,
+                max_overflow=2,
+                pool_timeout=30,
+                pool_recycle=3600  # Pre-ping can be added if desired (pool_pre_ping=True)
+            )
         self.Session = sessionmaker(bind=self.engine)
-        Base.metadata.create_all(self.engine)
-        self._run_migrations()
-    
-    def _run_migrations(self):
-        """Apply Alembic migrations programmatically."""
-        try:
-            alembic_cfg = Config("alembic.ini")
-            alembic_cfg.set_main_option("script_location", "src/db/migrations")
-            command.upgrade(alembic_cfg, "head")
-        except Exception as e:
-            logger.error(f"Migration failed: {e}")
-            raise
+        # Turns are written behind the call; CHAT_HISTORY_WRITE_BEHIND=0 restores inline commits.
+        self.history_writer = (
+            ChatHistoryWriter(self.insert_chat_history)
+            if os.getenv('CHAT_HISTORY_WRITE_BEHIND', '1') != '0' else None
+        )
+
+        self.startup_mode = startup_mode or os.getenv('DB_STARTUP_MODE', 'check')
+        if self.startup_mode == 'migrate':
+            bootstrap_schema(self.engine)
+        elif self.startup_mode == 'check':
+            check_schema_version()
 
     def get_session(self):
         return self.Session()
@@ -67,24 +79,52 @@ class Database:
         finally:
             session.close()
 
-    def add_chat_history(self, caller_cli, call_id, role, message, session_data=None):
+    def get_all_callers(self):
+        """Return (cli, name) for every row in callers, for the caller directory."""
         session = self.get_session()
         try:
-            new_entry = ChatHistory(
-                caller_cli=caller_cli,
-                call_id=call_id,
-                role=role,
-                message=message,
-                session_data=session_data
-            )
-            session.add(new_entry)
-            session.commit()
-        except Exception as e:
-            logger.error(f"Error adding chat history for caller {caller_cli}: {e}")
-            session.rollback()
+            return session.query(Caller.cli, Caller.name).all()
         finally:
             session.close()
 
+    def callers_fingerprint(self):
+        """Cheap change marker for the callers table: (row count, last update)."""
+        session = self.get_session()
+        try:
+            count, updated = session.query(func.count(Caller.id), func.max(Caller.updated_at)).one()
+            return count, updated.isoformat() if updated else None
+        finally:
+            session.close()
+
+    def add_chat_history(self, caller_cli, call_id, role, message, session_data=None):
+        row = {
+            "caller_cli": caller_cli,
+            "call_id": call_id,
+            "role": role,
+            "message": message,
+            "session_data": session_data,
+            # Stamped now, not at flush time, so turns keep their call order.
+            "timestamp": datetime.now().replace(microsecond=0)
+        }
+        if self.history_writer is not None:
+            self.history_writer.enqueue(row)
+            return
+        try:
+            self.insert_chat_history([row])
+        except Exception as e:
+            logger.error(f"Error adding chat history for caller {caller_cli}: {e}")
+
+    def insert_chat_history(self, rows):
+        """Insert chat_history rows with a single executemany INSERT."""
+        with self.engine.begin() as connection:
+            connection.execute(ChatHistory.__table__.insert(), rows)
+
+    def close(self):
+        """Flush queued chat history and release pooled connections."""
+        if self.history_writer is not None:
+            self.history_writer.close()
+        self.engine.dispose()
+
     def safe_execute_raw(self, query: str, params: dict = None):
         """Safe parameterized query execution."""
         session = self.get_session()
@@ -100,27 +140,40 @@ class Database:
         finally:
             session.close()
 
-    def get_conversation_history(self, caller_cli, limit=10):
+    def get_conversation_history(self, caller_cli, limit=10, budget=None):
         """
-        Retrieve conversation history for a given caller CLI.
-        Returns a list of dictionaries with role, message, and timestamp.
+        Retrieve the caller's latest `limit` turns, oldest first.
+        Returns a list of dictionaries with role, message, and timestamp, or
+        [] if the query fails, the DB breaker is open or budget's "db" slice
+        is spent.
         """
-        session = self.get_session()
         try:
-            entries = session.query(ChatHistory)\
-                .filter_by(caller_cli=caller_cli)\
-                .order_by(ChatHistory.timestamp.asc())\
-                .limit(limit).all()
-            history = []
-            for entry in entries:
-                history.append({
-                    "role": entry.role,
-                    "message": entry.message,
-                    "timestamp": entry.timestamp.isoformat() if entry.timestamp else None
-                })
-            return history
+            with guarded('db', budget) as timeout, stage('db'):
+                rows = self._latest_turns(caller_cli, limit, timeout)
         except Exception as e:
             logger.error(f"Error fetching conversation history for caller {caller_cli}: {e}")
             return []
+        return [
+            {
+                "role": role,
+                "message": message,
+                "timestamp": timestamp.isoformat() if timestamp else None
+            }
+            for role, message, timestamp in reversed(rows)
+        ]
+
+    def _latest_turns(self, caller_cli, limit, timeout=None):
+        session = self.get_session()
+        try:
+            # Newest-first walk of idx_caller_cli_timestamp, selecting only the
+            # columns the prompt needs instead of whole ORM rows.
+            query = session.query(ChatHistory.role, ChatHistory.message, ChatHistory.timestamp)\
+                .filter(ChatHistory.caller_cli == caller_cli)\
+                .order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc())\
+                .limit(limit)
+            if timeout is not None:
+                # MySQL aborts the statement itself once the slice is used up.
+                query = query.prefix_with(f"/*+ MAX_EXECUTION_TIME({int(timeout * 1000)}) */", dialect='mysql')
+            return query.all()
         finally:
             session.close()
@@ -0,0 +1,97 @@
+import json
+from datetime import datetime
+from prometheus_client import Counter
+from utils.logger import logger
+
+HISTORY_CACHE_LOOKUPS = Counter(
+    'history_cache_lookups_total',
+    'Recent conversation history reads by cache result',
+    ['result']
+)
+
+class HistoryCache:
+    """
+    Redis copy of each caller's latest chat_history turns.
+
+    recent() reads through: a miss loads the window from the database and
+    stores it as a Redis list. append() writes through: the turn goes to the
+    database and is pushed onto the cached list (only if one exists, so a
+    partial window is never created) which is then trimmed to the window.
+
+    database is a callable returning the Database, so cache hits never build
+    the SQLAlchemy engine.
+    """
+    prefix = "history"
+
+    def __init__(self, redis_client, database, window=10, ttl_seconds=86400):
+        self.redis = redis_client
+        self.database = database
+        self.window = window
+        self.ttl_seconds = ttl_seconds
+
+    def key(self, caller_cli):
+        return f"{self.prefix}:{caller_cli}"
+
+    def recent(self, caller_cli, limit=None, budget=None):
+        """
+        The caller's latest turns (at most the window), oldest first. A miss
+        queries the database within budget's "db" slice.
+        """
+        limit = min(limit or self.window, self.window)
+        key = self.key(caller_cli)
+        try:
+            cached = self.redis.lrange(key, -limit, -1)
+        except Exception as e:
+            logger.warning(f"History cache read failed for {caller_cli}: {e}")
+            cached = None
+        if cached:
+            try:
+                history = [json.loads(item) for item in cached]
+            except ValueError as e:
+                # A corrupt entry spoils the window: drop it and reload from the database.
+                logger.warning(f"Corrupt history cache entry for {caller_cli}: {e}")
+                self._drop(key)
+            else:
+                HISTORY_CACHE_LOOKUPS.labels(result='hit').inc()
+                return history
+        HISTORY_CACHE_LOOKUPS.labels(result='miss').inc()
+
+        history = self.database().get_conversation_history(caller_cli, self.window, budget=budget)
+        # An empty window can't be told apart from a failed query, so only
+        # non-empty windows are cached.
+        if history:
+            try:
+                pipe = self.redis.pipeline()
+                pipe.delete(key)
+                pipe.rpush(key, *[json.dumps(entry) for entry in history])
+                pipe.expire(key, self.ttl_seconds)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"History cache fill failed for {caller_cli}: {e}")
+        return history[-limit:]
+
+    def append(self, caller_cli, call_id, role, message, session_data=None):
+        """Record a turn in chat_history and in the cached window."""
+        self.database().add_chat_history(caller_cli, call_id, role, message, session_data)
+        entry = {
+            "role": role,
+            "message": message,
+            "timestamp": datetime.now().replace(microsecond=0).isoformat()
+        }
+        key = self.key(caller_cli)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.rpushx(key, json.dumps(entry))
+            pipe.ltrim(key, -self.window, -1)
+            pipe.expire(key, self.ttl_seconds)
+            pipe.execute()
+        except Exception as e:
+            # Drop the cached window rather than serve it without this turn.
+            logger.warning(f"History cache write failed for {caller_cli}: {e}")
+            self._drop(key)
+
+    def _drop(self, key):
+        try:
+            self.redis.delete(key)
+        except Exception:
+            pass
@@ -0,0 +1,137 @@
+import atexit
+import queue
+import threading
+import time
+from prometheus_client import Counter, Gauge, Histogram
+from utils.logger import logger
+
+CHAT_HISTORY_QUEUE_DEPTH = Gauge(
+    'chat_history_queue_depth',
+    'Chat history turns waiting to be written',
+    multiprocess_mode='livesum'
+)
+
+CHAT_HISTORY_BATCH_SIZE = Histogram(
+    'chat_history_batch_size',
+    'Rows per chat history bulk insert',
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+
+CHAT_HISTORY_FLUSH_SECONDS = Histogram(
+    'chat_history_flush_seconds',
+    'Time spent in one chat history bulk insert'
+)
+
+CHAT_HISTORY_ROWS = Counter(
+    'chat_history_rows_total',
+    'Chat history rows by how they were written',
+    ['result']
+)
+
+_STOP = object()
+
+class ChatHistoryWriter:
+    """
+    Write-behind queue for chat_history rows.
+
+    enqueue() returns immediately; a background thread collects rows into
+    batches of up to max_batch, or whatever arrived within flush_interval of
+    the first one, and hands each batch to write_batch (one multi-row
+    INSERT). When the queue is full, enqueue() blocks for up to put_timeout
+    and then writes the row itself, so a stalled database slows calls down
+    instead of losing turns or growing memory without bound. close() (also
+    run at interpreter exit) drains the queue.
+
+    Rows live only in this process until flushed: a crashed worker loses at
+    most flush_interval worth of turns.
+    """
+    def __init__(self, write_batch, max_batch=200, flush_interval=0.5, max_queue=10000,
+                 put_timeout=0.2, max_attempts=3):
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_attempts = max_attempts
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, row):
+        """Queue a row (a dict of chat_history columns) for the next flush."""
+        self._ensure_started()
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            logger.warning("Chat history queue full; writing turn synchronously")
+            self._flush([row], result='sync')
+            return
+        CHAT_HISTORY_QUEUE_DEPTH.set(self._queue.qsize())
+
+    def close(self, timeout=10):
+        """Flush everything queued so far and stop the flusher thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error(f"Chat history writer did not drain within {timeout}s")
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='chat-history-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            row = self._queue.get()
+            if row is _STOP:
+                break
+            batch = [row]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    row = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    break
+                batch.append(row)
+            CHAT_HISTORY_QUEUE_DEPTH.set(self._queue.qsize())
+            self._flush(batch)
+        # Rows queued behind the stop marker by late callers.
+        leftover = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is not _STOP:
+                leftover.append(row)
+        for start in range(0, len(leftover), self.max_batch):
+            self._flush(leftover[start:start + self.max_batch])
+        CHAT_HISTORY_QUEUE_DEPTH.set(0)
+
+    def _flush(self, batch, result='flushed'):
+        for attempt in range(1, self.max_attempts + 1):
+            start = time.perf_counter()
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                logger.error(f"Chat history flush of {len(batch)} rows failed (attempt {attempt}): {e}")
+                if attempt < self.max_attempts:
+                    time.sleep(0.2 * attempt)
+                continue
+            CHAT_HISTORY_FLUSH_SECONDS.observe(time.perf_counter() - start)
+            CHAT_HISTORY_BATCH_SIZE.observe(len(batch))
+            CHAT_HISTORY_ROWS.labels(result=result).inc(len(batch))
+            return True
+        CHAT_HISTORY_ROWS.labels(result='dropped').inc(len(batch))
+        return False
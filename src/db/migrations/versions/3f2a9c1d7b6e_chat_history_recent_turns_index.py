@@ -0,0 +1,28 @@
+"""chat_history: composite (caller_cli, timestamp, id) index for recent-turn reads
+
+Revision ID: 3f2a9c1d7b6e
+Revises: 
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7b6e'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The composite index serves every caller_cli lookup, so the single-column
+    # one only costs writes.
+    op.create_index('idx_caller_cli_timestamp', 'chat_history', ['caller_cli', 'timestamp', 'id'])
+    op.drop_index('idx_caller_cli', table_name='chat_history')
+
+
+def downgrade():
+    op.create_index('idx_caller_cli', 'chat_history', ['caller_cli'])
+    op.drop_index('idx_caller_cli_timestamp', table_name='chat_history')
@@ -4,6 +4,10 @@ from sqlalchemy.sql import func
 
 Base = declarative_base()
 
+# Alembic head this code expects. Bump alongside every new migration;
+# "base" means no migrations have been written yet.
+SCHEMA_REVISION = "3f2a9c1d7b6e"
+
 class Caller(Base):
     __tablename__ = 'callers'
     
@@ -26,6 +30,7 @@ class ChatHistory(Base):
     session_data = Column(JSON)
 
     __table_args__ = (
-        Index('idx_caller_cli', 'caller_cli'),
+        # Latest-N reads filter on caller_cli and walk timestamp backwards.
+        Index('idx_caller_cli_timestamp', 'caller_cli', 'timestamp', 'id'),
         Index('idx_call_id', 'call_id'),
     )
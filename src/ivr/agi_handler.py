@@ -1,46 +1,49 @@
 import time
 import re
-import json
-from json import JSONDecodeError
-import os
 from asterisk.agi import AGI
-from redis import Redis
+from utils.admission import Overloaded, shed_flow
 from utils.logger import logger
-from monitoring import start_monitoring
-from call_manager import CallManager
-from speech_handler import process_speech, synthesize_response
-from llm_handler import LLMHandler
-from utils.greetings import select_greeting
-from allowed_callers import load_allowed_callers
-from unknown_caller import handle_unknown_caller
-from db.db import Database
+from utils.resilience import CallBudget, DependencyUnavailable
+from utils.tracing import finish_trace, start_trace
+from monitoring import warn_if_metrics_unexported
+from playback import play_prompt
+import prompts
+from resources import get_shared_resources
+from call_setup import CallSetup
+from caller_directory import ALLOWED, BLOCKED, OWNER
+from call_state import get_call_flow
+from flow_engine import FlowEngine
+from speech_input import is_eagi
 
 class IVRHandler:
-    def __init__(self):
-        # Start Prometheus monitoring
-        start_monitoring()  # Exposes metrics on port 9100
-        
-        # Initialize core components
-        self.agi = AGI()
-        self.redis = Redis(
-            host='localhost',
-            port=6379,
-            db=0,
-            password=os.getenv('REDIS_PASSWORD', '')
-        )
-        self.db = Database()
-        self.call_manager = CallManager(self.redis)
-        self.llm_handler = LLMHandler()
-        
-        # Load allowed and owner caller lists from YAML configuration
-        self.allowed_callers = load_allowed_callers()  # e.g., from config/allowed_callers.yml
-        self.owner_callers = self._load_owner_callers()  # from config/owner_callers.yml
+    def __init__(self, agi=None, resources=None):
+        """
+        Handle a single call. In per-call script mode the AGI session comes from
+        stdin/stdout; the FastAGI server passes a socket-backed session and the
+        worker's shared resources instead.
+        """
+        self.agi = agi or AGI()
+        self.resources = resources = resources or get_shared_resources()
+        self.redis = resources.redis
+        self.llm_client = resources.llm_client
+        self.caller_directory = resources.caller_directory
         
         # Retrieve call context from AGI environment
         self.call_id = self.agi.env.get('agi_uniqueid', 'NO_CALL_ID')
+        # Every log line of this call carries the trace ID.
+        self.trace = start_trace(self.call_id)
         self.caller_id = self._validate_caller_id()
+        # Every dependency call in this call takes its timeout from here.
+        self.budget = CallBudget.from_config(call_id=self.call_id)
+        # Caller lookup, history and connection warm-up run while the greeting plays.
+        self.setup = CallSetup.start(resources, self.caller_id, self.budget,
+                                     streaming=is_eagi(self.agi)) if self.caller_id != 'INVALID' else None
         logger.info(f"Incoming call from {self.caller_id} (Call ID: {self.call_id})")
 
+    @property
+    def db(self):
+        return self.resources.db
+
     def _validate_caller_id(self):
         """Validate and sanitize caller ID."""
         raw_id = self.agi.env.get('agi_callerid', 'UNKNOWN')
@@ -49,67 +52,67 @@ class IVRHandler:
             return 'INVALID'
         return raw_id
 
-    def _load_owner_callers(self):
-        """Load owner/internal callers from configuration."""
-        try:
-            import yaml
-            with open('config/owner_callers.yml') as f:
-                data = yaml.safe_load(f)
-            return data.get('owner_callers', [])
-        except Exception as e:
-            logger.error(f"Error loading owner callers: {e}")
-            return []
-
     def handle_call(self):
         """Main call handling entry point."""
+        try:
+            self._handle_call()
+        finally:
+            if self.setup is not None:
+                self.setup.finish()
+            finish_trace()  # Logs the last turn's stage timings
+
+    def _handle_call(self):
         if self.caller_id == 'INVALID':
             self.agi.verbose("Invalid caller ID. Disconnecting.", 3)
             self.agi.hangup()
             return
 
-        # Route the call based on caller type:
-        if self.caller_id in self.owner_callers:
-            self._handle_owner_caller()
-        elif self.caller_id in self.allowed_callers:
-            # For allowed callers, use the allowed conversation flow.
-            from allowed_callers import handle_allowed_caller_conversation
-            handle_allowed_caller_conversation(self.agi, self.llm_handler, self.call_id, self.caller_id)
-        else:
-            # For all other callers, use the unknown caller flow.
-            from unknown_caller import handle_unknown_caller
-            handle_unknown_caller(self.agi, self.llm_handler, self.call_id)
-        # End of routing—if further processing is needed, add here.
+        try:
+            try:
+                self._route()
+            except Overloaded as e:
+                # No slot freed up in time, or the LLM rate limits refused the
+                # turn: the caller finishes on the canned path rather than
+                # waiting on every turn that follows.
+                flow = shed_flow(self.trace.call_context, force=True)
+                if flow is None:
+                    raise
+                logger.warning(f"Shedding call {self.call_id} to flow {flow}: {e}")
+                self._run_flow(flow)
+        except DependencyUnavailable as e:
+            # A dead dependency ends the call with a canned apology (pre-rendered,
+            # so it plays even when TTS is down) instead of stalling every turn.
+            logger.warning(f"Falling back to canned reply (Call ID: {self.call_id}): {e}")
+            play_prompt(self.agi, prompts.SERVICE_UNAVAILABLE)
+            self.agi.hangup()
 
-    def _handle_owner_caller(self):
-        """Process internal/owner calls with persistent conversation history."""
-        greeting = select_greeting('internal')
-        self.agi.verbose(greeting, 3)
-        
-        # Load previous conversation history from the database.
-        history = self.db.get_conversation_history(self.caller_id)
-        if history:
-            self.agi.verbose("Loaded previous conversation history.", 3)
+    def _route(self):
+        """Route the call based on caller type, then run that caller type's flow."""
+        caller = self.setup.result('caller', lambda: self.caller_directory.lookup(self.caller_id))
+        if caller.category == BLOCKED:
+            logger.info(f"Blocked caller {caller.number} (Call ID: {self.call_id})")
+            self.agi.hangup()
+            return
+        if caller.category == OWNER:
+            # Owner calls carry persistent conversation history.
+            call_context = 'internal'
+        elif caller.category == ALLOWED:
+            call_context = 'caller_allowed'
         else:
-            history = []
-        
-        # Build the prompt with historical context.
-        prompt = {
-            "caller_id": self.caller_id,
-            "chat_history": history,
-            "current_input": "",
-            "call_context": "internal"
-        }
-        
-        response = self.llm_handler.get_response(prompt)
-        try:
-            structured = json.loads(response.get('text', '{}'))
-            if 'message' in structured:
-                self.agi.verbose(structured['message'], 3)
-            else:
-                self.agi.verbose("Internal call processed.", 3)
-        except JSONDecodeError:
-            self.agi.verbose("Internal call processed.", 3)
+            call_context = 'caller_unknown'
+        self.trace.set_context(call_context)
+        # Under overload new calls take their context's shed flow (owners have
+        # none), so the calls already in progress keep their turn latency.
+        self._run_flow(shed_flow(call_context) or call_context)
+
+    def _run_flow(self, name):
+        FlowEngine(self.agi, get_call_flow(name), self.llm_client, self.call_id, budget=self.budget,
+                   resources=self.resources, setup=self.setup, caller_id=self.caller_id).run()
 
 if __name__ == '__main__':
+    # Per-call script mode; prefer fastagi_server.py for production traffic.
+    # Metrics reach Prometheus through PROMETHEUS_MULTIPROC_DIR and the exporter
+    # in monitoring.py; a per-call process never serves them itself.
+    warn_if_metrics_unexported()
     handler = IVRHandler()
     handler.handle_call()
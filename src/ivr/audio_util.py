@@ -1,9 +1,244 @@
+"""
+Caller audio between Asterisk's recording and the STT request.
+
+Asterisk writes each turn's recording to RECORDING_DIR (tmpfs when the host
+has /dev/shm). load_utterance() reads it into memory and removes it, then
+decodes it, trims the leading and trailing silence with an energy and
+zero-crossing VAD and converts it to 16 kHz PCM for the recognizer - all
+as whole-array NumPy operations, with no per-sample Python loops:
+
+    utterance = load_utterance(path)
+    if utterance is not None and utterance.has_speech:
+        text = recognize(utterance.pcm, utterance.sample_rate, call_context)
+
+A turn with no speech at all never reaches STT. The stt_audio_seconds and
+stt_audio_bytes_total metrics compare what was recorded with what was sent.
+"""
+import os
+import struct
+import tempfile
+from dataclasses import dataclass
+import numpy as np
+from prometheus_client import Counter, Histogram
+from utils.logger import logger
+
+def _default_recording_dir():
+    # Asterisk and the IVR share this directory; tmpfs keeps recordings off disk.
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+RECORDING_DIR = os.getenv('IVR_RECORDING_DIR') or _default_recording_dir()
+TELEPHONY_RATE = 8000
+# The recognizer's input rate; 8000 sends the telephony audio as is.
+STT_RATE = int(os.getenv('STT_SAMPLE_RATE', 16000))
+
+STT_AUDIO_SECONDS = Histogram(
+    'stt_audio_seconds',
+    'Seconds of caller audio per turn, as recorded and as sent to STT',
+    ['stage'],
+    buckets=(0.25, 0.5, 1, 1.5, 2, 3, 4, 5, 7.5, 10)
+)
+
+STT_AUDIO_BYTES = Counter(
+    'stt_audio_bytes_total',
+    'Bytes of caller audio, as recorded and as sent to STT',
+    ['stage']
+)
+
+STT_SILENT_TURNS = Counter(
+    'stt_silent_turns_total',
+    'Turns in which the VAD found no speech, so STT was not called'
+)
+
+@dataclass(frozen=True)
+class Utterance:
+    """Trimmed caller audio: 16-bit little-endian mono PCM at sample_rate."""
+    pcm: bytes
+    sample_rate: int
+    recorded_bytes: int
+    recorded_seconds: float
+
+    @property
+    def seconds(self):
+        return len(self.pcm) / 2 / self.sample_rate
+
+    @property
+    def has_speech(self):
+        return bool(self.pcm)
+
+def recording_path(call_id, tag, fmt='wav'):
+    """Where Asterisk records a turn of this call (RECORD FILE takes it without the extension)."""
+    return os.path.join(RECORDING_DIR, f"{call_id}_{tag}.{fmt}")
+
+def discard_recording(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
 def record_audio(agi, output_file: str, max_duration: int = 5000) -> str:
     """
-    Record audio from the caller using the AGI command.
-    Adjust parameters (e.g., silence, timeout) as needed.
+    Record audio from the caller using the AGI command, ending after 3 s of
+    silence or max_duration ms. output_file is the path without its extension;
+    the recording is output_file + ".wav".
     """
     agi.verbose(f"Recording audio to {output_file}...", 3)
-    # The parameters below may be adjusted based on your environment.
-    agi.record_file(output_file, "wav", max_duration, "#", 3)
-    return output_file
+    agi.record_file(output_file, "wav", escape_digits="#", timeout=max_duration, silence=3)
+    return output_file + ".wav"
+
+# --- G.711 mu-law ---------------------------------------------------------
+
+_ULAW_BIAS = 0x84
+
+def _ulaw_table():
+    code = ~np.arange(256, dtype=np.uint8)
+    exponent = (code >> 4) & 0x07
+    mantissa = (code & 0x0F).astype(np.int32)
+    magnitude = (((mantissa << 3) + _ULAW_BIAS) << exponent) - _ULAW_BIAS
+    return np.where(code & 0x80, -magnitude, magnitude).astype(np.int16)
+
+_ULAW_TO_PCM = _ulaw_table()
+
+def ulaw_decode(data):
+    """mu-law bytes to int16 samples."""
+    return _ULAW_TO_PCM[np.frombuffer(data, dtype=np.uint8)]
+
+def ulaw_encode(samples):
+    """int16 samples to mu-law bytes (bit-exact with the reference G.711 encoder)."""
+    samples = np.asarray(samples, dtype=np.int32) >> 2  # 14-bit
+    mask = np.where(samples < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(samples), 8159) + (_ULAW_BIAS >> 2)
+    segment = np.maximum(np.floor(np.log2(magnitude)).astype(np.int32) - 5, 0)
+    code = np.where(segment > 7, 0x7F, (np.minimum(segment, 7) << 4) | ((magnitude >> (segment + 1)) & 0x0F))
+    return (code ^ mask).astype(np.uint8).tobytes()
+
+# --- Decoding -------------------------------------------------------------
+
+_WAVE_PCM = 1
+_WAVE_ULAW = 7
+
+def parse_wav(data):
+    """(int16 samples, sample rate) of a mono PCM16 or mu-law WAV file."""
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise ValueError("not a WAV file")
+    offset, fmt = 12, None
+    while offset + 8 <= len(data):
+        chunk, size = struct.unpack_from('<4sI', data, offset)
+        body = offset + 8
+        if chunk == b'fmt ':
+            fmt = struct.unpack_from('<HHIIHH', data, body)
+        elif chunk == b'data':
+            if fmt is None:
+                raise ValueError("WAV data before its fmt chunk")
+            tag, channels, rate, _, _, bits = fmt
+            # A recording cut short by a hangup may not have its sizes filled in.
+            payload = data[body:body + size] if size else data[body:]
+            if tag == _WAVE_PCM and bits == 16:
+                samples = np.frombuffer(payload[:len(payload) // 2 * 2], dtype='<i2')
+            elif tag == _WAVE_ULAW:
+                samples = ulaw_decode(payload)
+            else:
+                raise ValueError(f"unsupported WAV encoding {tag}/{bits}-bit")
+            if channels > 1:
+                samples = samples[:len(samples) // channels * channels].reshape(-1, channels)[:, 0]
+            return samples, rate
+        offset = body + size + (size & 1)
+    raise ValueError("WAV file has no data chunk")
+
+def decode_recording(data, fmt='wav'):
+    """(int16 samples, sample rate) of an Asterisk recording in wav, sln (8 kHz PCM16) or ulaw."""
+    if fmt == 'wav':
+        return parse_wav(data)
+    if fmt == 'sln':
+        return np.frombuffer(data[:len(data) // 2 * 2], dtype='<i2'), TELEPHONY_RATE
+    if fmt in ('ulaw', 'pcm'):
+        return ulaw_decode(data), TELEPHONY_RATE
+    raise ValueError(f"unsupported recording format {fmt!r}")
+
+# --- Processing -----------------------------------------------------------
+
+def speech_bounds(samples, rate, frame_ms=20, margin_db=10.0, floor_db=-50.0, zcr_threshold=0.25,
+                  min_speech_ms=100, pad_ms=200):
+    """
+    (start, end) sample indices of the speech in samples, padded by pad_ms,
+    or None if there is none. A 20 ms frame is speech when its energy is
+    margin_db above the recording's noise floor (its 10th-percentile frame),
+    or - for unvoiced sounds such as "s" and "f" - half that with a high
+    zero-crossing rate. Nothing quieter than floor_db dBFS counts.
+    """
+    frame = rate * frame_ms // 1000
+    count = len(samples) // frame
+    if count == 0:
+        return None
+    frames = samples[:count * frame].reshape(count, frame).astype(np.float32) / 32768.0
+    energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame
+    noise_db = np.percentile(energy_db, 10)
+    voiced = energy_db > max(noise_db + margin_db, floor_db)
+    unvoiced = (energy_db > max(noise_db + margin_db / 2, floor_db)) & (zcr > zcr_threshold)
+    speech = np.flatnonzero(voiced | unvoiced)
+    if len(speech) * frame_ms < min_speech_ms:
+        return None
+    pad = pad_ms // frame_ms
+    return max(0, speech[0] - pad) * frame, min(len(samples), (speech[-1] + 1 + pad) * frame)
+
+def _lowpass(cutoff, half_width, gain):
+    taps = np.arange(-half_width, half_width + 1)
+    return (2 * cutoff * np.sinc(2 * cutoff * taps) * np.hamming(len(taps)) * gain).astype(np.float32)
+
+def resample(samples, src_rate, dst_rate):
+    """
+    Convert int16 samples between rates. Small integer ratios such as 8 to
+    16 kHz use a windowed-sinc FIR filter; others fall back to linear
+    interpolation.
+    """
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples
+    divisor = np.gcd(src_rate, dst_rate)
+    up, down = dst_rate // divisor, src_rate // divisor
+    if up * down > 64:
+        positions = np.arange(int(len(samples) * dst_rate / src_rate)) * (src_rate / dst_rate)
+        out = np.interp(positions, np.arange(len(samples)), samples)
+    else:
+        stuffed = np.zeros(len(samples) * up, dtype=np.float32)
+        stuffed[::up] = samples
+        factor = max(up, down)
+        filtered = np.convolve(stuffed, _lowpass(0.5 / factor, 8 * factor, up), mode='same')
+        out = filtered[::down]
+    return np.clip(np.rint(out), -32768, 32767).astype(np.int16)
+
+def process_recording(data, fmt='wav', target_rate=STT_RATE):
+    """Decode, trim and resample one recording held in memory; returns an Utterance."""
+    samples, rate = decode_recording(data, fmt)
+    bounds = speech_bounds(samples, rate)
+    speech = samples[bounds[0]:bounds[1]] if bounds else samples[:0]
+    pcm = resample(speech, rate, target_rate).astype('<i2').tobytes()
+    return Utterance(pcm, target_rate, len(data), len(samples) / rate if rate else 0.0)
+
+def load_utterance(path, fmt='wav', target_rate=STT_RATE):
+    """
+    Read a finished recording into memory, delete it and return its
+    Utterance (None if Asterisk wrote nothing). The file is removed however
+    processing goes.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    finally:
+        discard_recording(path)
+    utterance = process_recording(data, fmt, target_rate)
+    STT_AUDIO_SECONDS.labels(stage='recorded').observe(utterance.recorded_seconds)
+    STT_AUDIO_BYTES.labels(stage='recorded').inc(utterance.recorded_bytes)
+    if utterance.has_speech:
+        STT_AUDIO_SECONDS.labels(stage='uploaded').observe(utterance.seconds)
+        STT_AUDIO_BYTES.labels(stage='uploaded').inc(len(utterance.pcm))
+    else:
+        STT_SILENT_TURNS.inc()
+    logger.debug(f"Recording {os.path.basename(path)}: {utterance.recorded_seconds:.2f}s/"
+                 f"{utterance.recorded_bytes} bytes recorded, {utterance.seconds:.2f}s/"
+                 f"{len(utterance.pcm)} bytes to STT")
+    return utterance
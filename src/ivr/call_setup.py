@@ -0,0 +1,226 @@
+"""
+Call-setup prefetch: the work a call needs before its first reply, started as
+soon as the channel's agi_uniqueid and agi_callerid are known and run on a
+thread pool while the greeting plays.
+
+    setup = CallSetup.start(resources, caller_id, budget, streaming=is_eagi(agi))
+    caller = setup.result('caller', lambda: directory.lookup(caller_id))
+    ...
+    setup.finish()
+
+Tasks:
+
+  caller   the caller's directory record
+  history  an owner's recent conversation window (Redis, or the database)
+  llm      a keep-alive connection to the LLM endpoint
+  speech   a connected recognizer and synthesizer for the call's engines
+           (a streaming recognizer for EAGI calls that stream to Azure)
+  prompts  the prompts the call's context most likely plays next, rendered
+           into the TTS cache
+
+history and prompts start once the caller is known. A handler takes a
+result with result(name, fallback), which waits for the task and runs
+fallback itself if the task failed or never started, so prefetch never
+changes what a call does, only when the work happens. The warm-up tasks
+are not waited on. call_setup_hidden_seconds_total counts task time that
+ran concurrently with the call rather than in its path; the rest shows in
+call_setup_wait_seconds.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from prometheus_client import Counter, Histogram
+from utils.logger import logger
+from utils.tracing import traced
+from utils.config_registry import END_OF_FLOW, FLOW_ACTION_NAMES, FLOW_OUTCOMES
+from caller_directory import ALLOWED, BLOCKED, OWNER
+from call_state import get_call_flow
+
+CALL_SETUP_TASK_SECONDS = Histogram(
+    'call_setup_task_seconds',
+    'Time each call-setup prefetch task took',
+    ['task'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4)
+)
+
+CALL_SETUP_WAIT_SECONDS = Histogram(
+    'call_setup_wait_seconds',
+    'Time a call blocked on a call-setup prefetch result',
+    ['task'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4)
+)
+
+CALL_SETUP_HIDDEN_SECONDS = Counter(
+    'call_setup_hidden_seconds_total',
+    'Call-setup time that ran concurrently with greeting playback instead of on the call path',
+    ['task']
+)
+
+CALL_SETUP_FAILURES = Counter(
+    'call_setup_failures_total',
+    'Call-setup prefetch tasks that failed; the call did the work itself',
+    ['task']
+)
+
+CALL_CONTEXTS = {OWNER: 'internal', ALLOWED: 'caller_allowed'}
+
+_CLASSIFY = FLOW_ACTION_NAMES.index('classify')
+_INTENT_OUTCOMES = (FLOW_OUTCOMES.index('transfer'), FLOW_OUTCOMES.index('hangup'))
+# Flow name -> (compiled flow, its likely prompts); recomputed when the flows reload.
+_likely_prompts = {}
+
+WORKERS = int(os.getenv('CALL_SETUP_WORKERS', 32))
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+
+def get_executor():
+    """The process-wide prefetch thread pool; a forked worker gets its own."""
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='call-setup')
+            _executor_pid = os.getpid()
+        return _executor
+
+class _Task:
+    def __init__(self, future, started):
+        self.future = future
+        self.started = started
+        self.finished = None
+        self.consumed = False
+
+class CallSetup:
+    def __init__(self, executor=None, clock=time.monotonic):
+        self._executor = executor or get_executor()
+        self._clock = clock
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def start(cls, resources, caller_id, budget=None, executor=None, streaming=False):
+        """
+        Start prefetching everything a call from caller_id is likely to need;
+        streaming says whether its turns can be streamed (EAGI).
+        """
+        setup = cls(executor)
+        setup.submit('caller', setup._resolve_caller, resources, caller_id, budget, streaming)
+        setup.submit('llm', resources.llm_client.warm)
+        return setup
+
+    def submit(self, name, fn, *args):
+        def run():
+            try:
+                return fn(*args)
+            finally:
+                task.finished = self._clock()
+                CALL_SETUP_TASK_SECONDS.labels(task=name).observe(task.finished - task.started)
+
+        with self._lock:
+            task = self._tasks[name] = _Task(None, self._clock())
+            task.future = self._executor.submit(traced(run))
+        return task.future
+
+    def result(self, name, fallback=None, timeout=None):
+        """
+        The task's result, waiting up to timeout for it. If the task failed,
+        timed out or was never started, fallback() runs in its place.
+        """
+        with self._lock:
+            task = self._tasks.get(name)
+        if task is None:
+            return fallback() if fallback is not None else None
+        task.consumed = True
+        waiting = self._clock()
+        try:
+            value = task.future.result(timeout)
+        except Exception as e:
+            CALL_SETUP_FAILURES.labels(task=name).inc()
+            logger.warning(f"Call setup task {name} failed, doing it on the call path: {e}")
+            return fallback() if fallback is not None else None
+        finally:
+            waited = self._clock() - waiting
+            CALL_SETUP_WAIT_SECONDS.labels(task=name).observe(waited)
+        if task.finished is not None:
+            CALL_SETUP_HIDDEN_SECONDS.labels(task=name).inc(max(0.0, task.finished - task.started - waited))
+        return value
+
+    def finish(self):
+        """Account for the warm-up tasks nobody waited on, and drop those not yet started."""
+        with self._lock:
+            tasks = dict(self._tasks)
+        for name, task in tasks.items():
+            if task.consumed:
+                continue
+            if task.future.cancel():
+                continue
+            if task.finished is not None and task.future.exception() is None:
+                CALL_SETUP_HIDDEN_SECONDS.labels(task=name).inc(task.finished - task.started)
+            elif task.finished is not None:
+                CALL_SETUP_FAILURES.labels(task=name).inc()
+
+    def _resolve_caller(self, resources, caller_id, budget, streaming=False):
+        caller = resources.caller_directory.lookup(caller_id)
+        if caller.category == BLOCKED:
+            return caller
+        call_context = CALL_CONTEXTS.get(caller.category, 'caller_unknown')
+        if caller.category == OWNER:
+            self.submit('history', resources.history.recent, caller_id, None, budget)
+        self.submit('speech', warm_speech, call_context, streaming)
+        texts = likely_prompts(call_context)
+        if texts:
+            self.submit('prompts', render_prompts, texts, call_context)
+        return caller
+
+def warm_speech(call_context, streaming=False):
+    """
+    Have a connected Azure recognizer and synthesizer ready if call_context's
+    engines use them: a streaming recognizer if its turns are streamed.
+    """
+    if not (os.getenv('SPEECH_KEY') and os.getenv('SPEECH_REGION')):
+        return 0
+    from audio_util import STT_RATE
+    from stt.azure_stt import get_recognizer_pool
+    from stt.providers import engines_for, streaming_engine
+    from stt.streaming import get_streaming_recognizer_pool
+    from tts.azure_tts import DEFAULT_FORMAT, get_synthesizer_pool
+    from tts.providers import engine_of, voices_for
+    built = 0
+    if streaming and streaming_engine(call_context) == 'azure':
+        built += get_streaming_recognizer_pool().prefill()
+    elif 'azure' in engines_for(call_context, 0):
+        built += get_recognizer_pool(STT_RATE).prefill()
+    for voice in voices_for(call_context):
+        if engine_of(voice) == 'azure':
+            built += get_synthesizer_pool(voice, DEFAULT_FORMAT).prefill()
+    return built
+
+def likely_prompts(call_context):
+    """
+    The prompts call_context's flow (config/call_flows.yml) most often plays
+    after its opening one: those of the states its start state leads to, and
+    of the states a classified transfer or hang-up goes to.
+    """
+    flow = get_call_flow(call_context)
+    cached = _likely_prompts.get(call_context)
+    if cached is not None and cached[0] is flow:
+        return cached[1]
+    targets = list(flow.transitions[flow.start])
+    for i, action in enumerate(flow.actions):
+        if action == _CLASSIFY:
+            targets.extend(flow.transitions[i][outcome] for outcome in _INTENT_OUTCOMES)
+    texts = tuple(dict.fromkeys(flow.prompts[i] for i in targets if i != END_OF_FLOW and flow.prompts[i]))
+    _likely_prompts[call_context] = (flow, texts)
+    return texts
+
+def render_prompts(texts, call_context):
+    """Put texts in the TTS cache in call_context's voice, if they are not there yet."""
+    from tts.cache import get_tts_cache
+    from tts.providers import voices_for, with_fallback
+    cache = get_tts_cache()
+    voices = voices_for(call_context)
+    for text in texts:
+        with_fallback(lambda voice: cache.synthesize(text, voice=voice), voices)
+    return len(texts)
@@ -1,53 +1,121 @@
-import yaml
 from prometheus_client import Counter
+from utils.config_registry import END_OF_FLOW, get_config, load_yaml, parse_call_flow
+from utils.logger import logger
 
 STATE_TRANSITIONS = Counter(
     'state_transitions_total',
     'State machine transitions',
-    ['from_state', 'to_state']
+    ['flow', 'from_state', 'to_state']
 )
+# Labelled counters by (flow, from_state, to_state), so a transition skips labels().
+_TRANSITION_COUNTERS = {}
 
-class CallFlow:
-    def __init__(self, config_path='config/call_flows.yml'):
-        with open(config_path) as f:
-            self.states = yaml.safe_load(f)['states']
+def get_call_flow(name, config_path=None):
+    """
+    The compiled flow for a call context from the shared config snapshot,
+    or from config_path parsed on its own.
+    """
+    if config_path is None:
+        flows = get_config().call_flow
+    else:
+        flows = parse_call_flow(load_yaml(config_path)[0], config_path)
+    try:
+        return flows[name]
+    except KeyError:
+        raise ValueError(f"No call flow {name!r} in config/call_flows.yml") from None
 
-    def get_valid_transitions(self, state):
-        return self.states.get(state, {}).get('transitions', [])
+class CallState:
+    """
+    Where one call is in its flow. Held for the length of the call, so it
+    keeps to fixed slots: state indexes into the flow's tables and visits
+    counts entries per state. checkpoint() writes to the session store only
+    the fields that changed since the last checkpoint; the engine calls it
+    at each transition.
+    """
+    __slots__ = ('flow', 'call_id', 'state', 'previous_state', 'visits', 'history', 'intent',
+                 '_sessions', '_saved_history')
 
-    def validate_transition(self, from_state, to_state):
-        valid_transitions = self.get_valid_transitions(from_state)
-        if to_state not in valid_transitions:
-            raise ValueError(f"Invalid transition {from_state}→{to_state}")
+    def __init__(self, flow, call_id=None, sessions=None, history=None):
+        self.flow = flow
+        self.call_id = call_id
+        self.state = flow.start
+        self.previous_state = END_OF_FLOW
+        self.visits = bytearray(len(flow.states))
+        self.history = history if history is not None else []
+        self.intent = None
+        self._sessions = sessions
+        self._saved_history = 0
 
-class CallState:
-    def __init__(self, call_flow: CallFlow):
-        self.call_flow = call_flow
-        self.current_state = "initial"
-        self.context = {}
-        self.last_response = None
-        self.retry_count = 0
-        self.previous_state = None
+    @property
+    def current_state(self):
+        return self.flow.states[self.state]
+
+    def enter(self):
+        """
+        Count a visit to the current state, or move to its exhausted state
+        if it has had max_visits. Returns the state to run.
+        """
+        while self.flow.max_visits[self.state] and self.visits[self.state] >= self.flow.max_visits[self.state]:
+            self._move(self.flow.exhausted[self.state])
+        self.visits[self.state] = min(self.visits[self.state] + 1, 255)
+        return self.state
+
+    def advance(self, outcome):
+        """Follow outcome (an index into FLOW_OUTCOMES); False once the flow has ended."""
+        target = self.flow.transitions[self.state][outcome]
+        if target == END_OF_FLOW:
+            return False
+        self._move(target)
+        return True
 
     def transition(self, new_state):
-        self.call_flow.validate_transition(self.current_state, new_state)
-        self.previous_state = self.current_state
-        STATE_TRANSITIONS.labels(from_state=self.current_state, to_state=new_state).inc()
-        self.current_state = new_state
-        self.retry_count = 0
+        """Move to the named state; it must be one of the current state's targets."""
+        if new_state not in self.flow.targets(self.current_state):
+            raise ValueError(f"Invalid transition {self.current_state}→{new_state}")
+        self._move(self.flow.index[new_state])
+
+    def _move(self, target):
+        key = (self.flow.name, self.current_state, self.flow.states[target])
+        counter = _TRANSITION_COUNTERS.get(key)
+        if counter is None:
+            counter = _TRANSITION_COUNTERS[key] = STATE_TRANSITIONS.labels(*key)
+        counter.inc()
+        self.previous_state, self.state = self.state, target
+        self.checkpoint()
+
+    def checkpoint(self):
+        if self._sessions is None or self.call_id is None:
+            return
+        changes = {"flow": self.flow.name, "state": self.current_state, "visits": bytes(self.visits)}
+        if len(self.history) != self._saved_history:
+            changes["history"] = self.history
+        if self.intent is not None:
+            changes["intent"] = self.intent
+        try:
+            self._sessions.update_session(self.call_id, changes)
+        except Exception as e:
+            logger.warning(f"Could not checkpoint call {self.call_id} at {self.current_state}: {e}")
+            return
+        self._saved_history = len(self.history)
 
     def load_from_session(self, session_data):
-        """Restore state from a session dictionary."""
-        self.current_state = session_data.get("current_state", "initial")
-        self.context = session_data.get("context", {})
-        self.retry_count = session_data.get("retry_count", 0)
-        self.last_response = session_data.get("last_response", None)
+        """Resume from a checkpoint written by this flow."""
+        if session_data.get("flow") != self.flow.name or session_data.get("state") not in self.flow.index:
+            return False
+        self.state = self.flow.index[session_data["state"]]
+        visits = session_data.get("visits") or b""
+        self.visits[:len(visits)] = visits[:len(self.visits)]
+        self.history = list(session_data.get("history") or [])
+        self._saved_history = len(self.history)
+        self.intent = session_data.get("intent")
+        return True
 
     def to_session_dict(self):
-        """Convert the current state into a dictionary for session storage."""
+        """The checkpoint fields for the current state."""
         return {
-            "current_state": self.current_state,
-            "context": self.context,
-            "retry_count": self.retry_count,
-            "last_response": self.last_response
+            "flow": self.flow.name,
+            "state": self.current_state,
+            "visits": bytes(self.visits),
+            "history": self.history,
+            "intent": self.intent,
         }
@@ -0,0 +1,217 @@
+import re
+import threading
+import time
+from prometheus_client import Counter
+from utils.logger import logger
+from utils.config_registry import get_config_registry
+
+OWNER = "owner"
+ALLOWED = "allowed"
+BLOCKED = "blocked"
+UNKNOWN = "unknown"
+
+# When the same number appears in several sources, the strongest category wins.
+_PRECEDENCE = {OWNER: 3, BLOCKED: 2, ALLOWED: 1}
+
+CALLER_LOOKUPS = Counter(
+    'caller_directory_lookups_total',
+    'Caller directory lookups by resulting category',
+    ['category']
+)
+
+DIRECTORY_RELOADS = Counter(
+    'caller_directory_reloads_total',
+    'Caller directory rebuilds',
+    ['result']
+)
+
+_separators = re.compile(r"[\s\-().]")
+
+def normalize_number(raw, default_country_code='1'):
+    """
+    Normalize a caller ID to E.164 ("+15551234567"), or return None if it
+    cannot be a phone number. Accepts "+", "00" international prefixes and
+    national 10-digit numbers in the default (NANP) country.
+    """
+    if not raw:
+        return None
+    number = _separators.sub('', str(raw))
+    if number.startswith('+'):
+        digits = number[1:]
+    elif number.startswith('00'):
+        digits = number[2:]
+    elif len(number) == 10:
+        digits = default_country_code + number
+    else:
+        digits = number
+    if not digits.isdigit() or not 8 <= len(digits) <= 15:
+        return None
+    return '+' + digits
+
+def range_to_prefixes(start, end):
+    """
+    Cover the inclusive range [start, end] of equal-length digit strings with
+    the fewest digit prefixes, e.g. ("5550100", "5550299") -> ["55501", "55502"].
+    """
+    if len(start) != len(end) or start > end:
+        raise ValueError(f"Invalid number range {start}-{end}")
+    if start == end:
+        return [start]
+    i = 0
+    while start[i] == end[i]:
+        i += 1
+    prefix, rest_start, rest_end = start[:i], start[i:], end[i:]
+    tail = len(rest_start) - 1
+    low, high = int(rest_start[0]), int(rest_end[0])
+    prefixes, upper = [], []
+    if rest_start[1:] != '0' * tail:
+        prefixes += range_to_prefixes(start, prefix + rest_start[0] + '9' * tail)
+        low += 1
+    if rest_end[1:] != '9' * tail:
+        upper = range_to_prefixes(prefix + rest_end[0] + '0' * tail, end)
+        high -= 1
+    prefixes += [prefix + str(digit) for digit in range(low, high + 1)]
+    return prefixes + upper
+
+class CallerEntry:
+    __slots__ = ('number', 'category', 'name', 'source')
+
+    def __init__(self, number, category, name=None, source=None):
+        self.number = number
+        self.category = category
+        self.name = name
+        self.source = source
+
+class _Index:
+    """Immutable lookup structure; a reload builds a new one and swaps it in."""
+    def __init__(self, exact, trie):
+        self.exact = exact
+        self.trie = trie
+
+    def lookup(self, number):
+        entry = self.exact.get(number)
+        if entry is not None:
+            return entry
+        # Longest matching prefix rule; one dict hop per digit.
+        node, found = self.trie, None
+        for digit in number[1:]:
+            node = node.get(digit)
+            if node is None:
+                break
+            if None in node:
+                found = node[None]
+        return found
+
+class CallerDirectory:
+    """
+    Hashed caller index merged from the caller lists and blocklist in the
+    config snapshot and (optionally) the `callers` table.
+
+    Exact numbers are normalized to E.164 and kept in a dict (O(1) lookups);
+    blocklist prefixes and ranges go into a digit trie (O(prefix length)).
+    Sources are re-checked at most every check_interval seconds and a new
+    config snapshot or changed table triggers a background rebuild; lookups keep using the previous
+    index until the new one is swapped in.
+    """
+    def __init__(self, registry=None, db_loader=None, db_fingerprint=None, check_interval=30):
+        self.registry = registry or get_config_registry()
+        self.db_loader = db_loader
+        self.db_fingerprint = db_fingerprint
+        self.check_interval = check_interval
+        self._reload_lock = threading.Lock()
+        self._next_check = 0.0
+        self._fingerprint = None
+        self._index = _Index({}, {})
+        self.reload()
+
+    def lookup(self, raw_number):
+        """Return the CallerEntry for a caller ID; category UNKNOWN if not listed."""
+        self._maybe_reload()
+        number = normalize_number(raw_number)
+        entry = self._index.lookup(number) if number else None
+        if entry is None:
+            entry = CallerEntry(number, UNKNOWN)
+        CALLER_LOOKUPS.labels(category=entry.category).inc()
+        return entry
+
+    def category(self, raw_number):
+        return self.lookup(raw_number).category
+
+    def __len__(self):
+        return len(self._index.exact)
+
+    def attach_db(self, db_loader, db_fingerprint=None):
+        """Start merging the callers table (long-lived workers) and rebuild."""
+        self.db_loader = db_loader
+        self.db_fingerprint = db_fingerprint
+        self.reload()
+
+    def _current_fingerprint(self):
+        stamps = [self.registry.get().fingerprint]
+        if self.db_fingerprint is not None:
+            stamps.append(self.db_fingerprint())
+        return tuple(stamps)
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check or self._reload_lock.locked():
+            return
+        self._next_check = now + self.check_interval
+        threading.Thread(target=self._reload_if_changed, daemon=True).start()
+
+    def _reload_if_changed(self):
+        try:
+            if self._current_fingerprint() != self._fingerprint:
+                self.reload()
+        except Exception as e:
+            logger.error(f"Caller directory change check failed: {e}")
+
+    def reload(self):
+        """Rebuild the index from all sources; keep the old one on failure."""
+        with self._reload_lock:
+            try:
+                fingerprint = self._current_fingerprint()
+                self._index = self._build()
+                self._fingerprint = fingerprint
+            except Exception as e:
+                DIRECTORY_RELOADS.labels(result='error').inc()
+                logger.error(f"Caller directory reload failed, keeping previous index: {e}")
+                return False
+        DIRECTORY_RELOADS.labels(result='success').inc()
+        logger.info(f"Caller directory loaded: {len(self._index.exact)} numbers")
+        return True
+
+    def _build(self):
+        config = self.registry.get()
+        exact = {}
+
+        def add(raw, category, name=None, source=None):
+            number = normalize_number(raw)
+            if number is None:
+                logger.warning(f"Ignoring invalid number {raw!r} from {source}")
+                return
+            current = exact.get(number)
+            if current is None or _PRECEDENCE[category] > _PRECEDENCE[current.category]:
+                exact[number] = CallerEntry(number, category, name or (current.name if current else None), source)
+
+        if self.db_loader is not None:
+            for cli, name in self.db_loader():
+                add(cli, ALLOWED, name, 'db')
+        for raw in config.allowed_callers:
+            add(raw, ALLOWED, source='allowed_callers.yml')
+        for raw in config.owner_callers:
+            add(raw, OWNER, source='owner_callers.yml')
+        for raw in config.blocked_callers:
+            add(raw, BLOCKED, source='blocked_callers.yml')
+
+        trie = {}
+        rule = CallerEntry(None, BLOCKED, source='blocked_callers.yml')
+        prefixes = [prefix.lstrip('+') for prefix in config.blocked_prefixes]
+        for start, end in config.blocked_ranges:
+            prefixes += range_to_prefixes(start.lstrip('+'), end.lstrip('+'))
+        for prefix in prefixes:
+            node = trie
+            for digit in prefix:
+                node = node.setdefault(digit, {})
+            node[None] = rule
+        return _Index(exact, trie)
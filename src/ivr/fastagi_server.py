@@ -0,0 +1,158 @@
+"""
+Long-lived FastAGI server.
+
+Point Asterisk at it with AGI(agi://<host>:4573) instead of spawning
+agi_handler.py per call. One process serves many channels concurrently (one
+thread per channel) and reuses the DB engine, Redis pool, LLM client and
+caller lists between calls. Use --workers to prefork one process per core.
+"""
+import argparse
+import os
+import signal
+import socketserver
+import sys
+from asterisk.agi import AGI, AGIHangup
+from utils.cpu_pool import configure_cpu_pools
+from utils.logger import logger
+from monitoring import multiprocess_dir, start_monitoring
+from agi_handler import IVRHandler
+from resources import get_shared_resources
+
+class _NullWriter:
+    """Sink for pyst2's debug chatter, which would otherwise go to stderr per command."""
+    def write(self, data):
+        pass
+
+    def flush(self):
+        pass
+
+class _HangupFilter:
+    """
+    Line reader that strips the in-band "HANGUP" notice FastAGI sends when the
+    channel goes away, flagging the session instead of confusing get_result().
+    """
+    def __init__(self, rfile):
+        self.rfile = rfile
+        self.agi = None
+
+    def readline(self):
+        while True:
+            line = self.rfile.readline()
+            if line.strip() != 'HANGUP':
+                return line
+            if self.agi is not None:
+                self.agi._got_sighup = True
+
+class SocketAGI(AGI):
+    """AGI session bound to a FastAGI socket instead of stdin/stdout."""
+    def __init__(self, rfile, wfile, stderr=None):
+        # AGI.__init__ installs a SIGHUP handler, which only works in the main
+        # thread; over FastAGI the hangup arrives in-band instead.
+        reader = _HangupFilter(rfile)
+        self.stdin = reader
+        self.stdout = wfile
+        self.stderr = stderr or _NullWriter()
+        self._got_sighup = False
+        self.env = {}
+        self._get_agi_env()
+        reader.agi = self
+
+class FastAGIRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        rfile = self.request.makefile('r', encoding='utf-8', newline='\n')
+        wfile = self.request.makefile('w', encoding='utf-8', newline='\n')
+        try:
+            agi = SocketAGI(rfile, wfile)
+            IVRHandler(agi=agi, resources=get_shared_resources()).handle_call()
+        except AGIHangup:
+            logger.info("Channel hung up during call handling")
+        except Exception as e:
+            logger.exception(f"FastAGI call failed: {e}")
+        finally:
+            for f in (wfile, rfile):
+                try:
+                    f.close()
+                except OSError:
+                    pass
+
+class FastAGIServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 128
+
+def _exit_worker():
+    try:
+        get_shared_resources().close()  # Drain the chat history queue
+    finally:
+        os._exit(0)
+
+def _run_workers(server, workers, metrics_port):
+    """
+    Prefork worker processes that all accept() on the parent's listening socket.
+    With PROMETHEUS_MULTIPROC_DIR set the master serves every worker's metrics
+    on metrics_port; otherwise worker N serves its own on metrics_port + N.
+    """
+    # Each worker's local speech engines get their share of the cores.
+    configure_cpu_pools(workers)
+    children = []
+    for index in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, lambda *_: _exit_worker())
+            if not multiprocess_dir():
+                start_monitoring(metrics_port + index)
+            get_shared_resources().warm()
+            try:
+                server.serve_forever()
+            finally:
+                _exit_worker()
+        children.append(pid)
+    logger.info(f"FastAGI prefork master {os.getpid()} started workers {children}")
+    if multiprocess_dir():
+        start_monitoring(metrics_port)
+
+    def _terminate(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    signal.signal(signal.SIGTERM, _terminate)
+    signal.signal(signal.SIGINT, _terminate)
+    for pid in children:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+def serve(host='0.0.0.0', port=4573, workers=1, metrics_port=9100):
+    server = FastAGIServer((host, port), FastAGIRequestHandler)
+    logger.info(f"FastAGI server listening on {host}:{port} with {workers} worker(s)")
+    try:
+        if workers > 1:
+            _run_workers(server, workers, metrics_port)
+        else:
+            start_monitoring(metrics_port)
+            get_shared_resources().warm()  # Build pools before the first call arrives
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if workers <= 1:
+            get_shared_resources().close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FastAGI server for the LLM IVR")
+    parser.add_argument('--host', default=os.getenv('FASTAGI_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('FASTAGI_PORT', 4573)))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('FASTAGI_WORKERS', 1)),
+                        help="Number of preforked worker processes (e.g. one per core)")
+    parser.add_argument('--metrics-port', type=int, default=9100,
+                        help="Prometheus port (all workers when PROMETHEUS_MULTIPROC_DIR is set, "
+                             "otherwise worker N listens on metrics_port + N)")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, max(1, args.workers), args.metrics_port)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+Runs a call's conversation from its compiled flow (config/call_flows.yml).
+
+    FlowEngine(agi, get_call_flow('caller_unknown'), llm_client, call_id, budget=budget).run()
+
+Each step enters a state, plays its prompt, runs its action and follows
+the action's outcome through the flow's transition table, until a state
+with no transition for it ends the call. Actions are methods looked up by
+action index once per process, so a step is a few tuple lookups plus the
+action's own work. With a session store the call's CallState is
+checkpointed at every transition.
+
+In keypad states the caller may press an intent's dtmf digit instead of
+speaking, during the prompt, the menu or the recording. classify then
+resolves the intent from the digit alone, with no STT or LLM round trip.
+"""
+import json
+import time
+from json import JSONDecodeError
+from prometheus_client import Counter, Histogram
+from utils.config_registry import FLOW_ACTION_NAMES, FLOW_OUTCOMES, get_config
+from utils.tracing import stage
+from call_state import CallState
+from greetings import select_greeting
+from intent_matcher import get_intent_matcher
+from intents import load_intents
+from playback import play_prompt, play_streaming_reply
+from speech_input import capture_input
+
+FLOW_INPUTS = Counter(
+    'flow_inputs_total',
+    'Caller turns in listen and keypad states, by how the caller answered (dtmf, speech, silence)',
+    ['flow', 'input']
+)
+
+FLOW_CALLS = Counter(
+    'flow_calls_total',
+    'Calls by how their intent was resolved (dtmf, speech, or none)',
+    ['flow', 'path']
+)
+
+FLOW_INTENT_SECONDS = Histogram(
+    'flow_intent_seconds',
+    'Time from the end of the caller\'s input to a resolved intent, by input',
+    ['flow', 'input'],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8)
+)
+
+FLOW_DTMF_SAVED = Counter(
+    'flow_dtmf_saved_seconds_total',
+    'Turn latency keypad presses saved against the average speech turn resolving an intent',
+    ['flow']
+)
+
+NEXT, SPEECH, SILENCE, TRANSFER, HANGUP, UNHANDLED, UNCLEAR, UNPARSEABLE, PRESSED = (
+    FLOW_OUTCOMES.index(outcome)
+    for outcome in ('next', 'speech', 'silence', 'transfer', 'hangup', 'unhandled', 'unclear', 'unparseable',
+                    'pressed'))
+CLASSIFY = FLOW_ACTION_NAMES.index('classify')
+# How long a keypad state waits for a digit once its menu has played.
+KEYPAD_TIMEOUT_MS = 5000
+# Smoothing of the per-flow average speech turn that DTMF turns are compared to.
+_SPEECH_LATENCY_WEIGHT = 0.1
+_speech_latency = {}
+# These play the matched intent's prompt in place of the state's own.
+_INTENT_PROMPT_ACTIONS = frozenset(FLOW_ACTION_NAMES.index(name) for name in ('transfer', 'hangup'))
+
+class FlowEngine:
+    __slots__ = ('agi', 'flow', 'llm', 'call_id', 'budget', 'resources', 'setup', 'caller_id', 'state',
+                 'utterance', 'intents', 'matcher', 'keypad', 'keys', 'menu', 'digit', 'input_ended', 'path')
+
+    def __init__(self, agi, flow, llm, call_id, budget=None, resources=None, setup=None, caller_id=None,
+                 history=None):
+        self.agi = agi
+        self.flow = flow
+        self.llm = llm
+        self.call_id = call_id
+        self.budget = budget
+        self.resources = resources
+        self.setup = setup
+        self.caller_id = caller_id
+        sessions = resources.sessions if resources is not None else None
+        self.state = CallState(flow, call_id, sessions, history)
+        self.utterance = None
+        self.intents = load_intents(flow.intents) if flow.intents else {}
+        self.matcher = get_intent_matcher(flow.intents) if flow.intents else None
+        intent_set = get_config().intent_set(flow.intents) if flow.intents else None
+        self.keypad = intent_set.keypad if intent_set is not None else {}
+        self.keys = ''.join(self.keypad)
+        self.menu = intent_set.menu if intent_set is not None else None
+        self.digit = ''
+        self.input_ended = None
+        self.path = None
+
+    def run(self):
+        """Run the flow until it ends; returns the final CallState."""
+        flow, state = self.flow, self.state
+        try:
+            while True:
+                i = state.enter()
+                action = flow.actions[i]
+                if flow.prompts[i] and action not in _INTENT_PROMPT_ACTIONS:
+                    self._play(flow.prompts[i], flow.keypad[i])
+                handler = _HANDLERS[action]
+                outcome = handler(self, i) if handler is not None else NEXT
+                if outcome is None or not state.advance(outcome):
+                    return state
+        finally:
+            FLOW_CALLS.labels(flow=flow.name, path=self.path or 'none').inc()
+
+    def _play(self, text, keypad=False):
+        """Play text; in a keypad state a menu digit cuts it short and is kept for classify."""
+        keys = self.keys if keypad else ''
+        pressed = play_prompt(self.agi, text, escape_digits=keys, budget=self.budget)
+        if keys and pressed and pressed in keys:
+            self.digit = pressed
+            self.input_ended = time.monotonic()
+
+    def _greet(self, i):
+        play_prompt(self.agi, select_greeting(self.flow.greetings[i]), budget=self.budget)
+        return NEXT
+
+    def _listen(self, i):
+        """Record and transcribe the caller, or take their keypad digit (a speech outcome too)."""
+        keypad = self.flow.keypad[i]
+        if keypad and not self.digit and self.menu:
+            self._play(self.menu, keypad)
+        if not self.digit:
+            heard = capture_input(self.agi, self.call_id, self.flow.name, self.keys if keypad else '',
+                                  budget=self.budget)
+            self.digit, self.utterance, self.input_ended = heard
+        given = 'dtmf' if self.digit else 'speech' if self.utterance else 'silence'
+        FLOW_INPUTS.labels(flow=self.flow.name, input=given).inc()
+        return SILENCE if given == 'silence' else SPEECH
+
+    def _keypad(self, i):
+        """Play the keypad menu and wait for a digit; no speech is recorded."""
+        if not self.digit and self.menu:
+            self._play(self.menu, True)
+        if not self.digit:
+            self.digit = self.agi.wait_for_digit(KEYPAD_TIMEOUT_MS)
+            self.input_ended = time.monotonic()
+        FLOW_INPUTS.labels(flow=self.flow.name, input='dtmf' if self.digit else 'silence').inc()
+        return PRESSED if self.digit else SILENCE
+
+    def _classify(self, i):
+        """
+        Resolve a keypad digit from the intents' dtmf digits, or match the
+        utterance locally, asking the LLM only when that is not confident.
+        Both sides are recorded in the conversation history.
+        """
+        text, history, digit = self.utterance, self.state.history, self.digit
+        self.digit = ''
+        if digit:
+            # A keypad press names its intent outright.
+            history.append({"role": "user", "content": f"(pressed {digit})"})
+            intent = self.keypad.get(digit)
+            structured = {"intent": intent, "message": self.intents[intent].prompt or ""} if intent else {}
+            return self._resolved(intent, structured, 'dtmf')
+        history.append({"role": "user", "content": text})
+        # Obvious requests are routed locally, skipping the LLM round trip.
+        intent = self.matcher.route(text, self.flow.intents) if self.matcher else None
+        if intent:
+            structured = {"intent": intent, "message": self.intents[intent].prompt or ""}
+        else:
+            prompt = {
+                "caller_id": self.agi.env.get('agi_callerid'),
+                "chat_history": history,
+                "current_input": text,
+                "call_context": self.flow.name
+            }
+            response = self.llm.get_response(prompt, budget=self.budget)
+            try:
+                with stage('parse'):
+                    structured = json.loads(response.get('text', '{}'))
+                intent = structured.get("intent", "")
+            except JSONDecodeError:
+                return UNPARSEABLE
+        return self._resolved(intent, structured, 'speech')
+
+    def _resolved(self, intent, structured, given):
+        """Record the classified intent and pick classify's outcome for it."""
+        history = self.state.history
+        if intent not in self.intents:
+            history.append({"role": "system", "content": structured.get("message", "Could you please clarify?")})
+            return UNCLEAR
+        history.append({"role": "system", "content": structured.get("message", "")})
+        self._time_intent(given)
+        self.state.intent = intent
+        info = self.intents[intent]
+        if info.action == "hangup":
+            return HANGUP
+        if info.extension:
+            return TRANSFER
+        return UNHANDLED  # Tool calls can be processed here.
+
+    def _time_intent(self, given):
+        """Time the caller's wait for their intent, and what a keypad press saved over speech."""
+        self.path = given
+        if self.input_ended is None:
+            return
+        name, seconds = self.flow.name, time.monotonic() - self.input_ended
+        FLOW_INTENT_SECONDS.labels(flow=name, input=given).observe(seconds)
+        average = _speech_latency.get(name)
+        if given == 'speech':
+            _speech_latency[name] = seconds if average is None else (
+                average + _SPEECH_LATENCY_WEIGHT * (seconds - average))
+        elif average is not None and average > seconds:
+            FLOW_DTMF_SAVED.labels(flow=name).inc(average - seconds)
+
+    def _matched_intent(self, i):
+        """The intent classify just matched, if that is how the flow got here, else state i's own."""
+        state = self.state
+        from_classify = state.previous_state >= 0 and self.flow.actions[state.previous_state] == CLASSIFY
+        if state.intent is not None and from_classify:
+            return self.intents[state.intent]
+        if self.flow.state_intents[i] is None:
+            return None
+        state.intent = self.flow.state_intents[i]
+        return self.intents[state.intent]
+
+    def _play_intent_prompt(self, i, intent):
+        text = (intent.prompt if intent else None) or self.flow.prompts[i]
+        if text:
+            play_prompt(self.agi, text, budget=self.budget)
+
+    def _transfer(self, i):
+        intent = self._matched_intent(i)
+        self._play_intent_prompt(i, intent)
+        if intent is not None and intent.extension:
+            self.agi.set_variable("TRANSFER_EXTENSION", intent.extension)
+        return None
+
+    def _hangup(self, i):
+        self._play_intent_prompt(i, self._matched_intent(i))
+        self.agi.hangup()
+        return None
+
+    def _owner_reply(self, i):
+        """Speak the LLM's reply to the owner, with their recent history, and store it."""
+        resources = self.resources
+        # Latest turns, from the Redis history cache when warm (prefetched while
+        # the greeting played); the call goes on without them if the database
+        # is unavailable.
+        load = lambda: resources.history.recent(self.caller_id, budget=self.budget)  # noqa: E731
+        history = (self.setup.result('history', load) if self.setup is not None else load()) or []
+        if history:
+            self.agi.verbose("Loaded previous conversation history.", 3)
+        prompt = {
+            "caller_id": self.caller_id,
+            "chat_history": history,
+            "current_input": "",
+            "call_context": self.flow.name
+        }
+        # Stream the reply so its first sentence plays while the rest is generated.
+        reply, spoken = play_streaming_reply(self.agi, self.llm.stream_response(prompt, budget=self.budget),
+                                             self.flow.name, budget=self.budget)
+        try:
+            with stage('parse'):
+                structured = json.loads(reply or '{}')
+            if not spoken and 'message' not in structured:
+                self.agi.verbose("Internal call processed.", 3)
+        except JSONDecodeError:
+            structured = {}
+            self.agi.verbose("Internal call processed.", 3)
+        if structured.get('message'):
+            self.state.history.append({"role": "system", "content": structured['message']})
+            resources.history.append(self.caller_id, self.call_id, "llm", structured['message'])
+        return NEXT
+
+_HANDLERS = tuple(getattr(FlowEngine, f"_{name}") if name else None for name in FLOW_ACTION_NAMES)
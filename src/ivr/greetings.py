@@ -1,16 +1,10 @@
-import yaml
 from datetime import datetime
+from prompts import DEFAULT_GREETING
+from utils.config_registry import get_config
 
-def load_greetings(config_path='config/greetings.yml'):
-    """Load greeting templates from the YAML configuration file."""
-    try:
-        with open(config_path) as f:
-            data = yaml.safe_load(f)
-        return data.get('greetings', {})
-    except Exception as e:
-        # Log error or raise exception as needed
-        print(f"Error loading greetings from {config_path}: {e}")
-        return {}
+def load_greetings():
+    """Greeting templates from the shared config snapshot (config/greetings.yml)."""
+    return get_config().greetings
 
 def select_greeting(caller_type='external'):
     """
@@ -27,7 +21,7 @@ def select_greeting(caller_type='external'):
     else:
         time_of_day = 'evening'
     
-    return greetings.get(caller_type, {}).get(time_of_day, "Hello, how can I help you?")
+    return greetings.get(caller_type, {}).get(time_of_day, DEFAULT_GREETING)
 
 if __name__ == "__main__":
     # Example usage in your AGI handler:
@@ -0,0 +1,115 @@
+import re
+import threading
+from prometheus_client import Counter
+from utils.logger import logger
+from utils.config_registry import get_config
+
+INTENT_FAST_PATH = Counter(
+    'intent_fast_path_total',
+    'Transcripts routed by the local intent matcher (hit) or passed to the LLM (miss)',
+    ['caller_type', 'result']
+)
+
+DEFAULT_THRESHOLD = 0.75
+
+# Scoring weights: a configured phrase is strong evidence on its own, keywords
+# only add up to a confident match in combination.
+PHRASE_SCORE = 0.85
+EXTRA_PHRASE_SCORE = 0.05
+KEYWORD_SCORE = 0.3
+MAX_KEYWORD_SCORE = 0.6
+AMBIGUITY_PENALTY = 0.5
+
+_non_word = re.compile(r"[^a-z0-9' ]+")
+_spaces = re.compile(r"\s+")
+
+def normalize(text):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return _spaces.sub(' ', _non_word.sub(' ', text.lower().replace('’', "'"))).strip()
+
+class IntentMatcher:
+    """
+    Local classifier compiled from the intent YAML.
+
+    Every intent's `phrases` are folded into one alternation regex, so a single
+    scan of the transcript finds all phrase hits, and `keywords` become a
+    token -> intents dict. Each intent scores PHRASE_SCORE for a phrase hit plus
+    smaller increments for further phrases and keywords; the winner's score is
+    reduced when a second intent also scored, so ambiguous transcripts fall
+    through to the LLM.
+    """
+    def __init__(self, intents, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self._phrase_intent = {}
+        self._keyword_intents = {}
+        for name, info in (intents or {}).items():
+            for phrase in info.phrases:
+                self._phrase_intent[normalize(phrase)] = name
+            for keyword in info.keywords:
+                self._keyword_intents.setdefault(normalize(keyword), set()).add(name)
+        phrases = sorted(self._phrase_intent, key=len, reverse=True)  # Prefer longest match
+        self._pattern = re.compile(
+            r'\b(?:%s)\b' % '|'.join(re.escape(p) for p in phrases)) if phrases else None
+
+    def scores(self, text):
+        """Return {intent: score} for every intent with any evidence in text."""
+        normalized = normalize(text)
+        phrase_hits = {}
+        if self._pattern is not None:
+            for match in self._pattern.finditer(normalized):
+                intent = self._phrase_intent[match.group(0)]
+                phrase_hits.setdefault(intent, set()).add(match.group(0))
+        keyword_hits = {}
+        for token in set(normalized.split()):
+            for intent in self._keyword_intents.get(token, ()):
+                keyword_hits[intent] = keyword_hits.get(intent, 0) + 1
+
+        scores = {}
+        for intent in set(phrase_hits) | set(keyword_hits):
+            score = 0.0
+            if intent in phrase_hits:
+                score += PHRASE_SCORE + EXTRA_PHRASE_SCORE * (len(phrase_hits[intent]) - 1)
+            score += min(MAX_KEYWORD_SCORE, KEYWORD_SCORE * keyword_hits.get(intent, 0))
+            scores[intent] = min(1.0, score)
+        return scores
+
+    def match(self, text):
+        """Return (intent, confidence); intent is None when nothing scored."""
+        scores = self.scores(text)
+        if not scores:
+            return None, 0.0
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        intent, top = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        return intent, max(0.0, top - AMBIGUITY_PENALTY * runner_up)
+
+    def route(self, text, caller_type):
+        """
+        Return the intent to act on without asking the LLM, or None to fall
+        back to it. Counts fast-path hits and misses.
+        """
+        intent, confidence = self.match(text)
+        if intent is not None and confidence >= self.threshold:
+            INTENT_FAST_PATH.labels(caller_type=caller_type, result='hit').inc()
+            logger.info(f"Fast-path intent {intent} ({confidence:.2f}) for {caller_type} caller")
+            return intent
+        INTENT_FAST_PATH.labels(caller_type=caller_type, result='miss').inc()
+        return None
+
+_lock = threading.Lock()
+_matchers = {}
+
+def get_intent_matcher(caller_type):
+    """
+    Matcher for config/<caller_type>_caller_intents.yml, compiled once per
+    config snapshot and rebuilt only when the registry reloads.
+    """
+    intent_set = get_config().intent_set(caller_type)
+    with _lock:
+        cached = _matchers.get(caller_type)
+        if cached and cached[0] is intent_set:
+            return cached[1]
+        threshold = intent_set.fast_path_threshold
+        matcher = IntentMatcher(intent_set.intents, DEFAULT_THRESHOLD if threshold is None else threshold)
+        _matchers[caller_type] = (intent_set, matcher)
+        return matcher
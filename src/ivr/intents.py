@@ -1,17 +1,11 @@
-import yaml
+from utils.config_registry import get_config
 
 def load_intents(caller_type):
     """
-    Load intents from the corresponding YAML file based on caller type.
+    Intents for the caller type, by name, from the shared config snapshot
+    (config/<caller_type>_caller_intents.yml).
     """
-    config_file = f"config/{caller_type}_caller_intents.yml"
-    try:
-        with open(config_file) as f:
-            data = yaml.safe_load(f)
-        return data.get("intents", {})
-    except Exception as e:
-        print(f"Error loading intents from {config_file}: {e}")
-        return {}
+    return get_config().intent_set(caller_type).intents
         
 if __name__ == "__main__":
     # Example usage:
@@ -0,0 +1,159 @@
+"""
+Prometheus metrics for every way the IVR runs.
+
+With PROMETHEUS_MULTIPROC_DIR set (in the environment, before any process
+imports prometheus_client) each process - a per-call AGI script, a FastAGI
+worker - writes its samples to mmap files in that directory, and one
+exporter per host serves their sum:
+
+    PROMETHEUS_MULTIPROC_DIR=/var/lib/ivr/metrics python src/ivr/monitoring.py --port 9100
+
+The FastAGI server runs that exporter itself. Because a per-call process
+leaves its files behind when it exits, the exporter folds the counters and
+histograms of dead processes into one archive file per type before each
+scrape and drops their live gauges, so the directory stays small and totals
+never go backwards.
+
+Without the directory, start_monitoring() serves this process' own registry
+as before.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+from utils.logger import logger
+
+MULTIPROC_ENV = 'PROMETHEUS_MULTIPROC_DIR'
+# File types whose values add up across processes.
+_ADDITIVE = ('counter', 'histogram', 'summary')
+ARCHIVE = 'archive'
+
+_lock = threading.Lock()
+_started_port = None
+
+def multiprocess_dir():
+    return os.environ.get(MULTIPROC_ENV) or None
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _file_pid(path):
+    """(type, pid) for a multiprocess file name like histogram_123.db or gauge_livesum_123.db."""
+    parts = os.path.basename(path)[:-len('.db')].split('_')
+    owner = parts[-1]
+    return parts[0], (int(owner) if owner.isdigit() else None)
+
+def compact(path):
+    """
+    Fold the counter, histogram and summary files of exited processes into
+    <type>_archive.db and remove them, along with their live gauges. Returns
+    the number of files removed. Only the exporter may call this, and never
+    concurrently with itself.
+    """
+    from prometheus_client.mmap_dict import MmapedDict
+    from prometheus_client.multiprocess import mark_process_dead
+
+    removed = 0
+    archives = {}
+    dead = set()
+    try:
+        for filename in sorted(glob.glob(os.path.join(path, '*.db'))):
+            typ, pid = _file_pid(filename)
+            if pid is None:
+                continue  # An archive
+            if pid not in dead:
+                if _pid_alive(pid):
+                    continue
+                dead.add(pid)
+            if typ not in _ADDITIVE:
+                continue
+            archive = archives.get(typ)
+            if archive is None:
+                archive = archives[typ] = MmapedDict(os.path.join(path, f"{typ}_{ARCHIVE}.db"))
+            for key, value, timestamp, _ in MmapedDict.read_all_values_from_file(filename):
+                total, _ = archive.read_value(key)
+                archive.write_value(key, total + value, timestamp)
+            os.remove(filename)
+            removed += 1
+    finally:
+        for archive in archives.values():
+            archive.close()
+    for pid in dead:
+        mark_process_dead(pid, path)
+    return removed
+
+class CompactingCollector:
+    """MultiProcessCollector that compacts the directory before each collection."""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def collect(self):
+        from prometheus_client.multiprocess import MultiProcessCollector
+        with self._lock:
+            try:
+                removed = compact(self.path)
+                if removed:
+                    logger.debug(f"Compacted {removed} metrics file(s) of exited processes")
+            except Exception as e:
+                logger.error(f"Metrics compaction failed: {e}")
+            files = glob.glob(os.path.join(self.path, '*.db'))
+            return MultiProcessCollector.merge(files, accumulate=True)
+
+def start_monitoring(port=9100):
+    """
+    Expose Prometheus metrics over HTTP: the whole PROMETHEUS_MULTIPROC_DIR
+    when set, otherwise this process' registry. Safe to call repeatedly; the
+    server is only started once per process.
+    """
+    global _started_port
+    with _lock:
+        if _started_port is not None:
+            return _started_port
+        try:
+            from prometheus_client import CollectorRegistry, start_http_server
+            path = multiprocess_dir()
+            if path:
+                os.makedirs(path, exist_ok=True)
+                registry = CollectorRegistry()
+                registry.register(CompactingCollector(path))
+                start_http_server(port, registry=registry)
+            else:
+                start_http_server(port)
+        except OSError as e:
+            logger.warning(f"Metrics server not started on port {port}: {e}")
+            return None
+        _started_port = port
+        logger.info(f"Metrics exposed on port {port}" + (f" for all processes in {path}" if path else ""))
+        return port
+
+def warn_if_metrics_unexported():
+    """Per-call processes only contribute metrics through the multiprocess directory."""
+    if not multiprocess_dir():
+        logger.warning(f"{MULTIPROC_ENV} is not set; this call's metrics will not be exported")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve IVR metrics aggregated over all processes")
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--compact', action='store_true', help="Compact the directory once and exit")
+    args = parser.parse_args(argv)
+    path = multiprocess_dir()
+    if not path:
+        parser.error(f"{MULTIPROC_ENV} must be set")
+    if args.compact:
+        print(json.dumps({"removed": compact(path)}))
+        return 0
+    if start_monitoring(args.port) is None:
+        return 1
+    threading.Event().wait()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import functools
+import os
+import queue
+import tempfile
+import threading
+import time
+from prometheus_client import Histogram
+from utils.logger import logger
+from utils.tracing import get_trace, stage, traced
+from llm.streaming import JSONFieldStream, SentenceSplitter
+from tts.cache import get_tts_cache
+from tts.providers import synthesize_for_context, voices_for, with_fallback
+
+LLM_FIRST_TOKEN = Histogram(
+    'llm_first_token_seconds',
+    'Time from sending the LLM request to the first streamed token',
+    ['call_context']
+)
+
+LLM_FIRST_AUDIO = Histogram(
+    'llm_first_audio_seconds',
+    'Time from sending the LLM request to the first reply audio on the channel',
+    ['call_context']
+)
+
+_DONE = object()
+
+def _temp_wav():
+    fd, path = tempfile.mkstemp(prefix='ivr_tts_', suffix='.wav')
+    os.close(fd)
+    os.chmod(path, 0o644)  # Asterisk may run as a different user
+    return path
+
+def play_prompt(agi, text, escape_digits='', cacheable=True, budget=None):
+    """
+    Speak text on the channel and return any escape digit pressed.
+
+    Fixed prompts come from the TTS cache (pre-rendered by prewarm.py, so
+    playback starts immediately); one-off text such as LLM replies is rendered
+    to a temporary file that is removed after playback. If synthesis fails the
+    text is still logged and the call carries on. Synthesis is bounded by
+    budget's "tts" slice when one is given, and its turn restarts once the
+    prompt has played. The call's context picks the TTS engine
+    (config/speech.yml), falling back to another if it fails.
+    """
+    agi.verbose(text, 3)
+    trace = get_trace()
+    call_context = trace.call_context if trace is not None else None
+    tmp_path = None
+    try:
+        with stage('tts'):
+            if cacheable:
+                cache = get_tts_cache()
+                path = with_fallback(lambda voice: cache.synthesize(text, voice=voice, budget=budget),
+                                     voices_for(call_context))
+            else:
+                tmp_path = _temp_wav()
+                synthesize_for_context(text, tmp_path, call_context, budget=budget)
+                path = tmp_path
+    except Exception as e:
+        logger.error(f"TTS error: {e}")
+        if tmp_path:
+            os.unlink(tmp_path)
+        return ''
+    try:
+        # STREAM FILE expects the path without its extension.
+        with stage('playback'):
+            return agi.stream_file(os.path.splitext(path)[0], escape_digits)
+    finally:
+        if tmp_path:
+            os.unlink(tmp_path)
+        if budget is not None:
+            budget.start_turn()  # The caller was listening, not waiting
+
+def play_streaming_reply(agi, deltas, call_context, synthesize=None, budget=None):
+    """
+    Speak the "message" field of a streamed LLM reply sentence by sentence
+    while the rest of the reply is still being generated.
+
+    One thread reads the token stream and cuts it into sentences, a second
+    renders each sentence to audio, and the calling thread plays them in order,
+    so generation, synthesis and playback overlap. Returns (raw_reply, spoken)
+    where raw_reply is the complete model output for the caller to parse and
+    spoken is the number of sentences played. Each sentence is rendered
+    within budget's "tts" slice when one is given, by call_context's TTS
+    engines unless synthesize(text, path) is given.
+    """
+    if synthesize is None:
+        synthesize = functools.partial(synthesize_for_context, call_context=call_context)
+    if budget is not None:
+        synthesize = functools.partial(synthesize, budget=budget)
+    started = time.monotonic()
+    raw = []
+    sentences = queue.Queue()
+    rendered = queue.Queue(maxsize=2)  # Render at most a couple of sentences ahead
+    cancelled = threading.Event()
+
+    def produce():
+        field = JSONFieldStream('message')
+        splitter = SentenceSplitter()
+        try:
+            for delta in deltas:
+                if not raw:
+                    LLM_FIRST_TOKEN.labels(call_context=call_context).observe(time.monotonic() - started)
+                raw.append(delta)
+                for sentence in splitter.feed(field.feed(delta)):
+                    sentences.put(sentence)
+                if cancelled.is_set():
+                    break
+            for sentence in splitter.flush():
+                sentences.put(sentence)
+        except Exception as e:
+            logger.error(f"LLM stream failed: {e}")
+        finally:
+            sentences.put(_DONE)
+
+    def render():
+        while True:
+            sentence = sentences.get()
+            if sentence is _DONE or cancelled.is_set():
+                rendered.put(_DONE)
+                return
+            path = _temp_wav()
+            try:
+                with stage('tts'):
+                    synthesize(sentence, path)
+            except Exception as e:
+                logger.error(f"TTS error: {e}")
+                os.unlink(path)
+                path = None
+            rendered.put((sentence, path))
+
+    producer = threading.Thread(target=traced(produce), daemon=True)
+    renderer = threading.Thread(target=traced(render), daemon=True)
+    producer.start()
+    renderer.start()
+
+    spoken = 0
+    finished = False
+    try:
+        while True:
+            item = rendered.get()
+            if item is _DONE:
+                finished = True
+                break
+            sentence, path = item
+            agi.verbose(sentence, 3)
+            if path is None:
+                continue
+            try:
+                if spoken == 0:
+                    LLM_FIRST_AUDIO.labels(call_context=call_context).observe(time.monotonic() - started)
+                with stage('playback'):
+                    agi.stream_file(os.path.splitext(path)[0])
+                spoken += 1
+                if budget is not None:
+                    budget.start_turn()  # As in play_prompt
+            finally:
+                os.unlink(path)
+    finally:
+        if not finished:
+            # Caller hung up mid-reply: stop both threads and clean up their files.
+            cancelled.set()
+            threading.Thread(target=_discard, args=(rendered,), daemon=True).start()
+    producer.join()
+    return ''.join(raw), spoken
+
+def _discard(rendered):
+    while True:
+        item = rendered.get()
+        if item is _DONE:
+            return
+        if item[1]:
+            os.unlink(item[1])
@@ -0,0 +1,55 @@
+"""
+Render every static prompt into the TTS cache at deploy time:
+
+    PYTHONPATH=src:src/ivr python src/ivr/prewarm.py
+
+Covers the greetings, every intent `prompt`, the keypad menus, the
+call-flow state prompts and the fixed handler lines in prompts.py, in every
+voice a caller context may use (config/speech.yml), so calls never wait on
+synthesis for text that does not change.
+"""
+import sys
+import time
+from utils.logger import logger
+from utils.config_registry import get_config
+from tts.cache import get_tts_cache
+from tts.providers import all_voices
+from prompts import STATIC_PROMPTS
+
+def collect_static_prompts(config=None):
+    """Return the de-duplicated list of prompts that can be rendered ahead of time."""
+    config = config or get_config()
+    texts = list(STATIC_PROMPTS)
+    for by_time in config.greetings.values():
+        texts.extend(by_time.values())
+    for intent_set in config.intents.values():
+        texts.extend(intent.prompt for intent in intent_set.intents.values() if intent.prompt)
+        if intent_set.menu:
+            texts.append(intent_set.menu)
+    for flow in config.call_flow.values():
+        texts.extend(prompt for prompt in flow.prompts if prompt)
+    return list(dict.fromkeys(texts))
+
+def prewarm(cache=None, config=None, voices=None):
+    cache = cache or get_tts_cache()
+    rendered = cached = failed = 0
+    texts = collect_static_prompts(config)
+    for voice in voices or all_voices():
+        for text in texts:
+            if cache.get(text, voice):
+                cached += 1
+                continue
+            start = time.perf_counter()
+            try:
+                cache.synthesize(text, voice=voice)
+            except Exception as e:
+                failed += 1
+                logger.error(f"Failed to pre-render {text!r} with {voice}: {e}")
+                continue
+            rendered += 1
+            logger.info(f"Rendered {text!r} with {voice} in {time.perf_counter() - start:.2f}s")
+    logger.info(f"TTS pre-warm: {rendered} rendered, {cached} already cached, {failed} failed")
+    return failed == 0
+
+if __name__ == '__main__':
+    sys.exit(0 if prewarm() else 1)
@@ -0,0 +1,14 @@
+"""
+Fixed lines spoken outside the call flows; the flows' own prompts live in
+config/call_flows.yml. Keeping them here lets the pre-warm command render
+every one of them into the TTS cache at deploy time.
+"""
+
+DEFAULT_GREETING = "Hello, how can I help you?"
+# Canned reply when a dependency (LLM, speech, database) is unavailable.
+SERVICE_UNAVAILABLE = "Sorry, we are having technical difficulties. Please call again later. Goodbye."
+
+STATIC_PROMPTS = [
+    DEFAULT_GREETING,
+    SERVICE_UNAVAILABLE,
+]
@@ -0,0 +1,107 @@
+import os
+import threading
+from redis import Redis
+from utils.logger import logger
+from utils.admission import configure_admission
+from utils.resilience import configure_breakers
+from llm.llm_client import LLMClient
+from caller_directory import CallerDirectory
+from db.history_cache import HistoryCache
+
+class SharedResources:
+    """
+    Dependencies that are expensive to build and safe to share between calls:
+    the Redis pool, the database engine, the LLM client, caller directory and
+    recent-history cache. redis_client and database replace the default
+    local Redis and the configured database (load tests, tooling).
+    """
+    def __init__(self, redis_client=None, database=None):
+        self._db = database
+        self._sessions = None
+        self._lock = threading.Lock()
+        self.redis = redis_client or Redis(
+            host='localhost',
+            port=6379,
+            db=0,
+            password=os.getenv('REDIS_PASSWORD', '')
+        )
+        # Circuit breaker state and admission slots are shared with every
+        # other worker through Redis.
+        configure_breakers(self.redis)
+        configure_admission(self.redis)
+        self.llm_client = LLMClient(redis_client=self.redis)
+        # YAML caller lists; the callers table is merged in by warm() so the
+        # per-call script path does not pay for a database round trip.
+        self.caller_directory = CallerDirectory()
+        # Owner history is served from Redis; the database is only touched on a miss.
+        self.history = HistoryCache(self.redis, lambda: self.db)
+
+    @property
+    def db(self):
+        # SQLAlchemy is the most expensive import on the call path and only
+        # owner calls need the database, so the engine is built on first use.
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    from db.db import Database
+                    self._db = Database()
+        return self._db
+
+    @property
+    def sessions(self):
+        """
+        The call session store, where call flows checkpoint their state; None
+        without SESSION_KEY, in which case flows run without checkpoints.
+        """
+        if self._sessions is None:
+            with self._lock:
+                if self._sessions is None:
+                    if not os.getenv('SESSION_KEY'):
+                        logger.info("SESSION_KEY not set; call flows will not be checkpointed")
+                        self._sessions = False
+                    else:
+                        from session_manger import SessionManager
+                        self._sessions = SessionManager(self.redis)
+        return self._sessions or None
+
+    def close(self):
+        """Flush pending writes before the process exits."""
+        if self._db is not None:
+            self._db.close()
+
+    def warm(self):
+        """Build lazily-created dependencies up front (long-lived workers)."""
+        self.caller_directory.attach_db(self.db.get_all_callers, self.db.callers_fingerprint)
+        if os.getenv('SPEECH_KEY') and os.getenv('SPEECH_REGION'):
+            # Pre-connected speech objects, so turns skip connection setup.
+            from audio_util import STT_RATE
+            from stt.azure_stt import get_recognizer_pool
+            from tts.azure_tts import get_synthesizer_pool
+            get_recognizer_pool(STT_RATE).start()
+            get_synthesizer_pool().start()
+        # Local speech engines load their models in every pool process up front.
+        from stt.providers import start_local_engines as start_local_stt
+        from tts.providers import start_local_engines as start_local_tts
+        for start in (start_local_stt, start_local_tts):
+            try:
+                start()
+            except Exception as e:
+                logger.error(f"Could not start local speech engines: {e}")
+        return self
+
+_lock = threading.Lock()
+_resources = None
+_resources_pid = None
+
+def get_shared_resources():
+    """
+    Return the process-wide SharedResources, building them on first use.
+    Connection pools must not cross a fork, so a forked worker gets its own.
+    """
+    global _resources, _resources_pid
+    with _lock:
+        if _resources is None or _resources_pid != os.getpid():
+            logger.info(f"Initialising shared resources in process {os.getpid()}")
+            _resources = SharedResources()
+            _resources_pid = os.getpid()
+        return _resources
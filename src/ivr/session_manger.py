@@ -1,25 +1,206 @@
+import base64
 import json
 import os
+import threading
+import msgpack
+from cachetools import LRUCache
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from prometheus_client import Counter
+from redis.exceptions import WatchError
 from utils.logger import logger
 
+SESSION_READS = Counter(
+    'session_reads_total',
+    'Session reads by where they were served from',
+    ['source']
+)
+
+VERSION_FIELD = b'_v'
+NONCE_BYTES = 12
+
 class SessionManager:
-    def __init__(self, redis_client):
+    """
+    Call sessions as Redis hashes with one encrypted field per top-level key.
+
+    Each field is msgpack-encoded and sealed with AES-GCM (key derived from
+    SESSION_KEY), using "<call_id>:<field>" as associated data so a field
+    can't be replayed into another call or key. Saves write only the fields
+    that changed, plus a new version token, in one transaction.
+    Reads can ask for just the fields they need. Sessions are cached per
+    worker and revalidated against that version with one HGET, which skips
+    the transfer and decryption when nothing changed.
+
+    Sessions written by the old whole-blob Fernet format are still readable.
+    """
+    prefix = "session"
+    ttl_seconds = 3600
+
+    def __init__(self, redis_client, cache_size=1024):
         self.redis = redis_client
         key = os.getenv("SESSION_KEY")
         if not key:
             raise ValueError("SESSION_KEY environment variable not set")
-        self.cipher = Fernet(key)
+        self.cipher = Fernet(key)  # Legacy blobs only
+        field_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                         info=b"ivr-session-fields").derive(base64.urlsafe_b64decode(key))
+        self.aead = AESGCM(field_key)
+        # call_id -> (version, {field: msgpack bytes}); packed so that callers
+        # mutating their dicts can't change what we compare against.
+        self._cache = LRUCache(maxsize=cache_size)
+        self._lock = threading.Lock()
+
+    def key(self, call_id):
+        return f"{self.prefix}:v2:{call_id}"
 
     def save_session(self, call_id, data):
-        session_key = f"session:{call_id}"
-        encrypted = self.cipher.encrypt(json.dumps(data).encode())
-        self.redis.setex(session_key, 3600, encrypted)
+        """
+        Store data, writing only the fields that differ from the cached copy.
+        The diff is written under WATCH, so it only lands if the session is
+        still at the cached version; a copy another worker has rewritten, in
+        the meantime or before, is not diffed against: the whole session is
+        written instead.
+        """
+        key = self.key(call_id)
+        with self._lock:
+            cached = self._cache.get(call_id)
+        if cached is not None:
+            with self.redis.pipeline(transaction=True) as pipe:
+                try:
+                    pipe.watch(key)
+                    if pipe.hget(key, VERSION_FIELD) == cached[0]:
+                        previous = cached[1]
+                        changes = {name: value for name, value in data.items()
+                                   if previous.get(name) != self._pack(value)}
+                        removed = [name for name in previous if name not in data]
+                        pipe.multi()
+                        version, packed = self._queue(pipe, call_id, changes, removed)
+                        pipe.execute()
+                        self._remember(call_id, cached[0], version, packed, removed)
+                        return
+                except WatchError:
+                    logger.debug(f"Session {call_id} changed while saving; writing it whole")
+        self._write(call_id, data, replace=True)
+
+    def update_session(self, call_id, changes, removed=()):
+        """Set and delete individual fields, leaving the rest of the session alone."""
+        self._write(call_id, changes, removed)
+
+    def _write(self, call_id, changes, removed=(), replace=False):
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hget(self.key(call_id), VERSION_FIELD)
+        version, packed = self._queue(pipe, call_id, changes, removed, replace)
+        previous = pipe.execute()[0]
+        self._remember(call_id, previous, version, packed, removed, replace)
+
+    def _queue(self, pipe, call_id, changes, removed=(), replace=False):
+        """Queue the write of changes on pipe; returns the new version and the packed fields."""
+        key = self.key(call_id)
+        packed = {name: self._pack(value) for name, value in changes.items()}
+        # Versions are random tokens rather than counters so a replaced
+        # session can never reuse a version another worker has cached.
+        version = os.urandom(8).hex().encode()
+        fields = {name: self._seal(call_id, name, value) for name, value in packed.items()}
+        fields[VERSION_FIELD] = version
+        if replace:
+            pipe.delete(key)
+        elif removed:
+            pipe.hdel(key, *removed)
+        pipe.hset(key, mapping=fields)
+        pipe.expire(key, self.ttl_seconds)
+        return version, packed
+
+    def _remember(self, call_id, previous, version, packed, removed=(), replace=False):
+        """Bring the cached copy up to a write that found the session at version previous."""
+        with self._lock:
+            cached = self._cache.get(call_id)
+            if replace:
+                self._cache[call_id] = (version, packed)
+            elif cached is not None and previous == cached[0]:
+                merged = dict(cached[1])
+                merged.update(packed)
+                for name in removed:
+                    merged.pop(name, None)
+                self._cache[call_id] = (version, merged)
+            else:
+                self._cache.pop(call_id, None)  # Someone else wrote in between
+
+    def get_session(self, call_id, fields=None):
+        """
+        Return the session dict, or only the named fields. Missing sessions
+        (and undecryptable ones) come back as {}.
+        """
+        key = self.key(call_id)
+        with self._lock:
+            cached = self._cache.get(call_id)
+        if cached is not None:
+            version = self.redis.hget(key, VERSION_FIELD)
+            if version == cached[0]:
+                SESSION_READS.labels(source='cache').inc()
+                return self._select(cached[1], fields)
+
+        if fields is not None:
+            fields = list(fields)
+            values = self.redis.hmget(key, fields)
+            if any(value is not None for value in values):
+                SESSION_READS.labels(source='redis').inc()
+                try:
+                    return {name: self._unpack(self._open(call_id, name, value))
+                            for name, value in zip(fields, values) if value is not None}
+                except Exception as e:
+                    logger.error(f"Error decrypting session data for {call_id}: {e}")
+                    return {}
+            legacy = self._get_legacy(call_id)
+            return {name: legacy[name] for name in fields if name in legacy}
+
+        raw = self.redis.hgetall(key)
+        if not raw:
+            return self._get_legacy(call_id)
+        SESSION_READS.labels(source='redis').inc()
+        try:
+            version = raw.pop(VERSION_FIELD, None)
+            packed = {name.decode(): self._open(call_id, name.decode(), value) for name, value in raw.items()}
+        except Exception as e:
+            logger.error(f"Error decrypting session data for {call_id}: {e}")
+            return {}
+        with self._lock:
+            self._cache[call_id] = (version, packed)
+        return self._select(packed, None)
+
+    def delete_session(self, call_id):
+        self.redis.delete(self.key(call_id), f"{self.prefix}:{call_id}")
+        with self._lock:
+            self._cache.pop(call_id, None)
+
+    @staticmethod
+    def _pack(value):
+        return msgpack.packb(value, use_bin_type=True)
+
+    @staticmethod
+    def _unpack(packed):
+        return msgpack.unpackb(packed, raw=False)
+
+    def _seal(self, call_id, name, packed):
+        nonce = os.urandom(NONCE_BYTES)
+        return nonce + self.aead.encrypt(nonce, packed, f"{call_id}:{name}".encode())
+
+    def _open(self, call_id, name, sealed):
+        """Decrypt a field back to its msgpack bytes."""
+        nonce, ciphertext = sealed[:NONCE_BYTES], sealed[NONCE_BYTES:]
+        return self.aead.decrypt(nonce, ciphertext, f"{call_id}:{name}".encode())
+
+    @classmethod
+    def _select(cls, packed, fields):
+        names = packed if fields is None else [name for name in fields if name in packed]
+        return {name: cls._unpack(packed[name]) for name in names}
 
-    def get_session(self, call_id):
-        session_key = f"session:{call_id}"
-        data = self.redis.get(session_key)
+    def _get_legacy(self, call_id):
+        """Read a whole-blob session written before the hash format."""
+        data = self.redis.get(f"{self.prefix}:{call_id}")
         if data:
+            SESSION_READS.labels(source='legacy').inc()
             try:
                 decrypted = self.cipher.decrypt(data)
                 return json.loads(decrypted.decode())
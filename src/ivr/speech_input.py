@@ -0,0 +1,100 @@
+import time
+from typing import NamedTuple
+from utils.logger import logger
+from utils.resilience import DependencyUnavailable
+from utils.tracing import get_trace, stage
+from stt.providers import recognize, recognize_stream, streaming_engine
+from stt.streaming import drain_audio, eagi_reader
+
+MAX_UTTERANCE_MS = 5000
+# Streaming turns end on the recognizer's endpointing; this is only a safety cap.
+MAX_STREAMING_MS = 10000
+
+class CallerInput(NamedTuple):
+    """One caller turn: the keypad digit pressed, or else the transcript."""
+    digit: str
+    text: str
+    ended_at: float  # time.monotonic() when the caller finished
+
+def is_eagi(agi):
+    """EAGI sessions announce themselves with agi_enhanced: 1.0."""
+    return agi.env.get('agi_enhanced', '0').startswith('1')
+
+def capture_utterance(agi, call_id, tag, recognizer_factory=None, read_chunk=None, budget=None):
+    """
+    Capture one caller utterance and return its transcript ("" if nothing was
+    recognized or STT failed). See capture_input.
+    """
+    return capture_input(agi, call_id, tag, recognizer_factory=recognizer_factory, read_chunk=read_chunk,
+                         budget=budget).text
+
+def capture_input(agi, call_id, tag, keys='', recognizer_factory=None, read_chunk=None, budget=None):
+    """
+    Capture one caller turn: a keypad digit from keys, or an utterance and
+    its transcript ("" if nothing was recognized or STT failed).
+
+    Under EAGI, when the call's context has a streaming STT engine (see
+    stt.providers), the channel audio is streamed straight into the
+    recognizer, which ends the turn at its own end-of-speech detection;
+    recognizer_factory and read_chunk stand in for the engine's recognizer
+    and the audio descriptor in tests. Plain AGI (including FastAGI), and
+    contexts whose engine is local, record a file instead, which is trimmed
+    of silence in memory and removed before recognition by the engine
+    config/speech.yml picks for the call's context and length. A turn whose
+    streaming engine failed to start is recorded too, for the fallback.
+
+    A digit in keys ends the recording, and the turn, without STT. The
+    streamed EAGI audio does not carry digits, so keys only apply to
+    recorded turns.
+
+    The caller's turn on budget starts once they stop speaking; an STT
+    outage raises DependencyUnavailable rather than passing for silence.
+    """
+    trace = get_trace()
+    if trace is not None:
+        trace.new_turn()
+    call_context = trace.call_context if trace is not None else None
+    ended_at = None
+    try:
+        engine = streaming_engine(call_context)
+        tried = ()
+        if (read_chunk is not None or is_eagi(agi)) and (engine or recognizer_factory is not None):
+            if read_chunk is None:
+                drain_audio()
+                read_chunk = eagi_reader()
+            # Recognition runs while the caller speaks, so the whole
+            # utterance is timed as recording.
+            with stage('record'):
+                text = recognize_stream(read_chunk, call_context, budget, MAX_STREAMING_MS, recognizer_factory)
+            if text is not None:
+                if budget is not None:
+                    budget.start_turn()
+                return CallerInput('', text, time.monotonic())
+            tried = (engine,)
+        # NumPy is only loaded by calls that record.
+        from audio_util import discard_recording, load_utterance, recording_path
+        audio_file = recording_path(call_id, tag)
+        try:
+            # Record caller's response (RECORD FILE adds the extension itself).
+            with stage('record'):
+                pressed = agi.record_file(audio_file[:-len('.wav')], "wav", escape_digits="#" + keys,
+                                          timeout=MAX_UTTERANCE_MS, silence=3)
+            ended_at = time.monotonic()
+            if budget is not None:
+                budget.start_turn()
+            if pressed and pressed in keys:
+                return CallerInput(pressed, "", ended_at)
+            with stage('stt'):
+                # Read, deleted and trimmed in memory; silent turns skip STT.
+                utterance = load_utterance(audio_file)
+                if utterance is None or not utterance.has_speech:
+                    return CallerInput('', "", ended_at)
+                text = recognize(utterance.pcm, utterance.sample_rate, call_context, budget=budget, skip=tried)
+                return CallerInput('', text, ended_at)
+        finally:
+            discard_recording(audio_file)  # Left behind if the caller hung up mid-recording
+    except DependencyUnavailable:
+        raise
+    except Exception as stt_err:
+        logger.error(f"STT error: {stt_err}")
+        return CallerInput('', "", ended_at or time.monotonic())
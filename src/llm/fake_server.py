@@ -0,0 +1,123 @@
+"""
+Local stand-in for the chat-completions API, for tests and offline runs.
+
+    server = FakeLLMServer(reply='{"intent": "speak_to_dad", "message": "Putting you through."}')
+    with server:
+        ... point api_endpoint at server.url ...
+
+Requests with "stream": true get the reply as server-sent events, split into
+small deltas spaced token_delay seconds apart; other requests get a normal
+completion after first_token_delay.
+
+For load tests, reply may be a function of the request body,
+first_token_delay a function returning a fresh delay per request, and
+error_rate the fraction of requests answered with error_status instead.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeLLMServer:
+    def __init__(self, reply, host='127.0.0.1', port=0, first_token_delay=0.0,
+                 token_delay=0.0, chars_per_delta=4, error_rate=0.0, error_status=503, seed=None):
+        self.reply = reply
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.chars_per_delta = chars_per_delta
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = []
+        self._random = random.Random(seed)
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _reply_for(self, body):
+        return self.reply(body) if callable(self.reply) else self.reply
+
+    def _delay(self):
+        delay = self.first_token_delay
+        return delay() if callable(delay) else delay
+
+    def _fails(self):
+        return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                server.requests.append(body)
+                time.sleep(server._delay())
+                if server._fails():
+                    self._error()
+                elif body.get('stream'):
+                    self._stream(server._reply_for(body))
+                else:
+                    self._complete(server._reply_for(body))
+
+            def _error(self):
+                payload = json.dumps({"error": {"message": "Injected failure", "type": "server_error"}}).encode()
+                self.send_response(server.error_status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _complete(self, reply):
+                payload = json.dumps({
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": reply},
+                                 "finish_reason": "stop"}]
+                }).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, reply):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                step = server.chars_per_delta
+                for i in range(0, len(reply), step):
+                    if i:
+                        time.sleep(server.token_delay)
+                    chunk = {"choices": [{"index": 0, "delta": {"content": reply[i:i + step]}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
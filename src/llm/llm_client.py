@@ -1,62 +1,434 @@
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+from contextlib import ExitStack, contextmanager
 import requests
 import yaml
 import os
-from ratelimit import limits, sleep_and_retry
+from requests.adapters import HTTPAdapter
+from prometheus_client import Counter, Gauge
 from redis import Redis
 from utils.logger import logger, track_metrics, record_metric
+from utils.admission import Overloaded, slot
+from utils.config_registry import get_config
+from utils.rate_limiter import Rate, RateLimiter
+from utils.resilience import DependencyUnavailable, guarded
+from utils.tracing import stage
+from .prompt_builder import PromptBuilder
+from .response_cache import LLMResponseCache
+from .streaming import iter_sse_deltas
 
-# Define a custom exception for rate limiting
-class TooManyRequests(Exception):
-    pass
+LLM_HTTP_IN_FLIGHT = Gauge(
+    'llm_http_in_flight',
+    'LLM HTTP requests currently waiting on the API',
+    multiprocess_mode='livesum'
+)
+
+LLM_HTTP_POOL_CONNECTIONS = Gauge(
+    'llm_http_pool_connections',
+    'Connections held by the LLM HTTP pool',
+    ['state'],
+    multiprocess_mode='livesum'
+)
+
+LLM_HTTP_POOL_OPENED = Gauge(
+    'llm_http_pool_connections_opened',
+    'Connections opened by the LLM HTTP pool since start (low and flat means keep-alive works)',
+    multiprocess_mode='livesum'
+)
+
+LLM_REQUEST_RETRIES = Counter(
+    'llm_request_retries_total',
+    'LLM API attempts retried',
+    ['reason']
+)
+
+SYSTEM_PROMPT = (
+    "You are a helpful phone assistant. When responding, please format your answer as a JSON object with the following keys: "
+    '{"intent": "your_intent", "message": "Your response message", "next_state": "optional_next_state", "tool_call": "optional_tool_call"}.'
+)
+
+FALLBACK_REPLY = "I'm having trouble connecting. Please try again later."
+
+# Chat history rows stored by the database use "llm" for model turns.
+_ROLE_MAP = {"llm": "assistant"}
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class LLMClientError(requests.exceptions.HTTPError):
+    """A 4xx from the LLM API: the request was at fault, not the service, so the breaker does not count it."""
+
+def _status_error(status, response):
+    """The exception for an unsuccessful status, or None: LLMClientError for 4xx, HTTPError for 5xx."""
+    if status < 400:
+        return None
+    error = LLMClientError if status < 500 else requests.exceptions.HTTPError
+    return error(f"{status} from LLM API", response=response)
+
+class TooManyRequests(Overloaded):
+    """The caller or global LLM rate limit refused the request; the call is shed like an overloaded one."""
+    def __init__(self, reason):
+        super().__init__('llm', reason)
 
 class LLMClient:
-    def __init__(self):
-        with open('config/llm_config.yml') as f:
-            self.config = yaml.safe_load(f)
-        
-        # Override API key with environment variable if set
+    """
+    The single chat-completions client for every call path.
+
+    Requests share one keep-alive connection pool per process, every attempt is
+    bounded by the caller's remaining time, and transient failures are retried
+    with jittered exponential backoff only while that time allows.
+    """
+    def __init__(self, redis_client=None, config_path=None):
+        # config/llm_config.yml via the config registry unless a file is named.
+        if config_path is None:
+            self.config = dict(get_config().llm)
+        else:
+            with open(config_path) as f:
+                self.config = yaml.safe_load(f)
+
+        # Override endpoint and API key with environment variables if set
+        self.config['api_endpoint'] = os.getenv("LLM_API_ENDPOINT", self.config.get('api_endpoint'))
         self.config['api_key'] = os.getenv("LLM_API_KEY", self.config.get('api_key'))
-        
+
         self.headers = {
             "Authorization": f"Bearer {self.config['api_key']}",
             "Content-Type": "application/json"
         }
-        self.redis = Redis(host='localhost', port=6379, db=0)
+        self.timeout = float(self.config.get('timeout_seconds', 8))
+        self.connect_timeout = float(self.config.get('connect_timeout_seconds', 2))
+        self.max_retries = int(self.config.get('max_retries', 2))
+        self.pool_maxsize = int(self.config.get('pool_maxsize', 20))
+
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # Retries are handled here so they respect the deadline; urllib3's own are off.
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=0)
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._async_client = None
+        LLM_HTTP_POOL_CONNECTIONS.labels(state='max').set(self.pool_maxsize)
+
+        # Reuse the caller's Redis pool when one is supplied (e.g. FastAGI workers).
+        self.redis = redis_client or Redis(host='localhost', port=6379, db=0)
+
+        # Bounded prompts; older turns are compacted into a per-caller summary.
+        self.prompt_builder = PromptBuilder(SYSTEM_PROMPT, self.redis, **(self.config.get('prompt_budget') or {}))
+
+        # Cluster-wide limits: per caller, and for the whole API key across workers.
+        limits = self.config.get('rate_limits') or {}
+        caller_limit = limits.get('caller') or {'limit': 5, 'period': 60}
+        global_limit = limits.get('global') or {'limit': 90, 'period': 60}
+        self.caller_rate = Rate(caller_limit['limit'], caller_limit['period'], caller_limit.get('burst'))
+        self.global_rate = Rate(global_limit['limit'], global_limit['period'], global_limit.get('burst'))
+        self.global_lease = int(global_limit.get('lease', 0))
+        self.rate_limiter = RateLimiter(self.redis, prefix='rate_limit')
+
+        cache_config = dict(self.config.get('response_cache') or {})
+        self.response_cache = (
+            LLMResponseCache(self.redis, **cache_config) if cache_config.pop('enabled', False) else None
+        )
+
+    def get_response(self, prompt, timeout=None, budget=None):
+        """
+        Return {"text": <model output>}. The exchange, retries included, is
+        capped by budget's "llm" slice, or by timeout seconds without a budget.
+        Raises DependencyUnavailable while the LLM breaker is open or when the
+        budget is spent, and Overloaded when no cluster-wide LLM slot frees up
+        in time (utils.admission) or a rate limit refuses the request
+        (TooManyRequests). Replies to repeated utterances are served from the
+        response cache without touching the API or the rate limits.
+        """
+        if self.response_cache is not None:
+            cached = self.response_cache.get(prompt)
+            if cached is not None:
+                return cached
+        response = self._complete(prompt, timeout, budget)
+        if self.response_cache is not None:
+            self.response_cache.put(prompt, response)
+        return response
+
+    async def get_response_async(self, prompt, timeout=None, budget=None):
+        """
+        asyncio flavour of get_response, behind the same response cache, LLM
+        slot, breaker, budget and rate limits. The request goes over a pooled
+        httpx client (HTTP/2 when http2 is set in config and the h2 package
+        is available) if httpx is installed; otherwise get_response runs in a
+        worker thread. The Redis round trips, and any wait for a slot or a
+        rate limit token, run in worker threads too.
+        """
+        client = self._get_async_client()
+        if client is None:
+            return await asyncio.to_thread(self.get_response, prompt, timeout, budget)
+        if self.response_cache is not None:
+            cached = await asyncio.to_thread(self.response_cache.get, prompt)
+            if cached is not None:
+                return cached
+        response = await self._complete_async(client, prompt, timeout, budget)
+        if self.response_cache is not None:
+            await asyncio.to_thread(self.response_cache.put, prompt, response)
+        return response
+
+    @contextmanager
+    def _gate(self, prompt, timeout=None, budget=None):
+        """
+        The LLM slot, breaker and rate limits around one request; yields the
+        time the request may take. Connect errors, timeouts and 5xx count as
+        breaker failures; 4xx and rate limit refusals do not.
+        """
+        with slot('llm', budget), guarded('llm', budget, timeout if timeout is not None else self.timeout,
+                                          exclude=(TooManyRequests, LLMClientError)) as timeout:
+            yield self._check_rate_limits(prompt, timeout)
 
-    @sleep_and_retry
-    @limits(calls=90, period=60)  # Global limit: 90 calls per minute (with buffer)
     @track_metrics
-    def get_response(self, prompt):
-        # Cluster-aware rate limiting per caller
-        caller_key = f"rate_limit:{prompt['caller_id']}"
-        current_count = self.redis.incr(caller_key)
-        if current_count == 1:
-            self.redis.expire(caller_key, 60)
-        if current_count > 5:  # 5 calls per minute per caller
-            logger.error(f"Rate limit exceeded for caller {prompt['caller_id']}")
-            raise TooManyRequests("Caller rate limit exceeded")
-        
+    def _complete(self, prompt, timeout=None, budget=None):
         try:
-            response = requests.post(
-                self.config['api_endpoint'],
-                headers=self.headers,
-                json={
-                    "messages": self._format_messages(prompt),
-                    "temperature": self.config.get('temperature', 0.7)
-                }
-            )
-            response.raise_for_status()
+            with self._gate(prompt, timeout, budget) as timeout, stage('llm'):
+                response = self._post(self._payload(prompt), timeout)
+            return self._parse_response(response.json())
+        except requests.exceptions.RequestException as e:
+            logger.error(f"LLM API request failed: {e}")
+            return {"text": FALLBACK_REPLY}
+
+    async def _complete_async(self, client, prompt, timeout=None, budget=None):
+        gate = self._gate(prompt, timeout, budget)
+        try:
+            # The gate may block (slot queue, rate limit), so it is entered and left off the event loop.
+            timeout = await asyncio.to_thread(gate.__enter__)
+            try:
+                with stage('llm'):
+                    response = await self._post_async(client, self._payload(prompt), timeout)
+            except BaseException:
+                if not await asyncio.to_thread(gate.__exit__, *sys.exc_info()):
+                    raise
+            else:
+                await asyncio.to_thread(gate.__exit__, None, None, None)
             return self._parse_response(response.json())
         except requests.exceptions.RequestException as e:
             logger.error(f"LLM API request failed: {e}")
-            return {"text": "I'm having trouble connecting. Please try again later."}
+            return {"text": FALLBACK_REPLY}
+
+    def stream_response(self, prompt, timeout=None, budget=None):
+        """
+        Yield the completion text as it is generated (server-sent events).
+        The deltas are raw model output; llm.streaming.JSONFieldStream extracts
+        the spoken "message" field from them. budget's "llm" slice (or timeout)
+        bounds the wait for the stream to start and any gap between events.
+        If the request fails or the LLM is unavailable, the fallback reply is
+        streamed instead. The request holds an LLM slot until the stream ends.
+        """
+        with ExitStack() as held:
+            try:
+                held.enter_context(slot('llm', budget))
+                with guarded('llm', budget, timeout if timeout is not None else self.timeout,
+                                 exclude=(TooManyRequests, LLMClientError)) as timeout:
+                    timeout = self._check_rate_limits(prompt, timeout)
+                    # Until the stream starts; the rest overlaps playback.
+                    with stage('llm'):
+                        response = self._post(self._payload(prompt, stream=True), timeout, stream=True)
+            except (requests.exceptions.RequestException, DependencyUnavailable) as e:
+                logger.error(f"LLM API streaming request failed: {e}")
+                yield json.dumps({"message": FALLBACK_REPLY})
+                return
+            self._track_in_flight(1)
+            try:
+                with response:
+                    yield from iter_sse_deltas(response.iter_lines())
+            finally:
+                self._track_in_flight(-1)
+
+    def pool_stats(self):
+        """Snapshot of the keep-alive pool, also published as gauges."""
+        opened = idle = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+        stats = {
+            "max": self.pool_maxsize,
+            "in_flight": self._in_flight,
+            "idle": idle,
+            "opened": opened,
+        }
+        LLM_HTTP_POOL_CONNECTIONS.labels(state='idle').set(idle)
+        LLM_HTTP_POOL_OPENED.set(opened)
+        return stats
+
+    def warm(self, timeout=None):
+        """
+        Open a keep-alive connection to the endpoint ahead of the first request,
+        unless one is already idle. Returns True if a connection was opened.
+        """
+        if self.pool_stats()['idle']:
+            return False
+        try:
+            # Any response leaves the connection, TLS included, in the pool.
+            self.session.head(self.config['api_endpoint'], timeout=timeout or self.connect_timeout).close()
+        except requests.exceptions.RequestException as e:
+            logger.debug(f"LLM connection warm-up failed: {e}")
+            return False
+        finally:
+            self.pool_stats()
+        return True
+
+    def close(self):
+        self.session.close()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def _payload(self, prompt, stream=False):
+        payload = {
+            "model": self.config.get('model', 'gpt-4'),
+            "messages": self._format_messages(prompt),
+            "temperature": self.config.get('temperature', 0.7)
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _post(self, payload, timeout=None, stream=False):
+        """POST with per-attempt timeouts carved from one overall deadline."""
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise requests.exceptions.Timeout("LLM request deadline exceeded")
+            self._track_in_flight(1)
+            try:
+                response = self.session.post(
+                    self.config['api_endpoint'],
+                    json=payload,
+                    timeout=(min(self.connect_timeout, remaining), remaining),
+                    stream=stream
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                reason, error = type(e).__name__, e
+            else:
+                error = _status_error(response.status_code, response)
+                if error is None:
+                    return response
+                response.close()
+                if response.status_code not in _RETRY_STATUS:
+                    raise error
+                reason = str(response.status_code)
+            finally:
+                self._track_in_flight(-1)
+                self.pool_stats()
+
+            delay = self._backoff(attempt, deadline)
+            if delay is None or attempt >= self.max_retries:
+                raise error
+            LLM_REQUEST_RETRIES.labels(reason=reason).inc()
+            logger.warning(f"LLM request attempt {attempt + 1} failed ({reason}); retrying in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    async def _post_async(self, client, payload, timeout):
+        """_post over the httpx client, raising the same requests exceptions."""
+        import httpx
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise requests.exceptions.Timeout("LLM request deadline exceeded")
+            self._track_in_flight(1)
+            try:
+                response = await client.post(self.config['api_endpoint'], json=payload, timeout=httpx.Timeout(
+                    remaining, connect=min(self.connect_timeout, remaining)))
+            except httpx.TimeoutException as e:
+                reason, error = 'Timeout', requests.exceptions.Timeout(str(e))
+            except httpx.TransportError as e:
+                reason, error = 'ConnectionError', requests.exceptions.ConnectionError(str(e))
+            else:
+                error = _status_error(response.status_code, response)
+                if error is None:
+                    return response
+                if response.status_code not in _RETRY_STATUS:
+                    raise error
+                reason = str(response.status_code)
+            finally:
+                self._track_in_flight(-1)
+
+            delay = self._backoff(attempt, deadline)
+            if delay is None or attempt >= self.max_retries:
+                raise error
+            LLM_REQUEST_RETRIES.labels(reason=reason).inc()
+            logger.warning(f"LLM request attempt {attempt + 1} failed ({reason}); retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _backoff(self, attempt, deadline, base=0.2, cap=2.0):
+        """Full-jitter backoff, or None if sleeping would leave no time to retry."""
+        delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+        if time.monotonic() + delay >= deadline - 0.05:
+            return None
+        return delay
+
+    def _track_in_flight(self, delta):
+        with self._in_flight_lock:
+            self._in_flight += delta
+            LLM_HTTP_IN_FLIGHT.set(self._in_flight)
+
+    def _get_async_client(self):
+        """The pooled httpx.AsyncClient, or None without httpx."""
+        if self._async_client is None:
+            try:
+                import httpx
+            except ImportError:
+                return None
+            http2 = bool(self.config.get('http2', False))
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    logger.warning("http2 is set but the h2 package is missing; the asyncio client uses HTTP/1.1")
+                    http2 = False
+            self._async_client = httpx.AsyncClient(
+                headers=self.headers,
+                http2=http2,
+                limits=httpx.Limits(max_connections=self.pool_maxsize,
+                                    max_keepalive_connections=self.pool_maxsize),
+            )
+        return self._async_client
+
+    def _check_rate_limits(self, prompt, timeout=None):
+        """
+        Take a caller and a global token in one Redis round trip. Raise
+        TooManyRequests when the caller is over its limit, or when the global
+        limit would not free up within the turn's budget; otherwise wait for
+        it and return the budget left for the request itself.
+        """
+        timeout = timeout if timeout is not None else self.timeout
+        deadline = time.monotonic() + timeout
+        caller_key = f"llm:caller:{prompt['caller_id']}"
+        rules = {caller_key: self.caller_rate, "llm:global": self.global_rate}
+        lease = {"llm:global": self.global_lease} if self.global_lease > 1 else None
+        while True:
+            decision = self.rate_limiter.acquire(rules, lease)
+            if decision.allowed:
+                return max(0.0, deadline - time.monotonic())
+            if decision.limited_key == caller_key:
+                logger.error(f"Rate limit exceeded for caller {prompt['caller_id']}")
+                raise TooManyRequests("caller rate limit exceeded")
+            if time.monotonic() + decision.retry_after >= deadline:
+                logger.error("Global LLM rate limit exceeded")
+                raise TooManyRequests("global rate limit exceeded")
+            time.sleep(decision.retry_after)
 
     def _format_messages(self, prompt):
-        messages = [{"role": "system", "content": "You are a helpful phone assistant."}]
-        for entry in prompt['chat_history']:
-            messages.append({"role": entry['role'], "content": entry['message']})
-        messages.append({"role": "user", "content": prompt['current_input']})
-        return messages
+        return self.prompt_builder.build(prompt, _ROLE_MAP)
 
     def _parse_response(self, response):
         try:
@@ -67,3 +439,17 @@ class LLMClient:
         except (KeyError, IndexError) as e:
             logger.error(f"Error parsing LLM response: {e} - Full response: {response}")
             return {"text": "I'm sorry, I could not understand the response."}
+
+
+if __name__ == "__main__":
+    client = LLMClient()
+    prompt_data = {
+        "caller_id": "+15550000000",
+        "chat_history": [
+            {"role": "user", "content": "I want to speak to my dad."}
+        ],
+        "current_input": ""
+    }
+    resp = client.get_response(prompt_data)
+    print(json.dumps(resp, indent=2))
+    print(json.dumps(client.pool_stats(), indent=2))
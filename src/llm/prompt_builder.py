@@ -0,0 +1,154 @@
+import hashlib
+import json
+import math
+import re
+from prometheus_client import Counter, Histogram
+from utils.logger import logger
+from utils.config_registry import get_config
+from .response_cache import CONTEXT_INTENTS
+
+LLM_PROMPT_TOKENS = Histogram(
+    'llm_prompt_tokens',
+    'Estimated prompt tokens sent per LLM turn',
+    ['call_context'],
+    buckets=(100, 200, 400, 600, 800, 1200, 1600, 2400, 3200, 4800)
+)
+
+LLM_PROMPT_COMPACTIONS = Counter(
+    'llm_prompt_compactions_total',
+    'Turns folded into the rolling summary to stay within the prompt budget',
+    ['call_context']
+)
+
+# Per-message framing the chat APIs add on top of the content.
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_HEADER = "Summary of earlier conversation with this caller:"
+
+_pieces = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text):
+    """
+    Local BPE-style estimate: punctuation marks count as one token, words as
+    one token per four characters (at least one). Close enough for budgeting,
+    without a tokenizer dependency or download.
+    """
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in _pieces.findall(text or ''))
+
+def message_tokens(message):
+    return MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message['content'])
+
+class PromptBuilder:
+    """
+    Builds the chat messages for one LLM turn within a per-context token budget.
+
+    The prompt always starts with the same system message (instructions plus
+    the context's intent names), so providers can reuse its cached prefix.
+    The current utterance and as many recent turns as fit follow. Turns that
+    no longer fit are folded, oldest first, into a rolling summary that is
+    kept in Redis next to the caller's history and sent as a second system
+    message capped at summary_tokens.
+    """
+    prefix = "history"
+
+    def __init__(self, system_prompt, redis_client=None, default_tokens=1200, contexts=None,
+                 summary_tokens=200, summary_line_chars=160, summary_ttl_seconds=30 * 86400):
+        self.system_prompt = system_prompt
+        self.redis = redis_client
+        self.default_tokens = int(default_tokens)
+        self.budgets = {name: int(tokens) for name, tokens in (contexts or {}).items()}
+        self.summary_tokens = int(summary_tokens)
+        self.summary_line_chars = int(summary_line_chars)
+        self.summary_ttl_seconds = int(summary_ttl_seconds)
+
+    def budget(self, call_context):
+        return self.budgets.get(call_context, self.default_tokens)
+
+    def system_message(self, call_context):
+        intents = sorted(get_config().intent_set(CONTEXT_INTENTS.get(call_context, call_context)).intents)
+        content = self.system_prompt
+        if intents:
+            content += f' Valid values for "intent": {", ".join(intents)}.'
+        return {"role": "system", "content": content}
+
+    def build(self, prompt, role_map=None):
+        """Return the messages list for prompt (caller_id, chat_history, current_input, call_context)."""
+        call_context = prompt.get('call_context', 'default')
+        role_map = role_map or {}
+        turns = []
+        for entry in prompt.get('chat_history', []):
+            # Handlers store turns as "content", the database as "message".
+            content = entry.get('content', entry.get('message', ''))
+            turns.append({"role": role_map.get(entry['role'], entry['role']), "content": content})
+        current_input = prompt.get('current_input', '')
+        # Handlers append the current utterance to chat_history as well; don't send it twice.
+        if current_input and (not turns or turns[-1] != {"role": "user", "content": current_input}):
+            turns.append({"role": "user", "content": current_input})
+
+        system = self.system_message(call_context)
+        remaining = self.budget(call_context) - message_tokens(system) - self.summary_tokens
+        kept = []
+        for turn in reversed(turns):
+            cost = message_tokens(turn)
+            # The newest turn is what the model must answer; it always goes in.
+            if kept and cost > remaining:
+                break
+            kept.append(turn)
+            remaining -= cost
+        kept.reverse()
+        older = turns[:len(turns) - len(kept)]
+
+        summary = self._rolled_summary(prompt.get('caller_id'), call_context, older)
+        messages = [system]
+        if summary:
+            messages.append({"role": "system", "content": f"{SUMMARY_HEADER}\n{summary}"})
+        messages.extend(kept)
+        LLM_PROMPT_TOKENS.labels(call_context=call_context).observe(sum(message_tokens(m) for m in messages))
+        return messages
+
+    def summary_key(self, caller_id):
+        return f"{self.prefix}:{caller_id}:summary"
+
+    def _rolled_summary(self, caller_id, call_context, older):
+        """Fold turns not yet summarized into the caller's stored summary and return it."""
+        stored = self._load_summary(caller_id)
+        lines, covered = stored.get('lines', []), stored.get('covered', [])
+        seen = set(covered)
+        new = [turn for turn in older if self._fingerprint(turn) not in seen]
+        if not new:
+            return '\n'.join(lines)
+        LLM_PROMPT_COMPACTIONS.labels(call_context=call_context).inc(len(new))
+        for turn in new:
+            text = ' '.join(turn['content'].split())
+            if len(text) > self.summary_line_chars:
+                text = text[:self.summary_line_chars - 3].rstrip() + '...'
+            lines.append(f"- {turn['role']}: {text}")
+            covered.append(self._fingerprint(turn))
+        # Keep the most recent lines that fit; the oldest detail goes first.
+        limit = self.summary_tokens - MESSAGE_OVERHEAD_TOKENS - estimate_tokens(SUMMARY_HEADER)
+        while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > limit:
+            lines.pop(0)
+        covered = covered[-200:]
+        self._store_summary(caller_id, {'lines': lines, 'covered': covered})
+        return '\n'.join(lines)
+
+    @staticmethod
+    def _fingerprint(turn):
+        return hashlib.sha1(f"{turn['role']}\0{turn['content']}".encode()).hexdigest()[:12]
+
+    def _load_summary(self, caller_id):
+        if self.redis is None or not caller_id:
+            return {}
+        try:
+            raw = self.redis.get(self.summary_key(caller_id))
+            return json.loads(raw) if raw else {}
+        except Exception as e:
+            logger.warning(f"Could not load conversation summary for {caller_id}: {e}")
+            return {}
+
+    def _store_summary(self, caller_id, summary):
+        if self.redis is None or not caller_id:
+            return
+        try:
+            self.redis.setex(self.summary_key(caller_id), self.summary_ttl_seconds, json.dumps(summary))
+        except Exception as e:
+            logger.warning(f"Could not store conversation summary for {caller_id}: {e}")
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from cachetools import TTLCache
+from prometheus_client import Counter
+from utils.logger import logger
+from utils.config_registry import get_config
+
+LLM_CACHE_LOOKUPS = Counter(
+    'llm_response_cache_lookups_total',
+    'LLM response cache lookups by layer and result',
+    ['layer', 'result']
+)
+
+LLM_CACHE_STORES = Counter(
+    'llm_response_cache_stores_total',
+    'LLM responses offered to the cache, by outcome',
+    ['outcome']
+)
+
+# call_context -> intents file the reply is validated against
+CONTEXT_INTENTS = {
+    "caller_allowed": "known",
+    "caller_unknown": "unknown",
+    "internal": "owner",
+}
+
+FILLER_WORDS = {"um", "uh", "erm", "er", "ah", "eh", "hmm", "mm", "oh", "like", "okay", "ok", "so", "well"}
+_FILLER_PHRASES = re.compile(r"\b(you know|i mean|sort of|kind of)\b")
+_non_word = re.compile(r"[^a-z0-9 ]+")
+
+def normalize_transcript(text):
+    """Lowercase, strip punctuation and filler words so near-identical scripts share a key."""
+    text = _non_word.sub(' ', text.lower().replace("'", ''))
+    text = _FILLER_PHRASES.sub(' ', text)
+    return ' '.join(word for word in text.split() if word not in FILLER_WORDS)
+
+class LLMResponseCache:
+    """
+    Two-layer cache for LLM replies: a per-process TTL/LRU dict in front of
+    shared Redis entries, so hot keys never leave the worker and every worker
+    benefits from a reply any of them fetched.
+
+    Keys cover the call context, a hash of that context's intent config (so
+    editing intents invalidates old replies) and the normalized caller turns
+    so far. Only replies that parse as JSON naming a configured intent are
+    stored. Redis entries expire after ttl_seconds and a sorted-set index caps
+    them at max_entries, oldest dropped first.
+    """
+    prefix = "llm_cache"
+
+    def __init__(self, redis_client, ttl_seconds=86400, max_entries=50000,
+                 local_max_entries=1024, local_ttl_seconds=300,
+                 contexts=("caller_unknown", "caller_allowed")):
+        self.redis = redis_client
+        self.ttl_seconds = int(ttl_seconds)
+        self.max_entries = int(max_entries)
+        self.contexts = set(contexts)
+        self._local = TTLCache(maxsize=int(local_max_entries), ttl=int(local_ttl_seconds))
+        self._lock = threading.Lock()
+
+    def _intent_config(self, call_context):
+        """(hash of the context's intents file, its intents) from the config snapshot."""
+        intent_set = get_config().intent_set(CONTEXT_INTENTS.get(call_context, call_context))
+        return intent_set.digest, intent_set.intents
+
+    def key_for(self, prompt):
+        """Cache key for a prompt, or None if this context is not cached."""
+        call_context = prompt.get('call_context')
+        if call_context not in self.contexts:
+            return None
+        turns = [entry.get('content', entry.get('message', ''))
+                 for entry in prompt.get('chat_history', []) if entry.get('role') == 'user']
+        current_input = prompt.get('current_input', '')
+        if current_input and (not turns or turns[-1] != current_input):
+            turns.append(current_input)
+        transcript = ' | '.join(normalize_transcript(turn) for turn in turns)
+        if not transcript.strip(' |'):
+            return None
+        config_hash, _ = self._intent_config(call_context)
+        digest = hashlib.sha256(f"{call_context}\0{config_hash}\0{transcript}".encode()).hexdigest()
+        return f"{self.prefix}:{digest}"
+
+    def get(self, prompt):
+        key = self.key_for(prompt)
+        if key is None:
+            return None
+        with self._lock:
+            response = self._local.get(key)
+        if response is not None:
+            LLM_CACHE_LOOKUPS.labels(layer='local', result='hit').inc()
+            return response
+        LLM_CACHE_LOOKUPS.labels(layer='local', result='miss').inc()
+        try:
+            raw = self.redis.get(key)
+        except Exception as e:
+            logger.warning(f"LLM cache read failed: {e}")
+            return None
+        if raw is None:
+            LLM_CACHE_LOOKUPS.labels(layer='redis', result='miss').inc()
+            return None
+        try:
+            response = json.loads(raw)
+            if not isinstance(response, dict):
+                raise ValueError(f"expected an object, got {type(response).__name__}")
+        except ValueError as e:
+            # A corrupt or truncated entry is a miss; drop it so the reply is fetched and stored again.
+            LLM_CACHE_LOOKUPS.labels(layer='redis', result='corrupt').inc()
+            logger.warning(f"Dropping corrupt LLM cache entry {key}: {e}")
+            try:
+                self.redis.delete(key)
+            except Exception as error:
+                logger.warning(f"LLM cache delete failed: {error}")
+            return None
+        LLM_CACHE_LOOKUPS.labels(layer='redis', result='hit').inc()
+        with self._lock:
+            self._local[key] = response
+        return response
+
+    def put(self, prompt, response):
+        """Store response if it is a well-formed reply naming a configured intent."""
+        key = self.key_for(prompt)
+        if key is None:
+            return False
+        try:
+            structured = json.loads(response.get('text', ''))
+        except (TypeError, ValueError):
+            structured = None
+        _, intents = self._intent_config(prompt['call_context'])
+        if not isinstance(structured, dict) or structured.get('intent') not in intents:
+            LLM_CACHE_STORES.labels(outcome='rejected').inc()
+            return False
+        with self._lock:
+            self._local[key] = response
+        index = f"{self.prefix}:index"
+        try:
+            pipe = self.redis.pipeline()
+            pipe.setex(key, self.ttl_seconds, json.dumps(response))
+            pipe.zadd(index, {key: time.time()})
+            pipe.zcard(index)
+            size = pipe.execute()[-1]
+            if size > self.max_entries:
+                evicted = [member for member, _ in self.redis.zpopmin(index, size - self.max_entries)]
+                if evicted:
+                    self.redis.delete(*evicted)
+        except Exception as e:
+            logger.warning(f"LLM cache write failed: {e}")
+            return False
+        LLM_CACHE_STORES.labels(outcome='stored').inc()
+        return True
@@ -0,0 +1,102 @@
+import json
+import re
+
+def iter_sse_deltas(lines):
+    """
+    Yield content deltas from an OpenAI-style server-sent event stream, given an
+    iterable of raw lines (e.g. response.iter_lines()).
+    """
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            return
+        try:
+            event = json.loads(data)
+            delta = event['choices'][0].get('delta', {}).get('content')
+        except (ValueError, KeyError, IndexError):
+            continue
+        if delta:
+            yield delta
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+class JSONFieldStream:
+    """
+    Incrementally pulls the value of one string field (by default "message")
+    out of a JSON object that is still being generated, so it can be spoken
+    before the object is complete.
+    """
+    def __init__(self, field='message'):
+        self._key = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ''
+        self._pos = None  # Index of the next unread character inside the value
+        self.closed = False
+
+    def feed(self, text):
+        """Add raw JSON text; return the newly decoded part of the field value."""
+        if self.closed:
+            return ''
+        self._buffer += text
+        if self._pos is None:
+            match = self._key.search(self._buffer)
+            if not match:
+                return ''
+            self._pos = match.end()
+        out = []
+        buf = self._buffer
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self.closed = True
+                i += 1
+                break
+            if ch == '\\':
+                if i + 1 >= len(buf):
+                    break  # Escape split across deltas; wait for more
+                esc = buf[i + 1]
+                if esc == 'u':
+                    if i + 6 > len(buf):
+                        break
+                    out.append(chr(int(buf[i + 2:i + 6], 16)))
+                    i += 6
+                    continue
+                out.append(_ESCAPES.get(esc, esc))
+                i += 2
+                continue
+            out.append(ch)
+            i += 1
+        self._pos = i
+        return ''.join(out)
+
+class SentenceSplitter:
+    """
+    Buffers streamed text and releases whole sentences. Sentences shorter than
+    min_chars are held back and merged with the next one so TTS is not asked to
+    render tiny fragments.
+    """
+    _boundary = re.compile(r'(?<=[.!?;:])\s+')
+
+    def __init__(self, min_chars=20):
+        self.min_chars = min_chars
+        self._buffer = ''
+
+    def feed(self, text):
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in self._boundary.finditer(self._buffer):
+            candidate = self._buffer[start:match.start()].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self):
+        rest, self._buffer = self._buffer.strip(), ''
+        return [rest] if rest else []
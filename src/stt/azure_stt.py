@@ -1,10 +1,29 @@
+import functools
 import os
-import azure.cognitiveservices.speech as speechsdk
+from utils.resilience import guarded, wait_with_timeout
+from utils.speech_pool import PooledSpeech, get_pool
 
-def recognize_speech_from_file(audio_file: str) -> str:
+DEFAULT_TIMEOUT = 10
+
+def recognize_speech_from_file(audio_file: str, budget=None) -> str:
     """
     Recognize speech from an audio file using Azure Cognitive Services Speech SDK.
+    The request is bounded by the call's budget slice for "stt" (DEFAULT_TIMEOUT
+    seconds without a budget) and skipped while the STT breaker is open.
+    """
+    with guarded('stt', budget, DEFAULT_TIMEOUT) as timeout:
+        return _recognize(audio_file, timeout)
+
+def recognize_speech_from_pcm(pcm: bytes, sample_rate: int = 16000, budget=None) -> str:
     """
+    Recognize speech from 16-bit mono PCM held in memory (see
+    audio_util.load_utterance), pushed to the SDK without touching disk.
+    Bounded and guarded like recognize_speech_from_file.
+    """
+    with guarded('stt', budget, DEFAULT_TIMEOUT) as timeout:
+        return _recognize_pcm(pcm, sample_rate, timeout)
+
+def _speech_config(speechsdk):
     speech_key = os.environ.get('SPEECH_KEY')
     service_region = os.environ.get('SPEECH_REGION')
     if not speech_key or not service_region:
@@ -12,12 +31,43 @@ def recognize_speech_from_file(audio_file: str) -> str:
 
     speech_config = speechsdk.SpeechConfig(subscription=speech_key, region=service_region)
     speech_config.speech_recognition_language = "en-US"
-    
+    return speech_config
+
+def _recognize(audio_file, timeout):
+    # Imported here so calls that never record don't pay for loading the SDK.
+    import azure.cognitiveservices.speech as speechsdk
     # Use the audio file as input
     audio_input = speechsdk.audio.AudioConfig(filename=audio_file)
-    speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_input)
-    
-    result = speech_recognizer.recognize_once_async().get()
+    speech_recognizer = speechsdk.SpeechRecognizer(speech_config=_speech_config(speechsdk), audio_config=audio_input)
+    return _recognize_once(speechsdk, speech_recognizer, timeout)
+
+def _new_recognizer(sample_rate, timeout):
+    """A recognizer on its own push stream, connected ahead of the turn that will use it."""
+    import azure.cognitiveservices.speech as speechsdk
+    stream = speechsdk.audio.PushAudioInputStream(
+        stream_format=speechsdk.audio.AudioStreamFormat(samples_per_second=sample_rate,
+                                                        bits_per_sample=16, channels=1))
+    recognizer = speechsdk.SpeechRecognizer(speech_config=_speech_config(speechsdk),
+                                            audio_config=speechsdk.audio.AudioConfig(stream=stream))
+    return PooledSpeech((recognizer, stream), speechsdk.Connection.from_recognizer(recognizer)).open(timeout)
+
+def get_recognizer_pool(sample_rate=16000):
+    """
+    This worker's pre-connected recognizers for sample_rate PCM. A recognizer
+    is bound to one audio stream, so each serves a single turn and is
+    replaced in the background.
+    """
+    return get_pool('stt', sample_rate, functools.partial(_new_recognizer, sample_rate), reusable=False)
+
+def _recognize_pcm(pcm, sample_rate, timeout):
+    import azure.cognitiveservices.speech as speechsdk
+    with get_recognizer_pool(sample_rate).lease(timeout) as (recognizer, stream):
+        stream.write(pcm)
+        stream.close()
+        return _recognize_once(speechsdk, recognizer, timeout)
+
+def _recognize_once(speechsdk, speech_recognizer, timeout):
+    result = wait_with_timeout(speech_recognizer.recognize_once_async().get, timeout, "stt")
     if result.reason == speechsdk.ResultReason.RecognizedSpeech:
         return result.text
     elif result.reason == speechsdk.ResultReason.NoMatch:
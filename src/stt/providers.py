@@ -0,0 +1,160 @@
+"""
+Which speech recognizer serves a turn.
+
+config/speech.yml's providers.stt section names an engine per caller
+context: default for most turns, short for utterances of at most
+short_max_seconds (intent phrases, which a local model handles well and
+fast) and fallback for when the chosen engine fails, times out or has its
+breaker open:
+
+    text = recognize(utterance.pcm, utterance.sample_rate, call_context, budget)
+
+Engines take 16-bit mono PCM and are registered in STT_ENGINES; azure is the
+cloud service and vosk an offline model on this box's CPUs.
+
+EAGI turns are streamed to the default engine while the caller speaks if
+it is in STREAMING_ENGINES:
+
+    text = recognize_stream(read_chunk, call_context, budget)
+
+Turns whose default engine cannot stream (the local ones) are recorded and
+go through recognize() instead, so every turn follows speech.yml.
+"""
+from prometheus_client import Counter
+from utils.admission import slot
+from utils.config_registry import get_config
+from utils.logger import logger
+from utils.resilience import DependencyUnavailable, guarded
+from stt import azure_stt, vosk_stt
+from stt.streaming import EAGI_SAMPLE_RATE, AzureStreamingRecognizer, stream_utterance
+
+STT_ENGINE_REQUESTS = Counter(
+    'stt_engine_requests_total',
+    'Utterances sent to each STT engine, and whether it returned a transcript',
+    ['engine', 'result']
+)
+
+DEFAULT_STT = {
+    'default': 'azure',
+    'short': None,
+    'short_max_seconds': 2.0,
+    'fallback': None,
+}
+
+def _azure(pcm, sample_rate, budget):
+    # Cloud recognitions hold a cluster-wide STT slot (utils.admission); when
+    # none frees up in time, Overloaded sends the turn to the fallback engine.
+    with slot('stt', budget):
+        return azure_stt.recognize_speech_from_pcm(pcm, sample_rate, budget=budget)
+
+STT_ENGINES = {
+    'azure': _azure,
+    'vosk': lambda pcm, sample_rate, budget: vosk_stt.recognize_speech_from_pcm(pcm, sample_rate, budget=budget),
+}
+
+def cloud_stream(recognizer_factory):
+    """A streaming engine over recognizer_factory()'s recognizers, guarded like _azure."""
+    def stream(read_chunk, budget, max_duration_ms):
+        # Recognition runs while the caller speaks, so the slot is held for
+        # the whole utterance and only the breaker bounds it.
+        with slot('stt', budget), guarded('stt'):
+            return stream_utterance(read_chunk, recognizer_factory(), max_duration_ms=max_duration_ms)
+    return stream
+
+STREAMING_ENGINES = {
+    'azure': cloud_stream(AzureStreamingRecognizer),
+}
+
+def stt_settings(call_context=None):
+    """providers.stt over DEFAULT_STT, with the call_context's overrides applied."""
+    config = ((get_config().speech or {}).get('providers') or {}).get('stt') or {}
+    settings = dict(DEFAULT_STT)
+    settings.update((key, value) for key, value in config.items() if key != 'contexts')
+    settings.update((config.get('contexts') or {}).get(call_context) or {})
+    return settings
+
+def engines_for(call_context=None, seconds=None):
+    """The engines to try, in order, for an utterance of seconds in call_context."""
+    settings = stt_settings(call_context)
+    candidates = [settings['default'], settings['fallback']]
+    if settings['short'] and seconds is not None and seconds <= float(settings['short_max_seconds']):
+        candidates.insert(0, settings['short'])
+    engines = []
+    for engine in candidates:
+        if engine and engine not in engines:
+            if engine not in STT_ENGINES:
+                raise ValueError(f"Unknown STT engine {engine!r}")
+            engines.append(engine)
+    return engines
+
+def streaming_engine(call_context=None):
+    """call_context's default engine if it can stream turns, else None: its turns are recorded."""
+    engine = stt_settings(call_context)['default']
+    return engine if engine in STREAMING_ENGINES else None
+
+def recognize(pcm: bytes, sample_rate: int = 16000, call_context=None, budget=None, skip=()) -> str:
+    """
+    Transcribe an utterance with the first of its engines that succeeds,
+    leaving out those in skip (already tried this turn). If all fail, an
+    outage (DependencyUnavailable) is raised in preference to any other
+    error so the call can end rather than loop.
+    """
+    errors = []
+    for engine in engines_for(call_context, len(pcm) / 2 / sample_rate):
+        if engine in skip:
+            continue
+        try:
+            text = STT_ENGINES[engine](pcm, sample_rate, budget)
+        except Exception as e:
+            STT_ENGINE_REQUESTS.labels(engine=engine, result='error').inc()
+            logger.warning(f"STT engine {engine} failed: {e}")
+            errors.append(e)
+            continue
+        STT_ENGINE_REQUESTS.labels(engine=engine, result='ok').inc()
+        return text
+    if not errors:
+        raise ValueError(f"No STT engine left for {call_context or 'default'} turns")
+    raise next((e for e in errors if isinstance(e, DependencyUnavailable)), errors[-1])
+
+def recognize_stream(read_chunk, call_context=None, budget=None, max_duration_ms=10000, recognizer_factory=None):
+    """
+    Transcribe an utterance streamed from read_chunk() (EAGI audio) with
+    call_context's streaming engine, or through recognizer_factory()'s
+    recognizers in its place. If the engine fails after audio has been
+    read, that audio goes to the fallback engine. If it fails before, the
+    turn can still be recorded for the fallback: None is returned.
+    """
+    engine = streaming_engine(call_context) or 'azure'
+    stream = STREAMING_ENGINES[engine] if recognizer_factory is None else cloud_stream(recognizer_factory)
+    # The audio is only kept when there is another engine to send it to.
+    fallback = stt_settings(call_context)['fallback'] not in (None, engine)
+    heard = bytearray()
+
+    def read_and_keep():
+        chunk = read_chunk()
+        heard.extend(chunk)
+        return chunk
+
+    try:
+        text = stream(read_and_keep if fallback else read_chunk, budget, max_duration_ms)
+    except Exception as e:
+        STT_ENGINE_REQUESTS.labels(engine=engine, result='error').inc()
+        logger.warning(f"STT engine {engine} failed: {e}")
+        if not fallback:
+            raise
+        if not heard:
+            return None
+        return recognize(bytes(heard), EAGI_SAMPLE_RATE, call_context, budget, skip=(engine,))
+    STT_ENGINE_REQUESTS.labels(engine=engine, result='ok').inc()
+    return text
+
+LOCAL_STT_POOLS = {
+    'vosk': vosk_stt.get_vosk_pool,
+}
+
+def start_local_engines():
+    """Start the pool processes of every local engine some caller context uses."""
+    config = ((get_config().speech or {}).get('providers') or {}).get('stt') or {}
+    engines = {engine for context in [None, *(config.get('contexts') or {})] for engine in engines_for(context, 0)}
+    for engine in sorted(engines & set(LOCAL_STT_POOLS)):
+        LOCAL_STT_POOLS[engine]().start()
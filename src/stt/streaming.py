@@ -0,0 +1,208 @@
+import fcntl
+import os
+import threading
+import time
+from utils.logger import logger
+from utils.speech_pool import PooledSpeech, get_pool
+
+# EAGI hands the channel's inbound audio to the script on file descriptor 3
+# as signed linear 16-bit mono at 8 kHz.
+EAGI_AUDIO_FD = 3
+EAGI_SAMPLE_RATE = 8000
+EAGI_CHUNK_BYTES = 320  # 20 ms of slin
+
+# Endpointing of streamed turns: the pause that ends an utterance, and how
+# long to wait for the caller to start speaking.
+SEGMENTATION_SILENCE_MS = 600
+INITIAL_SILENCE_MS = 5000
+
+def _new_streaming_recognizer(timeout):
+    """A continuous recognizer on an EAGI-rate push stream, connected ahead of the turn that will use it."""
+    speech_key = os.environ.get('SPEECH_KEY')
+    service_region = os.environ.get('SPEECH_REGION')
+    if not speech_key or not service_region:
+        raise ValueError("SPEECH_KEY and SPEECH_REGION must be set in environment variables")
+
+    import azure.cognitiveservices.speech as speechsdk
+    speech_config = speechsdk.SpeechConfig(subscription=speech_key, region=service_region)
+    speech_config.speech_recognition_language = "en-US"
+    speech_config.set_property(speechsdk.PropertyId.Speech_SegmentationSilenceTimeoutMs,
+                               str(SEGMENTATION_SILENCE_MS))
+    speech_config.set_property(speechsdk.PropertyId.SpeechServiceConnection_InitialSilenceTimeoutMs,
+                               str(INITIAL_SILENCE_MS))
+    stream = speechsdk.audio.PushAudioInputStream(stream_format=speechsdk.audio.AudioStreamFormat(
+        samples_per_second=EAGI_SAMPLE_RATE, bits_per_sample=16, channels=1))
+    recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config,
+                                            audio_config=speechsdk.audio.AudioConfig(stream=stream))
+    return PooledSpeech((recognizer, stream), speechsdk.Connection.from_recognizer(recognizer)).open(
+        timeout, continuous=True)
+
+def get_streaming_recognizer_pool():
+    """
+    This worker's pre-connected recognizers for streamed (EAGI) turns. Like
+    stt.azure_stt.get_recognizer_pool, each serves a single turn and is
+    replaced in the background.
+    """
+    return get_pool('stt', 'stream', _new_streaming_recognizer, reusable=False)
+
+class AzureStreamingRecognizer:
+    """
+    Continuous Azure recognition fed from a push stream. Partial hypotheses
+    arrive through `recognizing`; the first non-empty `recognized` result is the
+    service's end-of-utterance decision and finishes the turn. The recognizer
+    and its open connection are taken from pool (the worker's streaming
+    recognizer pool) and handed back by stop().
+    """
+    def __init__(self, pool=None, timeout=None):
+        import azure.cognitiveservices.speech as speechsdk
+        self._sdk = speechsdk
+        self._pool = pool or get_streaming_recognizer_pool()
+        self._item = self._pool.acquire(timeout)
+        self._recognizer, self._stream = self._item.target
+        self.done = threading.Event()
+        self.text = ""
+        self.error = None
+
+    def start(self, on_partial=None, on_final=None):
+        sdk = self._sdk
+
+        def recognizing(evt):
+            if on_partial and evt.result.text:
+                on_partial(evt.result.text)
+
+        def recognized(evt):
+            if evt.result.reason == sdk.ResultReason.RecognizedSpeech and evt.result.text:
+                self.text = evt.result.text
+                if on_final:
+                    on_final(self.text)
+                self.done.set()
+            elif evt.result.reason == sdk.ResultReason.NoMatch:
+                # Initial silence timeout: nobody spoke.
+                self.done.set()
+
+        def canceled(evt):
+            details = evt.cancellation_details
+            if details.reason == sdk.CancellationReason.Error:
+                self.error = f"Speech recognition canceled: {details.reason} - {details.error_details}"
+            self.done.set()
+
+        self._recognizer.recognizing.connect(recognizing)
+        self._recognizer.recognized.connect(recognized)
+        self._recognizer.canceled.connect(canceled)
+        self._recognizer.session_stopped.connect(lambda evt: self.done.set())
+        try:
+            self._recognizer.start_continuous_recognition_async().get()
+        except Exception:
+            self._pool.release(self._item, ok=False)
+            raise
+
+    def write(self, chunk):
+        self._stream.write(chunk)
+
+    def stop(self):
+        try:
+            self._stream.close()
+            self._recognizer.stop_continuous_recognition_async().get()
+        except Exception:
+            self._pool.release(self._item, ok=False)
+            raise
+        self._pool.release(self._item, ok=self.error is None)
+        if self.error:
+            raise Exception(self.error)
+
+class FakeStreamingRecognizer:
+    """
+    Offline stand-in for AzureStreamingRecognizer. Reveals one more word of
+    `transcript` as a partial hypothesis every `bytes_per_word` bytes written and
+    reports the final result once `speech_bytes` have arrived, mimicking the
+    service's endpointing. An empty transcript behaves like silence.
+    """
+    def __init__(self, transcript, speech_bytes=16000, bytes_per_word=3200):
+        self.transcript = transcript
+        self.speech_bytes = speech_bytes
+        self.bytes_per_word = bytes_per_word
+        self.partials = []
+        self.received = 0
+        self.done = threading.Event()
+        self.text = ""
+        self.stopped = False
+        self._on_partial = None
+        self._on_final = None
+
+    def start(self, on_partial=None, on_final=None):
+        self._on_partial = on_partial
+        self._on_final = on_final
+
+    def write(self, chunk):
+        if self.done.is_set():
+            return
+        self.received += len(chunk)
+        words = self.transcript.split()
+        heard = min(len(words), self.received // self.bytes_per_word)
+        if heard and (not self.partials or len(self.partials[-1].split()) < heard):
+            partial = " ".join(words[:heard])
+            self.partials.append(partial)
+            if self._on_partial:
+                self._on_partial(partial)
+        if self.received >= self.speech_bytes:
+            self.text = self.transcript
+            if self.text and self._on_final:
+                self._on_final(self.text)
+            self.done.set()
+
+    def stop(self):
+        self.stopped = True
+
+def drain_audio(fd=EAGI_AUDIO_FD):
+    """
+    Discard audio that queued up on the EAGI descriptor while prompts were
+    playing, so recognition starts from what the caller says next.
+    """
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+    drained = 0
+    try:
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            drained += len(chunk)
+    except BlockingIOError:
+        pass
+    finally:
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags)
+    return drained
+
+def eagi_reader(fd=EAGI_AUDIO_FD, chunk_bytes=EAGI_CHUNK_BYTES):
+    """Return a blocking chunk reader over the EAGI audio descriptor."""
+    return lambda: os.read(fd, chunk_bytes)
+
+def stream_utterance(read_chunk, recognizer, max_duration_ms=10000, sample_rate=EAGI_SAMPLE_RATE):
+    """
+    Pump audio from read_chunk() into the recognizer until it reports the end of
+    the utterance, the audio source ends, or max_duration_ms of audio has been
+    sent as a safety cap. Returns the final transcript ("" for silence).
+    """
+    max_bytes = sample_rate * 2 * max_duration_ms // 1000
+    sent = 0
+    started = time.monotonic()
+    first_partial = []
+
+    def on_partial(text):
+        if not first_partial:
+            first_partial.append(time.monotonic() - started)
+        logger.debug(f"Partial hypothesis: {text}")
+
+    recognizer.start(on_partial=on_partial)
+    try:
+        while not recognizer.done.is_set() and sent < max_bytes:
+            chunk = read_chunk()
+            if not chunk:
+                break
+            recognizer.write(chunk)
+            sent += len(chunk)
+    finally:
+        recognizer.stop()
+    partial_ms = f"{first_partial[0] * 1000:.0f}ms" if first_partial else "n/a"
+    logger.info(f"Streaming STT turn: {sent / (sample_rate * 2):.2f}s audio, first partial {partial_ms}")
+    return recognizer.text
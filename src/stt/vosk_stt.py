@@ -0,0 +1,55 @@
+"""
+Offline speech recognition with Vosk (Kaldi), on the box's own CPUs.
+
+A small Vosk model (vosk-model-small-en-us, about 40 MB) transcribes a short
+intent phrase in a fraction of its duration with no network round trip.
+The model is loaded once in each process of a CPU pool (utils.cpu_pool)
+sized to the cores; config/speech.yml's engines.vosk section gives its
+model_path and workers. Needs `pip install vosk` and a downloaded model.
+"""
+import importlib.util
+import json
+import os
+from utils.config_registry import get_config
+from utils.cpu_pool import get_cpu_pool
+from utils.resilience import guarded
+
+DEFAULT_TIMEOUT = 5
+DEFAULT_MODEL_PATH = '/opt/ivr/models/vosk-model-small-en-us-0.15'
+
+_model = None
+
+def _load_model(model_path):
+    # Runs in each pool process.
+    global _model
+    import vosk
+    vosk.SetLogLevel(-1)
+    _model = vosk.Model(model_path)
+
+def _transcribe(pcm, sample_rate):
+    import vosk
+    recognizer = vosk.KaldiRecognizer(_model, sample_rate)
+    recognizer.AcceptWaveform(pcm)
+    return json.loads(recognizer.FinalResult()).get('text', '')
+
+def engine_settings():
+    settings = ((get_config().speech or {}).get('engines') or {}).get('vosk') or {}
+    return settings.get('model_path') or DEFAULT_MODEL_PATH, settings.get('workers') or 0
+
+def get_vosk_pool():
+    """This worker's Vosk processes; raises RuntimeError if Vosk or its model is missing."""
+    model_path, workers = engine_settings()
+    if importlib.util.find_spec('vosk') is None:
+        raise RuntimeError("The vosk STT engine needs the vosk package (pip install vosk)")
+    if not os.path.isdir(model_path):
+        raise RuntimeError(f"Vosk model not found at {model_path}")
+    return get_cpu_pool('vosk', _load_model, (model_path,), workers)
+
+def recognize_speech_from_pcm(pcm: bytes, sample_rate: int = 16000, budget=None) -> str:
+    """
+    Recognize 16-bit mono PCM with the local Vosk model, within the call's
+    budget slice for "vosk" (DEFAULT_TIMEOUT seconds without a budget).
+    """
+    pool = get_vosk_pool()
+    with guarded('vosk', budget, DEFAULT_TIMEOUT) as timeout:
+        return pool.run(_transcribe, pcm, sample_rate, timeout=timeout)
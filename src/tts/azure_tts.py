@@ -1,26 +1,58 @@
+import functools
 import os
-import azure.cognitiveservices.speech as speechsdk
+from utils.resilience import guarded, wait_with_timeout
+from utils.speech_pool import PooledSpeech, get_pool
 
-def synthesize_speech_to_file(text: str, output_file: str) -> bool:
+DEFAULT_VOICE = "en-US-AvaMultilingualNeural"
+# Asterisk plays .wav as 8 kHz 16-bit mono PCM, so render in that format.
+DEFAULT_FORMAT = "Riff8Khz16BitMonoPcm"
+DEFAULT_TIMEOUT = 4
+
+def synthesize_speech_to_file(text: str, output_file: str, voice: str = DEFAULT_VOICE,
+                              audio_format: str = DEFAULT_FORMAT, budget=None) -> bool:
     """
     Synthesize speech from text using Azure Cognitive Services Speech SDK
-    and save it to an output file.
+    and save it to an output file. The request is bounded by the call's budget
+    slice for "tts" (DEFAULT_TIMEOUT seconds without a budget) and skipped
+    while the TTS breaker is open.
     """
+    with guarded('tts', budget, DEFAULT_TIMEOUT) as timeout:
+        return _synthesize(text, output_file, voice, audio_format, timeout)
+
+def _speech_config(speechsdk, voice, audio_format):
     speech_key = os.environ.get('SPEECH_KEY')
     service_region = os.environ.get('SPEECH_REGION')
     if not speech_key or not service_region:
         raise ValueError("SPEECH_KEY and SPEECH_REGION must be set in environment variables")
     
     speech_config = speechsdk.SpeechConfig(subscription=speech_key, region=service_region)
-    # Choose a neural voice (can be made configurable)
-    speech_config.speech_synthesis_voice_name = "en-US-AvaMultilingualNeural"
-    audio_config = speechsdk.audio.AudioOutputConfig(filename=output_file)
-    synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
-    
-    result = synthesizer.speak_text_async(text).get()
-    if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-        return True
-    elif result.reason == speechsdk.ResultReason.Canceled:
-        cancellation_details = result.cancellation_details
-        raise Exception(f"Speech synthesis canceled: {cancellation_details.reason} - {cancellation_details.error_details}")
+    speech_config.speech_synthesis_voice_name = voice
+    speech_config.set_speech_synthesis_output_format(
+        getattr(speechsdk.SpeechSynthesisOutputFormat, audio_format))
+    return speech_config
+
+def _new_synthesizer(voice, audio_format, timeout):
+    """A connected synthesizer that returns its audio in the result rather than writing a file."""
+    import azure.cognitiveservices.speech as speechsdk
+    synthesizer = speechsdk.SpeechSynthesizer(speech_config=_speech_config(speechsdk, voice, audio_format),
+                                              audio_config=None)
+    return PooledSpeech(synthesizer, speechsdk.Connection.from_speech_synthesizer(synthesizer)).open(timeout)
+
+def get_synthesizer_pool(voice=DEFAULT_VOICE, audio_format=DEFAULT_FORMAT):
+    """This worker's pre-connected synthesizers for a voice and format; each is reused across turns."""
+    return get_pool('tts', (voice, audio_format), functools.partial(_new_synthesizer, voice, audio_format))
+
+def _synthesize(text, output_file, voice, audio_format, timeout):
+    # Imported here so calls that never speak don't pay for loading the SDK.
+    import azure.cognitiveservices.speech as speechsdk
+    with get_synthesizer_pool(voice, audio_format).lease(timeout) as synthesizer:
+        result = wait_with_timeout(synthesizer.speak_text_async(text).get, timeout, "tts")
+        if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
+            # Riff formats carry their WAV header in the audio data.
+            with open(output_file, 'wb') as f:
+                f.write(result.audio_data)
+            return True
+        elif result.reason == speechsdk.ResultReason.Canceled:
+            cancellation_details = result.cancellation_details
+            raise Exception(f"Speech synthesis canceled: {cancellation_details.reason} - {cancellation_details.error_details}")
     return False
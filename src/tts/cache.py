@@ -0,0 +1,167 @@
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from prometheus_client import Counter
+from utils.logger import logger
+from .azure_tts import DEFAULT_FORMAT, DEFAULT_VOICE
+from .providers import synthesize_speech_to_file
+
+TTS_CACHE_LOOKUPS = Counter(
+    'tts_cache_lookups_total',
+    'TTS audio cache lookups',
+    ['result']
+)
+
+TTS_CACHE_EVICTIONS = Counter(
+    'tts_cache_evictions_total',
+    'Audio files evicted from the TTS cache'
+)
+
+# Asterisk must be able to read this directory; STREAM FILE takes absolute paths.
+DEFAULT_CACHE_DIR = os.getenv('TTS_CACHE_DIR', '/var/lib/asterisk/sounds/ivr_tts')
+DEFAULT_MAX_BYTES = int(os.getenv('TTS_CACHE_MAX_MB', 256)) * 1024 * 1024
+# Eviction trims to this fraction of max_bytes, so a full cache is not rescanned on every miss.
+EVICT_TO = 0.9
+# Other workers' writes only show up in a scan; rescan at least this often.
+RESCAN_SECONDS = 300
+
+class TTSCache:
+    """
+    Content-addressed on-disk cache of synthesized prompts.
+
+    Files are named by a hash of (text, voice, format) and sharded into
+    two-character subdirectories. Writes go to a temp file that is renamed into
+    place, so any number of workers can read concurrently without ever seeing a
+    partial file. A hit refreshes the file's mtime and eviction removes the
+    least recently used files once the cache grows past max_bytes.
+
+    The directory is only scanned when that may be due: each worker adds its
+    own writes to the size the last scan found, and scans again once that
+    passes max_bytes or RESCAN_SECONDS have gone by.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 voice=DEFAULT_VOICE, audio_format=DEFAULT_FORMAT, synthesize=synthesize_speech_to_file):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.voice = voice
+        self.audio_format = audio_format
+        self._synthesize = synthesize
+        self._size = None  # Bytes at the last scan plus this process's writes since; None: never scanned
+        self._scanned = 0.0
+        self._size_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(text, voice, audio_format):
+        return hashlib.sha256(f"{voice}\0{audio_format}\0{text}".encode()).hexdigest()
+
+    def path_for(self, text, voice=None, audio_format=None):
+        key = self.key(text, voice or self.voice, audio_format or self.audio_format)
+        return os.path.join(self.cache_dir, key[:2], f"{key}.wav")
+
+    def get(self, text, voice=None, audio_format=None):
+        """Return the cached file for this prompt, or None on a miss."""
+        path = self.path_for(text, voice, audio_format)
+        try:
+            os.utime(path)  # Mark as recently used for LRU eviction
+        except FileNotFoundError:
+            TTS_CACHE_LOOKUPS.labels(result='miss').inc()
+            return None
+        TTS_CACHE_LOOKUPS.labels(result='hit').inc()
+        return path
+
+    def synthesize(self, text, voice=None, audio_format=None, budget=None):
+        """
+        Return a playable file for text, rendering and caching it on a miss
+        (within budget's "tts" slice, when given).
+        """
+        path = self.get(text, voice, audio_format)
+        if path:
+            return path
+        voice = voice or self.voice
+        audio_format = audio_format or self.audio_format
+        path = self.path_for(text, voice, audio_format)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.wav')
+        os.close(fd)
+        try:
+            options = {'budget': budget} if budget is not None else {}
+            if not self._synthesize(text, tmp_path, voice=voice, audio_format=audio_format, **options):
+                raise Exception(f"Speech synthesis produced no audio for: {text!r}")
+            os.chmod(tmp_path, 0o644)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self._added(size)
+        return path
+
+    def _added(self, size):
+        """Count a new file and evict if the cache may have outgrown max_bytes."""
+        with self._size_lock:
+            if self._size is not None:
+                self._size += size
+            due = (self._size is None or self._size > self.max_bytes
+                   or time.monotonic() - self._scanned > RESCAN_SECONDS)
+        if due:
+            self.evict()
+
+    def _entries(self):
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.wav') and not entry.name.startswith('.'):
+                    stat = entry.stat()
+                    yield stat.st_mtime, stat.st_size, entry.path
+
+    def evict(self):
+        """
+        Trim the cache to EVICT_TO of max_bytes once it is over max_bytes,
+        oldest first. Only one process evicts at a time; others skip rather
+        than wait.
+        """
+        lock_path = os.path.join(self.cache_dir, '.evict.lock')
+        with open(lock_path, 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * EVICT_TO if total > self.max_bytes else total
+            removed = 0
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    continue
+                total -= size
+                removed += 1
+            with self._size_lock:
+                self._size, self._scanned = total, time.monotonic()
+            if removed:
+                TTS_CACHE_EVICTIONS.inc(removed)
+                logger.info(f"Evicted {removed} file(s) from TTS cache {self.cache_dir}")
+            return removed
+
+_lock = threading.Lock()
+_cache = None
+
+def get_tts_cache():
+    """Process-wide TTSCache using the TTS_CACHE_* environment settings."""
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = TTSCache()
+        return _cache
@@ -0,0 +1,119 @@
+"""
+Offline speech synthesis on the box's own CPUs.
+
+Two engines, both configured under config/speech.yml's engines section:
+
+  piper   a small neural voice (ONNX), loaded once in each process of a CPU
+          pool (utils.cpu_pool) sized to the cores. Needs `pip install
+          piper-tts` and a voice model (<voice>.onnx and its .onnx.json) in
+          model_dir.
+  espeak  the espeak-ng formant synthesizer, run as a subprocess with at
+          most one process per core. Needs the espeak-ng binary.
+
+Both write the 8 kHz 16-bit mono WAV that Asterisk plays, whatever rate the
+engine renders at.
+"""
+import importlib.util
+import io
+import os
+import shutil
+import subprocess
+import threading
+import wave
+from utils.config_registry import get_config
+from utils.cpu_pool import default_workers, get_cpu_pool
+from utils.resilience import guarded
+
+DEFAULT_TIMEOUT = 4
+OUTPUT_RATE = 8000
+# The only format Asterisk plays from .wav, and the one Azure is asked for.
+SUPPORTED_FORMAT = "Riff8Khz16BitMonoPcm"
+DEFAULT_ENGINES = {
+    'piper': {'model_dir': '/opt/ivr/models/piper', 'voice': 'en_US-lessac-low', 'workers': 0},
+    'espeak': {'executable': 'espeak-ng', 'voice': 'en-us', 'workers': 0},
+}
+
+def engine_settings(engine):
+    settings = dict(DEFAULT_ENGINES[engine])
+    settings.update(((get_config().speech or {}).get('engines') or {}).get(engine) or {})
+    return settings
+
+def _write_wav(output_file, data):
+    # NumPy and the resampler are only loaded by calls that synthesize locally.
+    from audio_util import parse_wav, resample
+    samples, sample_rate = parse_wav(data)
+    samples = resample(samples, sample_rate, OUTPUT_RATE)
+    with wave.open(output_file, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(OUTPUT_RATE)
+        out.writeframes(samples.astype('<i2').tobytes())
+
+def _check_format(audio_format):
+    if audio_format != SUPPORTED_FORMAT:
+        raise ValueError(f"Local TTS only renders {SUPPORTED_FORMAT}, not {audio_format}")
+
+# --- piper ----------------------------------------------------------------
+
+_voice = None
+
+def _load_voice(model_path):
+    # Runs in each pool process.
+    global _voice
+    from piper import PiperVoice
+    _voice = PiperVoice.load(model_path)
+
+def _render_piper(text):
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as wav_file:
+        # piper-tts 1.3 renamed synthesize() to synthesize_wav().
+        (getattr(_voice, 'synthesize_wav', None) or _voice.synthesize)(text, wav_file)
+    return out.getvalue()
+
+def get_piper_pool(voice):
+    """This worker's piper processes for voice; raises RuntimeError if piper or the model is missing."""
+    settings = engine_settings('piper')
+    model_path = os.path.join(settings['model_dir'], f"{voice}.onnx")
+    if importlib.util.find_spec('piper') is None:
+        raise RuntimeError("The piper TTS engine needs the piper-tts package (pip install piper-tts)")
+    if not os.path.isfile(model_path):
+        raise RuntimeError(f"Piper voice not found at {model_path}")
+    return get_cpu_pool('piper', _load_voice, (model_path,), settings['workers'])
+
+def synthesize_piper(text, output_file, voice, audio_format=SUPPORTED_FORMAT, budget=None):
+    _check_format(audio_format)
+    pool = get_piper_pool(voice)
+    with guarded('piper', budget, DEFAULT_TIMEOUT) as timeout:
+        data = pool.run(_render_piper, text, timeout=timeout)
+    _write_wav(output_file, data)
+    return True
+
+# --- espeak-ng ------------------------------------------------------------
+
+_espeak_lock = threading.Lock()
+_espeak_slots = None
+
+def _espeak_slot():
+    global _espeak_slots
+    with _espeak_lock:
+        if _espeak_slots is None:
+            _espeak_slots = threading.BoundedSemaphore(int(engine_settings('espeak')['workers']) or default_workers())
+        return _espeak_slots
+
+def synthesize_espeak(text, output_file, voice, audio_format=SUPPORTED_FORMAT, budget=None):
+    _check_format(audio_format)
+    executable = shutil.which(engine_settings('espeak')['executable'])
+    if executable is None:
+        raise RuntimeError("The espeak TTS engine needs espeak-ng installed")
+    slots = _espeak_slot()
+    with guarded('espeak', budget, DEFAULT_TIMEOUT) as timeout:
+        if not slots.acquire(timeout=timeout):
+            raise TimeoutError(f"espeak busy for {timeout:.2f}s")
+        try:
+            # Text on stdin, so it is never parsed as an option.
+            result = subprocess.run([executable, '-v', voice, '--stdin', '--stdout'], input=text.encode(),
+                                    capture_output=True, timeout=timeout, check=True)
+        finally:
+            slots.release()
+    _write_wav(output_file, result.stdout)
+    return True
@@ -0,0 +1,115 @@
+"""
+Which speech synthesizer renders a prompt.
+
+A voice names its engine: "piper:<model>" and "espeak:<voice>" are local
+engines (tts.local_tts), and anything else is an Azure voice name. The TTS
+cache keys files by voice, so each engine's audio is cached separately.
+
+config/speech.yml's providers.tts section names an engine per caller
+context, and a fallback for when it fails, times out or has its breaker
+open; voices_for(call_context) turns those into voices in the order to try.
+"""
+from prometheus_client import Counter
+from utils.config_registry import get_config
+from utils.logger import logger
+from utils.resilience import DependencyUnavailable
+from . import azure_tts, local_tts
+from .azure_tts import DEFAULT_FORMAT, DEFAULT_VOICE
+
+TTS_ENGINE_REQUESTS = Counter(
+    'tts_engine_requests_total',
+    'Texts sent to each TTS engine, and whether it returned audio',
+    ['engine', 'result']
+)
+
+DEFAULT_TTS = {
+    'default': 'azure',
+    'fallback': None,
+}
+
+LOCAL_TTS_ENGINES = {
+    'piper': local_tts.synthesize_piper,
+    'espeak': local_tts.synthesize_espeak,
+}
+
+def engine_of(voice):
+    engine, sep, _ = voice.partition(':')
+    return engine if sep else 'azure'
+
+def voice_for(engine):
+    """The configured voice of engine."""
+    if engine == 'azure':
+        settings = ((get_config().speech or {}).get('engines') or {}).get('azure') or {}
+        return settings.get('voice') or DEFAULT_VOICE
+    if engine not in LOCAL_TTS_ENGINES:
+        raise ValueError(f"Unknown TTS engine {engine!r}")
+    return f"{engine}:{local_tts.engine_settings(engine)['voice']}"
+
+def tts_settings(call_context=None):
+    """providers.tts over DEFAULT_TTS, with the call_context's overrides applied."""
+    config = ((get_config().speech or {}).get('providers') or {}).get('tts') or {}
+    settings = dict(DEFAULT_TTS)
+    settings.update((key, value) for key, value in config.items() if key != 'contexts')
+    settings.update((config.get('contexts') or {}).get(call_context) or {})
+    return settings
+
+def voices_for(call_context=None):
+    """The voices to try, in order, for prompts in call_context."""
+    settings = tts_settings(call_context)
+    voices = []
+    for engine in (settings['default'], settings['fallback']):
+        if engine and voice_for(engine) not in voices:
+            voices.append(voice_for(engine))
+    return voices
+
+def all_voices():
+    """Every voice some caller context may use, for pre-rendering prompts."""
+    config = ((get_config().speech or {}).get('providers') or {}).get('tts') or {}
+    contexts = [None, *(config.get('contexts') or {})]
+    return list(dict.fromkeys(voice for context in contexts for voice in voices_for(context)))
+
+def synthesize_speech_to_file(text: str, output_file: str, voice: str = DEFAULT_VOICE,
+                              audio_format: str = DEFAULT_FORMAT, budget=None) -> bool:
+    """Render text to output_file with the engine voice names."""
+    engine = engine_of(voice)
+    try:
+        if engine == 'azure':
+            ok = azure_tts.synthesize_speech_to_file(text, output_file, voice, audio_format, budget=budget)
+        elif engine in LOCAL_TTS_ENGINES:
+            ok = LOCAL_TTS_ENGINES[engine](text, output_file, voice.partition(':')[2], audio_format, budget=budget)
+        else:
+            raise ValueError(f"Unknown TTS engine {engine!r}")
+    except Exception:
+        TTS_ENGINE_REQUESTS.labels(engine=engine, result='error').inc()
+        raise
+    TTS_ENGINE_REQUESTS.labels(engine=engine, result='ok' if ok else 'error').inc()
+    return ok
+
+def with_fallback(render, voices):
+    """
+    render(voice) with each voice in turn until one succeeds. If all fail, an
+    outage (DependencyUnavailable) is raised in preference to other errors.
+    """
+    errors = []
+    for voice in voices:
+        try:
+            return render(voice)
+        except Exception as e:
+            if voice != voices[-1]:
+                logger.warning(f"TTS with {voice} failed, falling back: {e}")
+            errors.append(e)
+    raise next((e for e in errors if isinstance(e, DependencyUnavailable)), errors[-1])
+
+def synthesize_for_context(text, output_file, call_context=None, budget=None):
+    """Render text to output_file with call_context's voices, falling back as configured."""
+    def render(voice):
+        if not synthesize_speech_to_file(text, output_file, voice, budget=budget):
+            raise Exception(f"Speech synthesis produced no audio for: {text!r}")
+        return True
+    return with_fallback(render, voices_for(call_context))
+
+def start_local_engines():
+    """Start the pool processes of every local engine voice some caller context uses."""
+    for voice in all_voices():
+        if engine_of(voice) == 'piper':
+            local_tts.get_piper_pool(voice.partition(':')[2]).start()
@@ -0,0 +1,277 @@
+"""
+Cluster-wide admission control for the call path's expensive dependencies
+(the LLM and cloud STT), configured in config/resilience.yml (admission).
+
+Each dependency has a fixed number of slots shared by every worker through
+Redis, and a request holds one while it runs:
+
+    with slot('llm', budget):
+        response = post(...)
+
+A request that finds every slot taken waits in a short first-come,
+first-served queue (at most max_queue waiters, for at most queue_seconds
+or what is left of the turn) and is then shed with Overloaded. Calls in a
+priority context (the owner's) skip the queue and may also take the
+reserved slots no other call can.
+
+New calls are shed before they start: shed_flow() sends a call whose
+context has a shed flow to it once any dependency's slots are shed_at full,
+so the calls already in progress keep their turn latency. A call shed
+mid-conversation (Overloaded) finishes on the same flow.
+
+Holders and waiters are Redis sorted sets scored by time, so a slot held by
+a worker that died is reclaimed after slot_ttl_seconds. Without Redis, or
+while it is down, admission fails open, like the rate limiter.
+"""
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram
+from utils.config_registry import get_config
+from utils.logger import logger
+from utils.resilience import DependencyUnavailable
+from utils.tracing import OTHER_CONTEXT, get_trace
+
+ADMISSION_SLOTS = Gauge(
+    'admission_slots',
+    'Cluster-wide slots per dependency as last seen by this worker (in_use, queued, limit)',
+    ['dependency', 'state'],
+    multiprocess_mode='livemax'
+)
+
+ADMISSION_QUEUE_WAIT = Histogram(
+    'admission_queue_wait_seconds',
+    'Time requests waited for a slot, by whether they got one',
+    ['dependency', 'result'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4)
+)
+
+ADMISSION_SHED = Counter(
+    'admission_shed_total',
+    'Calls sent to their shed flow (load) and requests refused a slot (queue_full, queue_timeout)',
+    ['dependency', 'call_context', 'reason']
+)
+
+DEFAULT_ADMISSION = {
+    'slots': {},
+    'reserved': 0,
+    'priority_contexts': ['internal'],
+    'queue_seconds': 1.0,
+    'max_queue': 20,
+    'slot_ttl_seconds': 60,
+    'poll_seconds': 0.05,
+    'shed_at': 0.9,
+    'shed_flows': {},
+}
+
+# Take a slot for ARGV[1] if one is free, counting the waiters queued ahead
+# of it (none for priority requests, which may also use the reserved slots).
+# Otherwise queue it, unless the queue is full. Returns {status, in use,
+# queued}: status 1 granted, 0 queued, -1 refused. Expired holders and
+# abandoned waiters are dropped first, on Redis' own clock.
+ACQUIRE_SCRIPT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local token, limit, reserved = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+local priority, slot_ttl, queue_ttl = tonumber(ARGV[4]), tonumber(ARGV[5]), tonumber(ARGV[6])
+local max_queue = tonumber(ARGV[7])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - queue_ttl)
+local used = redis.call('ZCARD', KEYS[1])
+local queued = redis.call('ZCARD', KEYS[2])
+local rank = false
+local ahead, cap = 0, limit
+if priority == 0 then
+  cap = limit - reserved
+  rank = redis.call('ZRANK', KEYS[2], token)
+  ahead = rank or queued
+end
+if used + ahead < cap then
+  redis.call('ZADD', KEYS[1], now + slot_ttl, token)
+  redis.call('PEXPIRE', KEYS[1], slot_ttl)
+  if rank then
+    redis.call('ZREM', KEYS[2], token)
+    queued = queued - 1
+  end
+  return {1, used + 1, queued}
+end
+if priority == 0 and not rank then
+  if queued >= max_queue then return {-1, used, queued} end
+  redis.call('ZADD', KEYS[2], now, token)
+  redis.call('PEXPIRE', KEYS[2], queue_ttl)
+  queued = queued + 1
+end
+return {0, used, queued}
+"""
+
+USAGE_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+return {redis.call('ZCOUNT', KEYS[1], now, '+inf'), redis.call('ZCOUNT', KEYS[2], now - tonumber(ARGV[1]), '+inf')}
+"""
+
+class Overloaded(DependencyUnavailable):
+    """Every slot of a dependency stayed taken: the request was shed instead of queued longer."""
+
+class SlotPool:
+    """
+    limit concurrent requests to one dependency across the cluster, kept in
+    the sorted sets <prefix>:<dependency>:holders and :queue.
+    """
+    def __init__(self, redis_client, dependency, limit, reserved=0, queue_seconds=1.0, max_queue=20,
+                 slot_ttl_seconds=60, poll_seconds=0.05, prefix='admission'):
+        self.redis = redis_client
+        self.dependency = dependency
+        self.limit = int(limit)
+        self.reserved = min(int(reserved), self.limit - 1)
+        self.queue_seconds = float(queue_seconds)
+        self.max_queue = int(max_queue)
+        self.slot_ttl_ms = int(float(slot_ttl_seconds) * 1000)
+        self.poll_seconds = float(poll_seconds)
+        # Waiters that stop polling (a dead worker) drop out after this.
+        self.queue_ttl_ms = int((self.queue_seconds + 1) * 1000)
+        self.keys = [f"{prefix}:{dependency}:holders", f"{prefix}:{dependency}:queue"]
+        self._acquire = redis_client.register_script(ACQUIRE_SCRIPT)
+        self._usage = redis_client.register_script(USAGE_SCRIPT)
+        ADMISSION_SLOTS.labels(dependency=dependency, state='limit').set(self.limit)
+
+    def acquire(self, priority=False, wait=None, call_context=OTHER_CONTEXT):
+        """
+        Take a slot, waiting up to wait seconds (default queue_seconds) for
+        one. Returns the token to release(), or None if Redis could not be
+        reached. Raises Overloaded if no slot became free.
+        """
+        token = uuid.uuid4().hex
+        wait = self.queue_seconds if wait is None else min(wait, self.queue_seconds)
+        started = time.monotonic()
+        deadline = started + wait
+        args = [token, self.limit, self.reserved, 1 if priority else 0, self.slot_ttl_ms, self.queue_ttl_ms,
+                self.max_queue]
+        while True:
+            try:
+                status, used, queued = (int(value) for value in self._acquire(keys=self.keys, args=args))
+            except Exception as e:
+                logger.warning(f"Admission control unavailable, allowing {self.dependency} request: {e}")
+                return None
+            self._publish(used, queued)
+            if status == 1:
+                ADMISSION_QUEUE_WAIT.labels(dependency=self.dependency, result='admitted').observe(
+                    time.monotonic() - started)
+                return token
+            reason = 'queue_full' if status < 0 else 'queue_timeout'
+            if status < 0 or time.monotonic() + self.poll_seconds >= deadline:
+                self._leave_queue(token)
+                ADMISSION_QUEUE_WAIT.labels(dependency=self.dependency, result='shed').observe(
+                    time.monotonic() - started)
+                ADMISSION_SHED.labels(dependency=self.dependency, call_context=call_context, reason=reason).inc()
+                raise Overloaded(self.dependency, f"{used} of {self.limit} slots in use, {queued} queued")
+            time.sleep(self.poll_seconds)
+
+    def release(self, token):
+        if token is None:
+            return
+        try:
+            self.redis.zrem(self.keys[0], token)
+        except Exception as e:
+            # The slot expires with slot_ttl_seconds instead.
+            logger.warning(f"Could not release {self.dependency} slot: {e}")
+
+    def usage(self):
+        """(slots in use, requests queued) across the cluster; (0, 0) without Redis."""
+        try:
+            used, queued = (int(value) for value in self._usage(keys=self.keys, args=[self.queue_ttl_ms]))
+        except Exception as e:
+            logger.warning(f"Admission control unavailable: {e}")
+            return 0, 0
+        self._publish(used, queued)
+        return used, queued
+
+    def _leave_queue(self, token):
+        try:
+            self.redis.zrem(self.keys[1], token)
+        except Exception:
+            pass
+
+    def _publish(self, used, queued):
+        ADMISSION_SLOTS.labels(dependency=self.dependency, state='in_use').set(used)
+        ADMISSION_SLOTS.labels(dependency=self.dependency, state='queued').set(queued)
+
+_lock = threading.Lock()
+_pools = {}
+_redis = None
+_overrides = {}
+
+def configure_admission(redis_client, **overrides):
+    """
+    Share slots through redis_client; pools are rebuilt on next use.
+    overrides replace admission settings from the config (load tests).
+    """
+    global _redis, _overrides
+    with _lock:
+        _redis = redis_client
+        _overrides = overrides
+        _pools.clear()
+
+def admission_settings():
+    """The admission section of config/resilience.yml over DEFAULT_ADMISSION."""
+    settings = dict(DEFAULT_ADMISSION)
+    settings.update((get_config().resilience or {}).get('admission') or {})
+    settings.update(_overrides)
+    return settings
+
+def get_slot_pool(dependency):
+    """The process-wide SlotPool for dependency; None if it has no slot limit or there is no Redis."""
+    if dependency in _pools:
+        return _pools[dependency]
+    with _lock:
+        if dependency not in _pools:
+            settings = admission_settings()
+            limit = int((settings['slots'] or {}).get(dependency) or 0)
+            _pools[dependency] = SlotPool(
+                _redis, dependency, limit, settings['reserved'], settings['queue_seconds'], settings['max_queue'],
+                settings['slot_ttl_seconds'], settings['poll_seconds']) if limit and _redis is not None else None
+        return _pools[dependency]
+
+def _call_context():
+    trace = get_trace()
+    return trace.call_context if trace is not None else OTHER_CONTEXT
+
+@contextmanager
+def slot(dependency, budget=None):
+    """
+    Hold one of dependency's slots for the with-block. The wait for a slot
+    leaves the budget at least its minimum slice for the request itself.
+    """
+    pool = get_slot_pool(dependency)
+    if pool is None:
+        yield
+        return
+    call_context = _call_context()
+    wait = None if budget is None else max(0.0, budget.remaining() - budget.min_slice_seconds)
+    token = pool.acquire(call_context in admission_settings()['priority_contexts'], wait, call_context)
+    try:
+        yield
+    finally:
+        pool.release(token)
+
+def shed_flow(call_context, force=False):
+    """
+    The flow a new call in call_context should run instead of its own, or
+    None to run its own: with force, whenever one is configured; otherwise
+    only while some dependency has shed_at of its slots in use or queued for.
+    """
+    settings = admission_settings()
+    flow = (settings['shed_flows'] or {}).get(call_context)
+    if flow is None or force:
+        return flow
+    for dependency in settings['slots'] or {}:
+        pool = get_slot_pool(dependency)
+        if pool is None:
+            continue
+        used, queued = pool.usage()
+        if used + queued >= float(settings['shed_at']) * pool.limit:
+            ADMISSION_SHED.labels(dependency=dependency, call_context=call_context, reason='load').inc()
+            return flow
+    return None
@@ -0,0 +1,27 @@
+"""
+Validate config/*.yml and refresh the fast-load config snapshot. Run at
+deploy time, from the repository root:
+
+    PYTHONPATH=src python -m utils.check_config
+"""
+import sys
+from utils.logger import logger
+from utils.config_registry import SNAPSHOT_FILE, ConfigRegistry
+
+def main():
+    """Exit 1 if any config file fails to parse or validate."""
+    try:
+        # No snapshot path: always parse the YAML, never trust an existing snapshot file.
+        registry = ConfigRegistry(snapshot_path=None)
+    except Exception as e:
+        logger.error(f"Invalid configuration: {e}")
+        return 1
+    snapshot = registry.get()
+    registry.snapshot_path = SNAPSHOT_FILE
+    registry.save_snapshot(snapshot)
+    logger.info(f"Configuration OK: {len(snapshot.fingerprint)} files, "
+                f"{sum(len(s.intents) for s in snapshot.intents.values())} intents")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,562 @@
+"""
+One place to read config/*.yml.
+
+The registry parses and validates every config file once into an immutable
+ConfigSnapshot and hands the same snapshot to every caller:
+
+    from utils.config_registry import get_config
+    intents = get_config().intent_set("known").intents
+
+File stamps are re-checked at most every check_interval seconds; a change
+rebuilds the whole snapshot and swaps it in atomically. A bad edit (YAML or
+validation error) is logged and counted, and the last good snapshot keeps
+serving until the files are fixed.
+
+Validated snapshots are also stored next to the config, as msgpack of the
+plain data, so a fresh worker skips YAML parsing when nothing changed;
+utils.check_config validates the config and refreshes that file at deploy
+time.
+"""
+import glob
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass, field, fields, is_dataclass
+from typing import Optional, Tuple
+import msgpack
+import yaml
+from prometheus_client import Counter, Gauge, Histogram
+from utils.logger import logger
+
+SNAPSHOT_FILE = os.getenv('CONFIG_SNAPSHOT_FILE', 'config/.config_snapshot.msgpack')
+CHECK_INTERVAL = float(os.getenv('CONFIG_CHECK_INTERVAL', '5'))
+
+# Bump when the snapshot classes change so stale snapshot files are ignored.
+SNAPSHOT_FORMAT = 7
+
+# libyaml's loader is several times faster when PyYAML was built with it.
+_Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+CONFIG_LOAD_SECONDS = Histogram(
+    'config_load_seconds',
+    'Time to build the config snapshot',
+    ['source']
+)
+
+CONFIG_RELOADS = Counter(
+    'config_reloads_total',
+    'Config reloads triggered by a file change',
+    ['result']
+)
+
+CONFIG_LAST_LOAD = Gauge(
+    'config_last_load_timestamp_seconds',
+    'Unix time the active config snapshot was loaded (oldest across live processes)',
+    multiprocess_mode='livemin'
+)
+
+class ConfigError(ValueError):
+    pass
+
+class FrozenDict(dict):
+    """Read-only dict that still pickles and compares like a dict."""
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("config snapshots are read-only")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+@dataclass(frozen=True)
+class Intent:
+    name: str
+    prompt: Optional[str] = None
+    extension: Optional[str] = None
+    action: Optional[str] = None
+    tool_call: Optional[str] = None
+    phrases: Tuple[str, ...] = ()
+    keywords: Tuple[str, ...] = ()
+    dtmf: Optional[str] = None  # Keypad digit that picks this intent
+    menu: Optional[str] = None  # How the keypad menu names it
+
+@dataclass(frozen=True)
+class IntentSet:
+    caller_type: str
+    intents: FrozenDict = field(default_factory=FrozenDict)
+    fast_path_threshold: Optional[float] = None
+    digest: str = "none"  # Changes whenever the file's content does
+    keypad: FrozenDict = field(default_factory=FrozenDict)  # Digit -> intent name
+    menu: Optional[str] = None  # The keypad menu as spoken, if any intent has a digit
+
+# Digits an intent may take; # ends a recording.
+DTMF_DIGITS = '0123456789*'
+
+# Call-flow actions (src/ivr/flow_engine.py) and the outcomes each can end
+# with; None is a state that only plays its prompt.
+FLOW_ACTIONS = {
+    None: ('next',),
+    'greet': ('next',),
+    'listen': ('speech', 'silence'),
+    'classify': ('transfer', 'hangup', 'unhandled', 'unclear', 'unparseable'),
+    'owner_reply': ('next',),
+    'transfer': (),
+    'hangup': (),
+    'keypad': ('pressed', 'silence'),
+}
+FLOW_ACTION_NAMES = tuple(FLOW_ACTIONS)
+FLOW_OUTCOMES = tuple(dict.fromkeys(outcome for outcomes in FLOW_ACTIONS.values() for outcome in outcomes))
+END_OF_FLOW = -1
+
+@dataclass(frozen=True)
+class CallFlowSpec:
+    """
+    One flow from config/call_flows.yml compiled to integer-indexed tables:
+    state i plays prompts[i], runs FLOW_ACTION_NAMES[actions[i]] and moves
+    to transitions[i][outcome index] (END_OF_FLOW ends the call), or to
+    exhausted[i] once it has been entered max_visits[i] times (0: no limit).
+    A transfer or hangup state acts on state_intents[i] unless the flow got
+    there from classify. A listen state with keypad[i] also takes the
+    intents' keypad digits.
+    """
+    name: str
+    intents: Optional[str]
+    start: int
+    states: Tuple[str, ...]
+    prompts: Tuple[Optional[str], ...]
+    greetings: Tuple[Optional[str], ...]
+    actions: Tuple[int, ...]
+    transitions: Tuple[Tuple[int, ...], ...]
+    max_visits: Tuple[int, ...]
+    exhausted: Tuple[int, ...]
+    state_intents: Tuple[Optional[str], ...] = ()
+    keypad: Tuple[bool, ...] = ()
+    index: FrozenDict = field(default_factory=FrozenDict)
+
+    def targets(self, state):
+        """Names of the states state's outcomes lead to, in outcome order."""
+        row = self.transitions[self.index[state]]
+        return tuple(dict.fromkeys(self.states[target] for target in row if target != END_OF_FLOW))
+
+@dataclass(frozen=True)
+class DatabaseConfig:
+    dialect: str
+    driver: str
+    username: str
+    password: str
+    host: str
+    port: int
+    database_name: str
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    fingerprint: tuple
+    loaded_at: float
+    intents: FrozenDict
+    greetings: FrozenDict
+    call_flow: FrozenDict
+    llm: FrozenDict
+    resilience: FrozenDict
+    speech: FrozenDict
+    database: Optional[DatabaseConfig]
+    allowed_callers: Tuple[str, ...]
+    owner_callers: Tuple[str, ...]
+    blocked_callers: Tuple[str, ...]
+    blocked_prefixes: Tuple[str, ...]
+    blocked_ranges: Tuple[Tuple[str, str], ...]
+
+    def intent_set(self, caller_type):
+        """Intents for config/<caller_type>_caller_intents.yml (empty if the file is absent)."""
+        return self.intents.get(caller_type) or IntentSet(caller_type)
+
+def _plain(value):
+    """value with dataclasses as dicts and tuples as lists, for msgpack."""
+    if is_dataclass(value):
+        return {f.name: _plain(getattr(value, f.name)) for f in fields(value)}
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+def _snapshot_from_plain(data):
+    """Rebuild the ConfigSnapshot that _plain flattened."""
+    data = _freeze(data)
+
+    def intent_set(info):
+        return IntentSet(**dict(info, intents=FrozenDict(
+            (name, Intent(**intent)) for name, intent in info['intents'].items())))
+
+    return ConfigSnapshot(**dict(
+        data,
+        intents=FrozenDict((caller_type, intent_set(info)) for caller_type, info in data['intents'].items()),
+        call_flow=FrozenDict((name, CallFlowSpec(**flow)) for name, flow in data['call_flow'].items()),
+        database=DatabaseConfig(**data['database']) if data['database'] is not None else None,
+    ))
+
+def load_yaml(path):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    try:
+        return yaml.load(raw, Loader=_Loader) or {}, raw
+    except yaml.YAMLError as e:
+        raise ConfigError(f"{path}: {e}")
+
+def _expect(condition, source, message):
+    if not condition:
+        raise ConfigError(f"{source}: {message}")
+
+def _strings(value, source, key):
+    value = value or []
+    _expect(isinstance(value, list), source, f"{key} must be a list")
+    return tuple(str(item) for item in value)
+
+def parse_intents(caller_type, data, raw, source):
+    intents = data.get('intents') or {}
+    _expect(isinstance(intents, dict), source, "intents must be a mapping")
+    parsed, keypad = {}, {}
+    for name, info in intents.items():
+        info = info or {}
+        _expect(isinstance(info, dict), source, f"intent {name} must be a mapping")
+        extension = info.get('extension')
+        dtmf = info.get('dtmf')
+        if dtmf is not None:
+            dtmf = str(dtmf)
+            _expect(len(dtmf) == 1 and dtmf in DTMF_DIGITS, source,
+                    f"{name}.dtmf must be one of {' '.join(DTMF_DIGITS)}")
+            _expect(dtmf not in keypad, source, f"{name}.dtmf {dtmf} is already {keypad.get(dtmf)}'s")
+            keypad[dtmf] = name
+        parsed[name] = Intent(
+            name=name,
+            prompt=info.get('prompt'),
+            extension=str(extension) if extension is not None else None,
+            action=info.get('action'),
+            tool_call=info.get('tool_call'),
+            phrases=_strings(info.get('phrases'), source, f"{name}.phrases"),
+            keywords=_strings(info.get('keywords'), source, f"{name}.keywords"),
+            dtmf=dtmf,
+            menu=info.get('menu') or name.replace('_', ' '),
+        )
+    threshold = data.get('fast_path_threshold')
+    if threshold is not None:
+        threshold = float(threshold)
+        _expect(0.0 <= threshold <= 1.0, source, "fast_path_threshold must be between 0 and 1")
+    choices = [f"{digit} to {parsed[name].menu}" for digit, name in sorted(keypad.items())]
+    menu = f"Or press {', or '.join(choices)}." if choices else None
+    return IntentSet(caller_type, FrozenDict(parsed), threshold, hashlib.sha256(raw).hexdigest()[:16],
+                     FrozenDict(keypad), menu)
+
+def parse_call_flow(data, source, intents=None):
+    flows = data.get('flows') or {}
+    _expect(isinstance(flows, dict), source, "flows must be a mapping")
+    return FrozenDict((name, compile_flow(name, info, f"{source}: flow {name}", intents))
+                      for name, info in flows.items())
+
+def compile_flow(name, data, source, intents=None):
+    """
+    Validate one flow and build its CallFlowSpec. With intents (caller type
+    -> IntentSet), the intents states name must exist.
+    """
+    _expect(isinstance(data, dict), source, "must be a mapping")
+    states = data.get('states') or {}
+    _expect(isinstance(states, dict) and states, source, "states must be a non-empty mapping")
+    names = tuple(states)
+    index = {state: i for i, state in enumerate(names)}
+    _expect(data.get('start') in index, source, f"start state {data.get('start')!r} is not defined")
+
+    def target(state, key, value):
+        _expect(value in index, source, f"{state}.{key} leads to undefined state {value!r}")
+        return index[value]
+
+    prompts, greetings, actions, transitions, max_visits, exhausted, state_intents, keypad = ([] for _ in range(8))
+    for state, info in states.items():
+        info = info or {}
+        _expect(isinstance(info, dict), source, f"state {state} must be a mapping")
+        action = info.get('action')
+        _expect(action in FLOW_ACTIONS, source, f"{state}: unknown action {action!r}")
+        _expect(action != 'greet' or info.get('greeting'), source, f"{state}: greet needs a greeting")
+        intent = info.get('intent')
+        if intent is not None:
+            _expect(action in ('transfer', 'hangup'), source, f"{state}: only transfer and hangup take an intent")
+            _expect(data.get('intents'), source, f"{state}: intent {intent!r} needs the flow's intents")
+            known = intents.get(data['intents']) if intents is not None else None
+            _expect(intents is None or (known is not None and intent in known.intents), source,
+                    f"{state}: no intent {intent!r} in {data['intents']}_caller_intents.yml")
+        keys = action == 'keypad' or bool(info.get('keypad'))
+        if keys:
+            _expect(action in ('listen', 'keypad'), source, f"{state}: only listen states take keypad")
+            _expect(data.get('intents'), source, f"{state}: the keypad needs the flow's intents")
+            known = intents.get(data['intents']) if intents is not None else None
+            _expect(intents is None or (known is not None and known.keypad), source,
+                    f"{state}: no intent in {data['intents']}_caller_intents.yml has a dtmf digit")
+        on = info.get('transitions') or {}
+        _expect(isinstance(on, dict), source, f"{state}.transitions must map outcomes to states")
+        unknown = [outcome for outcome in on if outcome not in FLOW_ACTIONS[action]]
+        _expect(not unknown, source, f"{state}: {action or 'a prompt'} has no outcome {', '.join(map(str, unknown))}")
+        missing = [outcome for outcome in FLOW_ACTIONS[action] if outcome not in on]
+        _expect(not on or not missing, source, f"{state}: no state for outcome {', '.join(missing)}")
+        row = [END_OF_FLOW] * len(FLOW_OUTCOMES)
+        for outcome, next_state in on.items():
+            row[FLOW_OUTCOMES.index(outcome)] = target(state, f"transitions.{outcome}", next_state)
+        limit = int(info.get('max_visits') or 0)
+        _expect(limit >= 0, source, f"{state}.max_visits must not be negative")
+        _expect(bool(limit) == ('exhausted' in info), source, f"{state}: max_visits and exhausted go together")
+        prompts.append(info.get('prompt'))
+        greetings.append(info.get('greeting'))
+        actions.append(FLOW_ACTION_NAMES.index(action))
+        transitions.append(tuple(row))
+        max_visits.append(limit)
+        exhausted.append(target(state, 'exhausted', info['exhausted']) if limit else END_OF_FLOW)
+        state_intents.append(intent)
+        keypad.append(keys)
+
+    for i, state in enumerate(names):
+        _expect(not max_visits[i] or not max_visits[exhausted[i]], source,
+                f"{state}.exhausted must lead to a state without max_visits")
+
+    def successors(i):
+        return {j for j in transitions[i] if j != END_OF_FLOW} | ({exhausted[i]} if max_visits[i] else set())
+
+    reached, pending = {index[data['start']]}, [index[data['start']]]
+    while pending:
+        for j in successors(pending.pop()) - reached:
+            reached.add(j)
+            pending.append(j)
+    unreachable = [names[i] for i in range(len(names)) if i not in reached]
+    _expect(not unreachable, source, f"unreachable state(s) {', '.join(unreachable)}")
+
+    # Every loop needs a state that stops it, or a call could cycle forever.
+    done, path = set(), []
+
+    def visit(i):
+        path.append(i)
+        for j in transitions[i]:
+            if j == END_OF_FLOW or max_visits[j] or j in done:
+                continue
+            if j in path:
+                loop = ' -> '.join(names[k] for k in path[path.index(j):] + [j])
+                raise ConfigError(f"{source}: loop {loop} has no state with max_visits")
+            visit(j)
+        path.pop()
+        done.add(i)
+
+    for i in range(len(names)):
+        if i not in done:
+            visit(i)
+
+    return CallFlowSpec(
+        name=name,
+        intents=data.get('intents'),
+        start=index[data['start']],
+        states=names,
+        prompts=tuple(prompts),
+        greetings=tuple(greetings),
+        actions=tuple(actions),
+        transitions=tuple(transitions),
+        max_visits=tuple(max_visits),
+        exhausted=tuple(exhausted),
+        state_intents=tuple(state_intents),
+        keypad=tuple(keypad),
+        index=FrozenDict(index),
+    )
+
+def check_shed_flows(resilience, call_flow, source):
+    """admission.shed_flows must name flows defined in config/call_flows.yml."""
+    shed_flows = (resilience.get('admission') or {}).get('shed_flows') or {}
+    _expect(isinstance(shed_flows, dict), source, "admission.shed_flows must map call contexts to flows")
+    missing = [flow for flow in shed_flows.values() if flow not in call_flow]
+    _expect(not missing, source, f"admission.shed_flows names undefined flow(s) {', '.join(map(str, missing))}")
+
+def parse_greetings(data, source):
+    greetings = data.get('greetings') or {}
+    _expect(isinstance(greetings, dict), source, "greetings must be a mapping")
+    for caller_type, by_time in greetings.items():
+        _expect(isinstance(by_time, dict), source, f"greetings.{caller_type} must map time of day to text")
+    return _freeze(greetings)
+
+def parse_database(data, source):
+    database = data.get('database')
+    if database is None:
+        return None
+    _expect(isinstance(database, dict), source, "database must be a mapping")
+    missing = [name for name in DatabaseConfig.__dataclass_fields__ if name not in database]
+    _expect(not missing, source, f"database is missing {', '.join(missing)}")
+    return DatabaseConfig(**{name: database[name] for name in DatabaseConfig.__dataclass_fields__})
+
+def parse_ranges(data, source):
+    ranges = []
+    for item in data.get('blocked_ranges') or []:
+        _expect(isinstance(item, dict) and 'start' in item and 'end' in item,
+                source, "blocked_ranges entries need start and end")
+        ranges.append((str(item['start']), str(item['end'])))
+    return tuple(ranges)
+
+class ConfigRegistry:
+    """Holds the current ConfigSnapshot for one config directory."""
+    def __init__(self, config_dir='config', snapshot_path=None, check_interval=CHECK_INTERVAL):
+        self.config_dir = config_dir
+        self.snapshot_path = snapshot_path
+        self.check_interval = check_interval
+        self._reload_lock = threading.Lock()
+        self._next_check = time.monotonic() + check_interval
+        self._failed_fingerprint = None
+        self._snapshot = self._initial_snapshot()
+
+    def get(self):
+        """The current snapshot; cheap enough to call on every use."""
+        if time.monotonic() >= self._next_check:
+            self.reload()
+        return self._snapshot
+
+    def reload(self, force=False):
+        """Rebuild if any config file changed. Returns False if a bad edit was rejected."""
+        if not self._reload_lock.acquire(blocking=force):
+            return True  # Another thread is already reloading
+        try:
+            self._next_check = time.monotonic() + self.check_interval
+            fingerprint = self._fingerprint()
+            if not force and fingerprint in (self._snapshot.fingerprint, self._failed_fingerprint):
+                return fingerprint != self._failed_fingerprint
+            try:
+                snapshot = self._build(fingerprint)
+            except Exception as e:
+                self._failed_fingerprint = fingerprint
+                CONFIG_RELOADS.labels(result='error').inc()
+                logger.error(f"Config reload failed, keeping the previous snapshot: {e}")
+                return False
+            self._snapshot = snapshot
+            self._failed_fingerprint = None
+            CONFIG_RELOADS.labels(result='success').inc()
+            logger.info("Config reloaded")
+            self.save_snapshot(snapshot)
+            return True
+        finally:
+            self._reload_lock.release()
+
+    def _fingerprint(self):
+        stamps = []
+        for path in sorted(glob.glob(os.path.join(self.config_dir, '*.yml'))):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stamps.append((os.path.basename(path), stat.st_mtime_ns, stat.st_size))
+        return tuple(stamps)
+
+    def _initial_snapshot(self):
+        fingerprint = self._fingerprint()
+        cached = self._read_snapshot()
+        if cached is not None and cached.fingerprint == fingerprint:
+            return cached
+        try:
+            snapshot = self._build(fingerprint)
+        except Exception as e:
+            if cached is None:
+                raise
+            # Serve the last snapshot that validated rather than refuse to start.
+            self._failed_fingerprint = fingerprint
+            CONFIG_RELOADS.labels(result='error').inc()
+            logger.error(f"Config is invalid, starting from the last good snapshot: {e}")
+            return cached
+        self.save_snapshot(snapshot)
+        return snapshot
+
+    def _build(self, fingerprint):
+        start = time.perf_counter()
+        path = lambda name: os.path.join(self.config_dir, name)  # noqa: E731
+
+        def read(name):
+            if not os.path.exists(path(name)):
+                return {}
+            data, _ = load_yaml(path(name))
+            _expect(isinstance(data, dict), path(name), "top level must be a mapping")
+            return data
+
+        intents = {}
+        for intents_path in sorted(glob.glob(path('*_caller_intents.yml'))):
+            caller_type = os.path.basename(intents_path)[:-len('_caller_intents.yml')]
+            data, raw = load_yaml(intents_path)
+            intents[caller_type] = parse_intents(caller_type, data, raw, intents_path)
+        blocked = read('blocked_callers.yml')
+        llm = read('llm_config.yml')
+        resilience = read('resilience.yml')
+        call_flow = parse_call_flow(read('call_flows.yml'), path('call_flows.yml'), intents)
+        check_shed_flows(resilience, call_flow, path('resilience.yml'))
+        snapshot = ConfigSnapshot(
+            fingerprint=fingerprint,
+            loaded_at=time.time(),
+            intents=FrozenDict(intents),
+            greetings=parse_greetings(read('greetings.yml'), path('greetings.yml')),
+            call_flow=call_flow,
+            llm=_freeze(llm),
+            resilience=_freeze(resilience),
+            speech=_freeze(read('speech.yml')),
+            database=parse_database(read('db_config.yml'), path('db_config.yml')),
+            allowed_callers=_strings(read('allowed_callers.yml').get('allowed_callers'),
+                                     path('allowed_callers.yml'), 'allowed_callers'),
+            owner_callers=_strings(read('owner_callers.yml').get('owner_callers'),
+                                   path('owner_callers.yml'), 'owner_callers'),
+            blocked_callers=_strings(blocked.get('blocked_callers'), path('blocked_callers.yml'), 'blocked_callers'),
+            blocked_prefixes=_strings(blocked.get('blocked_prefixes'), path('blocked_callers.yml'), 'blocked_prefixes'),
+            blocked_ranges=parse_ranges(blocked, path('blocked_callers.yml')),
+        )
+        CONFIG_LOAD_SECONDS.labels(source='yaml').observe(time.perf_counter() - start)
+        CONFIG_LAST_LOAD.set(snapshot.loaded_at)
+        return snapshot
+
+    def _read_snapshot(self):
+        # Plain data only: a tampered file can at worst fail to rebuild, never run code.
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
+        start = time.perf_counter()
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                stored = msgpack.unpackb(f.read(), raw=False, strict_map_key=False)
+            if not isinstance(stored, dict) or stored.get('format') != SNAPSHOT_FORMAT:
+                return None
+            snapshot = _snapshot_from_plain(stored['snapshot'])
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable config snapshot {self.snapshot_path}: {e}")
+            return None
+        CONFIG_LOAD_SECONDS.labels(source='snapshot').observe(time.perf_counter() - start)
+        CONFIG_LAST_LOAD.set(time.time())
+        return snapshot
+
+    def save_snapshot(self, snapshot=None):
+        """Write a snapshot (default: the current one) to snapshot_path, atomically."""
+        snapshot = snapshot or self._snapshot
+        if not self.snapshot_path:
+            return
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            packed = msgpack.packb({'format': SNAPSHOT_FORMAT, 'snapshot': _plain(snapshot)}, use_bin_type=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(packed)
+            os.replace(tmp_path, self.snapshot_path)
+        except (OSError, TypeError, ValueError) as e:
+            # TypeError: a YAML value msgpack has no type for (e.g. a date); workers parse the YAML instead.
+            logger.warning(f"Could not write config snapshot {self.snapshot_path}: {e}")
+
+_lock = threading.Lock()
+_registry = None
+
+def get_config_registry():
+    """Process-wide registry over config/ (CONFIG_SNAPSHOT_FILE, CONFIG_CHECK_INTERVAL)."""
+    global _registry
+    if _registry is None:
+        with _lock:
+            if _registry is None:
+                _registry = ConfigRegistry(snapshot_path=SNAPSHOT_FILE)
+    return _registry
+
+def get_config():
+    """The current ConfigSnapshot."""
+    return get_config_registry().get()
@@ -0,0 +1,106 @@
+"""
+Worker processes for the CPU-bound local speech engines.
+
+A local model is too slow to load per turn and, run in the worker's own
+threads, would hold the GIL against every other call. Each engine gets a
+process pool instead, in which the model is loaded once by initializer.
+By default the host's cores are split among the preforked FastAGI workers
+(configure_cpu_pools), so each engine runs about one process per core on
+the host rather than per worker:
+
+    pool = get_cpu_pool('vosk', _load_model, (model_path,))
+    text = pool.run(_recognize, pcm, sample_rate, timeout=timeout)
+
+Pools use spawned processes, so they are safe to start from a threaded
+worker, and a forked worker gets its own.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from prometheus_client import Gauge
+from utils.logger import logger
+
+CPU_POOL_WORKERS = Gauge(
+    'cpu_pool_workers',
+    'Processes running a local speech engine',
+    ['engine'],
+    multiprocess_mode='livesum'
+)
+
+_siblings = 1
+
+def configure_cpu_pools(siblings):
+    """Share the cores among siblings processes that each run their own pools (prefork workers)."""
+    global _siblings
+    _siblings = max(1, int(siblings))
+
+def default_workers():
+    """This process's share of the cores: at least one."""
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    return max(1, cores // _siblings)
+
+class CPUPool:
+    def __init__(self, engine, initializer=None, initargs=(), workers=0):
+        self.engine = engine
+        self.workers = int(workers) or default_workers()
+        self.pid = os.getpid()
+        self._initializer = initializer
+        self._initargs = tuple(initargs)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=self._initializer, initargs=self._initargs)
+                CPU_POOL_WORKERS.labels(engine=self.engine).set(self.workers)
+            return self._executor
+
+    def start(self):
+        """Start every process and load its model now rather than on the first turns."""
+        executor = self.executor()
+        for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        logger.info(f"{self.engine} pool ready with {self.workers} process(es)")
+        return self
+
+    def run(self, fn, *args, timeout=None):
+        """fn(*args) in a pool process; raises TimeoutError if no result within timeout."""
+        future = self.executor().submit(fn, *args)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            future.cancel()  # Still queued behind other turns: drop it
+            raise TimeoutError(f"{self.engine} did not finish within {timeout:.2f}s")
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+            CPU_POOL_WORKERS.labels(engine=self.engine).set(0)
+
+_lock = threading.Lock()
+_pools = {}
+
+def get_cpu_pool(engine, initializer=None, initargs=(), workers=0):
+    """The process-wide pool for engine, built with these arguments on first use."""
+    key = (engine, tuple(initargs))
+    pool = _pools.get(key)
+    if pool is None or pool.pid != os.getpid():
+        with _lock:
+            pool = _pools.get(key)
+            if pool is None or pool.pid != os.getpid():
+                pool = _pools[key] = CPUPool(engine, initializer, initargs, workers)
+    return pool
+
+def close_cpu_pools():
+    with _lock:
+        pools = [pool for pool in _pools.values() if pool.pid == os.getpid()]
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,67 @@
+import logging
+import os
+import sys
+import time
+from contextvars import ContextVar
+from functools import wraps
+from pythonjsonlogger import jsonlogger
+from prometheus_client import Counter, Histogram
+
+FUNCTION_CALLS = Counter(
+    'function_calls_total',
+    'Calls to instrumented functions',
+    ['function', 'status']
+)
+
+FUNCTION_LATENCY = Histogram(
+    'function_duration_seconds',
+    'Duration of instrumented functions',
+    ['function']
+)
+
+# The call being handled by this thread (a utils.tracing.CallTrace), if any.
+current_trace = ContextVar('current_trace', default=None)
+
+class _TraceFilter(logging.Filter):
+    """Stamp every line logged during a call with its trace and call IDs."""
+    def filter(self, record):
+        trace = current_trace.get()
+        if trace is not None:
+            record.trace_id = trace.trace_id
+            record.call_id = trace.call_id
+        return True
+
+def _build_logger():
+    log = logging.getLogger("ivr")
+    if not log.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(jsonlogger.JsonFormatter(
+            "%(asctime)s %(levelname)s %(name)s %(process)d %(message)s"
+        ))
+        handler.addFilter(_TraceFilter())
+        log.addHandler(handler)
+    log.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    log.propagate = False
+    return log
+
+logger = _build_logger()
+
+def record_metric(name, value=1, **labels):
+    """Emit a one-off metric sample as a structured log line."""
+    logger.info(name, extra={"metric": name, "value": value, **labels})
+
+def track_metrics(func):
+    """Count calls and time the wrapped function, labelled by its name."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            FUNCTION_CALLS.labels(function=func.__name__, status="error").inc()
+            raise
+        finally:
+            FUNCTION_LATENCY.labels(function=func.__name__).observe(time.perf_counter() - start)
+        FUNCTION_CALLS.labels(function=func.__name__, status="success").inc()
+        return result
+    return wrapper
@@ -0,0 +1,155 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+from prometheus_client import Counter
+from utils.logger import logger
+
+RATE_LIMIT_DECISIONS = Counter(
+    'rate_limit_decisions_total',
+    'Rate limiter decisions',
+    ['result']
+)
+
+RATE_LIMIT_REDIS_CALLS = Counter(
+    'rate_limit_redis_calls_total',
+    'Rate limiter round trips to Redis (decisions served from a local lease skip them)'
+)
+
+# GCRA over any number of keys in one round trip. Per key, ARGV carries
+# (emission interval ms, burst, cost, partial). Every key must allow the
+# request or none is charged. A "partial" key grants as many of the
+# requested tokens as are available (at least one), which is how local
+# leases are taken. The clock is Redis' own, so workers never disagree on it.
+GCRA_SCRIPT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local tats, grants = {}, {}
+local retry, denied = 0, 0
+for i = 1, #KEYS do
+  local base = (i - 1) * 4
+  local interval = tonumber(ARGV[base + 1])
+  local burst = tonumber(ARGV[base + 2])
+  local cost = tonumber(ARGV[base + 3])
+  local partial = tonumber(ARGV[base + 4])
+  local tat = tonumber(redis.call('GET', KEYS[i]) or now)
+  if tat < now then tat = now end
+  local available = math.floor((now + burst * interval - tat) / interval)
+  local grant = cost
+  if partial == 1 and available < cost then grant = math.max(available, 1) end
+  if available < grant then
+    local wait = tat + grant * interval - burst * interval - now
+    if wait > retry then retry = wait end
+    if denied == 0 then denied = i end
+  end
+  tats[i] = tat
+  grants[i] = grant
+end
+if denied > 0 then return {0, math.ceil(retry), denied} end
+for i = 1, #KEYS do
+  local interval = tonumber(ARGV[(i - 1) * 4 + 1])
+  local new_tat = tats[i] + grants[i] * interval
+  redis.call('SET', KEYS[i], new_tat, 'PX', math.ceil(new_tat - now) + 1)
+end
+local result = {1, 0, 0}
+for i = 1, #KEYS do result[#result + 1] = grants[i] end
+return result
+"""
+
+@dataclass(frozen=True)
+class Rate:
+    """limit requests per period seconds, allowing bursts of up to burst (default: limit)."""
+    limit: int
+    period: float
+    burst: Optional[int] = None
+
+    @property
+    def interval_ms(self):
+        return self.period * 1000.0 / self.limit
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    retry_after: float = 0.0  # Seconds until the limiting key would allow this request
+    limited_key: Optional[str] = None
+
+class RateLimiter:
+    """
+    Cluster-wide rate limiter: GCRA state lives in Redis and one Lua script
+    checks and charges every key of a request atomically, in a single round
+    trip. A caller limit and a global limit can therefore be enforced
+    together without races or keys left without a TTL.
+
+    Hot keys can be leased: acquire(..., lease={key: n}) takes up to n tokens
+    at once and serves the following requests from this process until the
+    tokens run out or lease_ttl passes. Unused leased tokens are simply lost,
+    so a lease of n can under-admit by at most n per worker; it never
+    over-admits.
+
+    If Redis is unreachable the limiter fails open and counts the error, so
+    an outage degrades limiting rather than calls.
+    """
+    def __init__(self, redis_client, prefix='ratelimit', lease_ttl=1.0):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.lease_ttl = lease_ttl
+        self._script = redis_client.register_script(GCRA_SCRIPT)
+        self._leases = {}
+        self._lease_lock = threading.Lock()
+
+    def acquire(self, rules, lease=None):
+        """
+        Take one token from every key in rules ({key: Rate}); return a Decision.
+        lease ({key: n}) batches tokens locally for the named keys.
+        """
+        lease = lease or {}
+        now = time.monotonic()
+        local = []
+        with self._lease_lock:
+            for key in lease:
+                tokens, expires = self._leases.get(key, (0, 0.0))
+                if tokens > 0 and expires > now:
+                    self._leases[key] = (tokens - 1, expires)
+                    local.append(key)
+        remote = [key for key in rules if key not in local]
+        if not remote:
+            RATE_LIMIT_DECISIONS.labels(result='allowed').inc()
+            return Decision(True)
+
+        args = []
+        for key in remote:
+            rate = rules[key]
+            cost = max(1, int(lease.get(key, 1)))
+            args += [rate.interval_ms, rate.burst or rate.limit, cost, 1 if key in lease else 0]
+        try:
+            RATE_LIMIT_REDIS_CALLS.inc()
+            result = self._script(keys=[f"{self.prefix}:{key}" for key in remote], args=args)
+        except Exception as e:
+            RATE_LIMIT_DECISIONS.labels(result='error').inc()
+            logger.warning(f"Rate limiter unavailable, allowing request: {e}")
+            return Decision(True)
+
+        allowed, retry_ms, denied = int(result[0]), int(result[1]), int(result[2])
+        if not allowed:
+            self._refund(local)
+            RATE_LIMIT_DECISIONS.labels(result='limited').inc()
+            return Decision(False, retry_ms / 1000.0, remote[denied - 1])
+        with self._lease_lock:
+            for key, granted in zip(remote, result[3:]):
+                if key in lease and int(granted) > 1:
+                    self._leases[key] = (int(granted) - 1, now + self.lease_ttl)
+        RATE_LIMIT_DECISIONS.labels(result='allowed').inc()
+        return Decision(True)
+
+    def check_limit(self, caller_id, limit=5, window=60):
+        """True if caller_id is within limit requests per window seconds."""
+        return self.acquire({f"caller:{caller_id}": Rate(limit, window)}).allowed
+
+    def _refund(self, keys):
+        if not keys:
+            return
+        with self._lease_lock:
+            for key in keys:
+                tokens, expires = self._leases.get(key, (0, 0.0))
+                self._leases[key] = (tokens + 1, expires)
@@ -0,0 +1,319 @@
+"""
+Per-call latency budgets and circuit breakers for the call's dependencies
+(llm, stt, tts, db).
+
+A CallBudget is created for each call. Every dependency call takes a slice
+of it: the dependency's own cap, or what is left of the turn or the call if
+that is less. A dependency with too little time left is not called at all.
+
+Each dependency also has a CircuitBreaker whose state lives in Redis, so a
+dependency that one worker sees failing is failed fast by every worker:
+
+    with guarded('stt', budget, default_timeout=8) as timeout:
+        text = recognize(audio, timeout)
+
+Both refusals raise DependencyUnavailable, which the call handler turns
+into a canned reply instead of letting the caller wait on a dead service.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge
+from utils.logger import logger
+from utils.config_registry import get_config
+
+CIRCUIT_BREAKER_STATE = Gauge(
+    'circuit_breaker_state',
+    'Circuit breaker state as last seen by this worker (0 closed, 1 half-open, 2 open)',
+    ['dependency'],
+    multiprocess_mode='livemax'
+)
+
+CIRCUIT_BREAKER_TRANSITIONS = Counter(
+    'circuit_breaker_transitions_total',
+    'Circuit breaker state changes, counted by the worker that made them',
+    ['dependency', 'state']
+)
+
+CIRCUIT_BREAKER_REJECTIONS = Counter(
+    'circuit_breaker_rejections_total',
+    'Dependency calls failed fast because the breaker was not closed',
+    ['dependency']
+)
+
+CALL_BUDGET_OVERRUNS = Counter(
+    'call_budget_overruns_total',
+    'Dependency calls skipped for lack of budget, or that ran past their slice',
+    ['dependency', 'kind']
+)
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+DEFAULT_BUDGET = {
+    'call_seconds': 300,
+    'turn_seconds': 15,
+    'min_slice_seconds': 0.2,
+    'dependencies': {'llm': 8, 'stt': 10, 'tts': 4, 'db': 1},
+}
+
+DEFAULT_BREAKER = {
+    'fail_max': 5,
+    'failure_window_seconds': 30,
+    'reset_timeout_seconds': 30,
+    'refresh_seconds': 1,
+    'probe_timeout_seconds': 60,
+}
+
+class DependencyUnavailable(Exception):
+    """A dependency was not called: its breaker is open or the call is out of time."""
+    def __init__(self, dependency, reason):
+        super().__init__(f"{dependency} unavailable: {reason}")
+        self.dependency = dependency
+        self.reason = reason
+
+class CallBudget:
+    """
+    Time left for one call and for its current turn. A turn is what the
+    caller waits through: it starts when they finish speaking (see
+    speech_input.capture_utterance). slice() hands a dependency the smaller
+    of its cap and the time remaining.
+    """
+    def __init__(self, call_seconds, turn_seconds, dependencies=None, min_slice_seconds=0.2,
+                 call_id=None, clock=time.monotonic):
+        self.turn_seconds = float(turn_seconds)
+        self.caps = {name: float(seconds) for name, seconds in (dependencies or {}).items()}
+        self.min_slice_seconds = float(min_slice_seconds)
+        self.call_id = call_id
+        self._clock = clock
+        self.call_deadline = clock() + float(call_seconds)
+        self.turn_deadline = min(clock() + self.turn_seconds, self.call_deadline)
+
+    @classmethod
+    def from_config(cls, call_id=None):
+        """A budget built from the budget section of config/resilience.yml."""
+        settings = dict(DEFAULT_BUDGET)
+        settings.update((get_config().resilience or {}).get('budget') or {})
+        return cls(settings['call_seconds'], settings['turn_seconds'], settings['dependencies'],
+                   settings['min_slice_seconds'], call_id=call_id)
+
+    def start_turn(self):
+        self.turn_deadline = min(self._clock() + self.turn_seconds, self.call_deadline)
+
+    def remaining(self):
+        return max(0.0, self.turn_deadline - self._clock())
+
+    def slice(self, dependency):
+        """Seconds this dependency may take now; raises DependencyUnavailable if too few are left."""
+        timeout = min(self.caps.get(dependency, self.turn_seconds), self.remaining())
+        if timeout < self.min_slice_seconds:
+            CALL_BUDGET_OVERRUNS.labels(dependency=dependency, kind='skipped').inc()
+            raise DependencyUnavailable(dependency, f"{timeout:.2f}s of budget left")
+        return timeout
+
+    def record(self, dependency, elapsed, timeout):
+        if elapsed > timeout:
+            CALL_BUDGET_OVERRUNS.labels(dependency=dependency, kind='overran').inc()
+            logger.warning(f"{dependency} took {elapsed:.2f}s of a {timeout:.2f}s slice (Call ID: {self.call_id})")
+
+class CircuitBreaker:
+    """
+    Closed -> open after fail_max failures within a failure_window_seconds
+    window, which starts at the first failure counted in it.
+    Open -> half-open after reset_timeout_seconds, when a single worker is
+    let through as a probe; its success closes the breaker and its failure
+    opens it again.
+
+    The state is a few plain Redis keys under breaker:<name>: "open" carries
+    the reset timeout as its TTL, "tripped" marks a breaker that has not yet
+    recovered, "probe" is held by the probing worker and "failures" counts
+    recent failures. Workers re-read the state at most every refresh_seconds,
+    so a closed or open breaker costs no round trip per call, and successes
+    are only written while probing. Without Redis (or when it is down) the
+    breaker stays closed.
+    """
+    prefix = "breaker"
+
+    def __init__(self, name, redis_client=None, fail_max=5, failure_window_seconds=30,
+                 reset_timeout_seconds=30, refresh_seconds=1, probe_timeout_seconds=60):
+        self.name = name
+        self.redis = redis_client
+        self.fail_max = int(fail_max)
+        self.failure_window_ms = int(float(failure_window_seconds) * 1000)
+        self.reset_timeout_ms = int(float(reset_timeout_seconds) * 1000)
+        self.refresh_seconds = float(refresh_seconds)
+        self.probe_timeout_ms = int(float(probe_timeout_seconds) * 1000)
+        self._state = CLOSED
+        self._next_refresh = 0.0
+        self._lock = threading.Lock()
+        CIRCUIT_BREAKER_STATE.labels(dependency=name).set(0)
+
+    def key(self, part):
+        return f"{self.prefix}:{self.name}:{part}"
+
+    @property
+    def state(self):
+        now = time.monotonic()
+        if now >= self._next_refresh:
+            with self._lock:
+                if now >= self._next_refresh:
+                    self._next_refresh = now + self.refresh_seconds
+                    self._set_state(self._read_state())
+        return self._state
+
+    def before_call(self):
+        """
+        Raise DependencyUnavailable unless the call may go ahead. Returns True
+        when this call is the half-open probe.
+        """
+        state = self.state
+        if state == CLOSED:
+            return False
+        if state == HALF_OPEN and self._redis_call(
+                lambda: self.redis.set(self.key('probe'), 1, nx=True, px=self.probe_timeout_ms)):
+            logger.info(f"Circuit breaker {self.name} half-open; probing")
+            return True
+        CIRCUIT_BREAKER_REJECTIONS.labels(dependency=self.name).inc()
+        raise DependencyUnavailable(self.name, f"circuit breaker {state}")
+
+    def record_success(self, probe=False):
+        if not probe:
+            return
+        if self._redis_call(lambda: self.redis.delete(self.key('tripped'), self.key('probe'), self.key('failures'))):
+            CIRCUIT_BREAKER_TRANSITIONS.labels(dependency=self.name, state=CLOSED).inc()
+            logger.info(f"Circuit breaker {self.name} closed")
+        self._force_state(CLOSED)
+
+    def record_failure(self, probe=False):
+        if self.redis is None:
+            return
+        if probe:
+            self._trip("probe failed")
+            return
+        failures = self._redis_call(self._count_failure)
+        if failures is not None and failures >= self.fail_max:
+            self._trip(f"{failures} failures in {self.failure_window_ms / 1000:.0f}s")
+
+    def _count_failure(self):
+        # A fixed window opened by its first failure: later failures must not
+        # push its expiry back, or sparse errors would add up forever.
+        pipe = self.redis.pipeline()
+        pipe.set(self.key('failures'), 0, nx=True, px=self.failure_window_ms)
+        pipe.incr(self.key('failures'))
+        return pipe.execute()[1]
+
+    def _trip(self, reason):
+        def trip():
+            # Only the worker whose SET wins reports the transition.
+            opened = self.redis.set(self.key('open'), 1, nx=True, px=self.reset_timeout_ms)
+            pipe = self.redis.pipeline()
+            pipe.set(self.key('tripped'), 1)
+            pipe.delete(self.key('failures'), self.key('probe'))
+            pipe.execute()
+            return opened
+        if self._redis_call(trip):
+            CIRCUIT_BREAKER_TRANSITIONS.labels(dependency=self.name, state=OPEN).inc()
+            logger.error(f"Circuit breaker {self.name} opened: {reason}")
+        self._force_state(OPEN)
+
+    def _read_state(self):
+        if self.redis is None:
+            return CLOSED
+        values = self._redis_call(lambda: self.redis.mget(self.key('open'), self.key('tripped')))
+        if values is None:
+            return CLOSED
+        is_open, tripped = values
+        return OPEN if is_open else HALF_OPEN if tripped else CLOSED
+
+    def _force_state(self, state):
+        with self._lock:
+            self._set_state(state)
+            self._next_refresh = time.monotonic() + self.refresh_seconds
+
+    def _set_state(self, state):
+        self._state = state
+        CIRCUIT_BREAKER_STATE.labels(dependency=self.name).set(_STATE_VALUES[state])
+
+    def _redis_call(self, fn):
+        if self.redis is None:
+            return None
+        try:
+            return fn()
+        except Exception as e:
+            logger.warning(f"Circuit breaker {self.name} could not reach Redis: {e}")
+            return None
+
+_lock = threading.Lock()
+_breakers = {}
+_redis = None
+
+def configure_breakers(redis_client):
+    """Share breaker state through redis_client; breakers are rebuilt on next use."""
+    global _redis
+    with _lock:
+        _redis = redis_client
+        _breakers.clear()
+
+def get_breaker(dependency):
+    """The process-wide breaker for a dependency, configured from config/resilience.yml."""
+    breaker = _breakers.get(dependency)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.get(dependency)
+            if breaker is None:
+                config = (get_config().resilience or {}).get('circuit_breakers') or {}
+                settings = dict(DEFAULT_BREAKER)
+                settings.update((key, value) for key, value in config.items() if key != 'dependencies')
+                settings.update((config.get('dependencies') or {}).get(dependency) or {})
+                breaker = _breakers[dependency] = CircuitBreaker(dependency, _redis, **settings)
+    return breaker
+
+@contextmanager
+def guarded(dependency, budget=None, default_timeout=None, exclude=()):
+    """
+    Run the with-block as one call to dependency. Yields the timeout the call
+    must respect: the budget's slice, or default_timeout without a budget.
+    Exceptions other than those in exclude count as breaker failures.
+    """
+    breaker = get_breaker(dependency)
+    timeout = budget.slice(dependency) if budget is not None else default_timeout
+    probe = breaker.before_call()
+    started = time.monotonic()
+    try:
+        yield timeout
+    except exclude:
+        breaker.record_success(probe)
+        raise
+    except Exception:
+        breaker.record_failure(probe)
+        raise
+    else:
+        breaker.record_success(probe)
+    finally:
+        if budget is not None:
+            budget.record(dependency, time.monotonic() - started, timeout)
+
+def wait_with_timeout(fn, timeout, what):
+    """
+    Run a blocking call (e.g. an SDK future's get()) on a helper thread and
+    return its result, raising TimeoutError if it takes longer than timeout.
+    """
+    if timeout is None:
+        return fn()
+    outcome = {}
+    done = threading.Event()
+
+    def run():
+        try:
+            outcome['result'] = fn()
+        except BaseException as e:
+            outcome['error'] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=run, name=f"{what}-wait", daemon=True).start()
+    if not done.wait(timeout):
+        raise TimeoutError(f"{what} did not finish within {timeout:.2f}s")
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
@@ -0,0 +1,272 @@
+"""
+Pools of pre-connected speech SDK objects, one set per worker process.
+
+Building a recognizer or synthesizer and opening its websocket costs a few
+hundred milliseconds. A long-lived worker keeps objects ready so a turn does
+not pay for it:
+
+    pool = SpeechPool('tts', create=new_synthesizer, size=8)
+    pool.start()                      # fill in the background, then maintain
+    with pool.lease(timeout) as synthesizer:
+        ...
+
+Reusable objects (synthesizers) go back to the pool after each use;
+single-use ones (recognizers bound to one audio stream) are replaced in the
+background. Idle objects are closed once they have been idle for
+max_idle_seconds or report a dropped connection, and the pool refills
+itself to size. Objects built in the background are timed as 'warm' and
+those built on a turn, because the pool was empty, as 'cold' in
+speech_connection_setup_seconds.
+
+create(timeout) must return a PooledSpeech.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram
+from utils.logger import logger
+from utils.config_registry import get_config
+
+SPEECH_CONNECTION_SETUP = Histogram(
+    'speech_connection_setup_seconds',
+    'Time to build and connect a speech recognizer or synthesizer, in the background (warm) or on a turn (cold)',
+    ['kind', 'path'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4)
+)
+
+SPEECH_POOL_ACQUISITIONS = Counter(
+    'speech_pool_acquisitions_total',
+    'Speech objects handed to a turn, from the pool (hit) or built on the spot (miss)',
+    ['kind', 'result']
+)
+
+SPEECH_POOL_RECYCLED = Counter(
+    'speech_pool_recycled_total',
+    'Pooled speech objects closed instead of reused',
+    ['kind', 'reason']
+)
+
+SPEECH_POOL_IDLE = Gauge(
+    'speech_pool_idle',
+    'Connected speech objects waiting in the pool',
+    ['kind'],
+    multiprocess_mode='livesum'
+)
+
+DEFAULT_POOLS = {
+    'calls_per_worker': 16,
+    'stt_per_call': 0.5,
+    'tts_per_call': 0.5,
+    'connect_timeout_seconds': 3,
+    'max_idle_seconds': 120,
+    'check_interval_seconds': 15,
+}
+
+def pool_settings():
+    """config/speech.yml's pools section over DEFAULT_POOLS."""
+    settings = dict(DEFAULT_POOLS)
+    settings.update((get_config().speech or {}).get('pools') or {})
+    return settings
+
+class PooledSpeech:
+    """A speech SDK object with its connection and when it was last returned."""
+    def __init__(self, target, connection=None):
+        self.target = target
+        self.connection = connection
+        self.connected = connection is None
+        self.idle_since = time.monotonic()
+
+    def open(self, timeout, continuous=False):
+        """
+        Pre-open the connection (the Azure SDK's Connection API) and wait up
+        to timeout for it. Tracks its state so a dropped connection is not
+        handed out again.
+        """
+        opened = threading.Event()
+
+        def connected(evt):
+            self.connected = True
+            opened.set()
+
+        def disconnected(evt):
+            self.connected = False
+
+        self.connection.connected.connect(connected)
+        self.connection.disconnected.connect(disconnected)
+        self.connection.open(continuous)
+        if not opened.wait(timeout):
+            logger.warning(f"Speech connection not open after {timeout:.2f}s; it will connect on first use")
+            self.connected = True  # Not known to be broken
+        return self
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception as e:
+                logger.debug(f"Closing speech connection failed: {e}")
+        self.connection = self.target = None
+
+class SpeechPool:
+    def __init__(self, kind, create, size=0, reusable=True, connect_timeout_seconds=3, max_idle_seconds=120,
+                 check_interval_seconds=15):
+        self.kind = kind
+        self.size = int(size)
+        self.reusable = reusable
+        self.connect_timeout_seconds = float(connect_timeout_seconds)
+        self.max_idle_seconds = float(max_idle_seconds)
+        self.check_interval_seconds = float(check_interval_seconds)
+        self.pid = os.getpid()
+        self._create = create
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+
+    def start(self):
+        """Fill the pool in the background and keep it filled. Idempotent."""
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._maintain, name=f"{self.kind}-pool", daemon=True)
+                self._thread.start()
+        return self
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+        self._wake.set()
+        for item in idle:
+            item.close()
+        SPEECH_POOL_IDLE.labels(kind=self.kind).set(0)
+
+    def prefill(self, count=1):
+        """
+        Build objects in the calling thread until count are idle; for callers
+        that cannot wait for start()'s refill, such as per-call scripts.
+        Returns how many were built.
+        """
+        built = 0
+        while not self._closed and len(self._idle) < min(count, max(self.size, 1)):
+            item = self._build('warm')
+            with self._lock:
+                self._idle.appendleft(item)
+                SPEECH_POOL_IDLE.labels(kind=self.kind).set(len(self._idle))
+            built += 1
+        return built
+
+    def idle_count(self):
+        return len(self._idle)
+
+    def acquire(self, timeout=None):
+        """A connected object: a pooled one if any is usable, otherwise a new one."""
+        while True:
+            with self._lock:
+                item = self._idle.pop() if self._idle else None
+                SPEECH_POOL_IDLE.labels(kind=self.kind).set(len(self._idle))
+            if item is None:
+                break
+            reason = self._stale(item)
+            if reason is None:
+                SPEECH_POOL_ACQUISITIONS.labels(kind=self.kind, result='hit').inc()
+                if not self.reusable:
+                    self._wake.set()  # Replace it in the background
+                return item
+            self._recycle(item, reason)
+        SPEECH_POOL_ACQUISITIONS.labels(kind=self.kind, result='miss').inc()
+        self._wake.set()
+        return self._build('cold', timeout)
+
+    def release(self, item, ok=True):
+        """Return an object after use; failed or single-use objects are closed."""
+        if not (ok and self.reusable and item.connected):
+            self._recycle(item, 'failed' if not ok else 'single_use' if not self.reusable else 'disconnected')
+            return
+        item.idle_since = time.monotonic()
+        with self._lock:
+            if not self._closed and len(self._idle) < max(self.size, 1):
+                self._idle.append(item)
+                SPEECH_POOL_IDLE.labels(kind=self.kind).set(len(self._idle))
+                return
+        self._recycle(item, 'surplus')
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """The target of an acquired object, released when the block ends (and closed if it raised)."""
+        item = self.acquire(timeout)
+        try:
+            yield item.target
+        except BaseException:
+            self.release(item, ok=False)
+            raise
+        self.release(item)
+
+    def _stale(self, item):
+        if not item.connected:
+            return 'disconnected'
+        if time.monotonic() - item.idle_since > self.max_idle_seconds:
+            return 'idle'
+        return None
+
+    def _recycle(self, item, reason):
+        SPEECH_POOL_RECYCLED.labels(kind=self.kind, reason=reason).inc()
+        item.close()
+
+    def _build(self, path, timeout=None):
+        started = time.monotonic()
+        item = self._create(min(timeout, self.connect_timeout_seconds) if timeout is not None
+                            else self.connect_timeout_seconds)
+        SPEECH_CONNECTION_SETUP.labels(kind=self.kind, path=path).observe(time.monotonic() - started)
+        return item
+
+    def _maintain(self):
+        while not self._closed:
+            self._wake.clear()
+            self._evict_stale()
+            try:
+                while not self._closed and len(self._idle) < self.size:
+                    item = self._build('warm')
+                    with self._lock:
+                        self._idle.appendleft(item)  # acquire() takes the most recently used first
+                        SPEECH_POOL_IDLE.labels(kind=self.kind).set(len(self._idle))
+            except Exception as e:
+                logger.error(f"Could not fill the {self.kind} pool: {e}")
+            self._wake.wait(self.check_interval_seconds)
+
+    def _evict_stale(self):
+        stale = []
+        with self._lock:
+            for item in list(self._idle):
+                reason = self._stale(item)
+                if reason:
+                    self._idle.remove(item)
+                    stale.append((item, reason))
+            SPEECH_POOL_IDLE.labels(kind=self.kind).set(len(self._idle))
+        for item, reason in stale:
+            self._recycle(item, reason)
+
+_lock = threading.Lock()
+_pools = {}
+
+def get_pool(kind, key, create, reusable=True):
+    """
+    The process-wide pool for (kind, key), sized from config/speech.yml. A
+    forked worker gets fresh pools: SDK connections do not survive a fork.
+    """
+    pool = _pools.get((kind, key))
+    if pool is None or pool.pid != os.getpid():
+        with _lock:
+            pool = _pools.get((kind, key))
+            if pool is None or pool.pid != os.getpid():
+                settings = pool_settings()
+                size = math.ceil(settings['calls_per_worker'] * settings[f'{kind}_per_call'])
+                pool = _pools[(kind, key)] = SpeechPool(
+                    kind, create, size, reusable=reusable,
+                    connect_timeout_seconds=settings['connect_timeout_seconds'],
+                    max_idle_seconds=settings['max_idle_seconds'],
+                    check_interval_seconds=settings['check_interval_seconds'])
+    return pool
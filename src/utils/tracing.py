@@ -0,0 +1,98 @@
+"""
+Per-call traces and per-stage turn latency.
+
+IVRHandler starts a CallTrace for each call. Every log line written while
+handling the call carries its trace_id (see utils.logger), and each stage
+of a caller turn is timed with
+
+    with stage('stt'):
+        text = recognize(...)
+
+which feeds the ivr_turn_stage_seconds histogram and the trace's per-turn
+breakdown, logged as one "turn timings" line when the next turn starts or
+the call ends. Labels are limited to the fixed STAGES and CALL_CONTEXTS so
+series counts stay bounded however many calls and workers there are.
+"""
+import contextvars
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from prometheus_client import Histogram
+from utils.logger import current_trace, logger
+
+STAGES = ('record', 'stt', 'llm', 'parse', 'tts', 'playback', 'db')
+CALL_CONTEXTS = ('internal', 'caller_allowed', 'caller_unknown')
+OTHER_CONTEXT = 'other'
+
+TURN_STAGE_SECONDS = Histogram(
+    'ivr_turn_stage_seconds',
+    'Time spent in each stage of a caller turn',
+    ['stage', 'call_context'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16)
+)
+
+class CallTrace:
+    """Trace ID, call context and the current turn's stage timings for one call."""
+    def __init__(self, call_id, trace_id=None, call_context=OTHER_CONTEXT):
+        self.call_id = call_id
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.call_context = call_context
+        self.turn = 0
+        self._stages = {}
+        self._turn_started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_context(self, call_context):
+        self.call_context = call_context if call_context in CALL_CONTEXTS else OTHER_CONTEXT
+
+    def add(self, name, seconds):
+        with self._lock:
+            self._stages[name] = self._stages.get(name, 0.0) + seconds
+
+    def new_turn(self):
+        """Log the finished turn's breakdown and start timing the next one."""
+        with self._lock:
+            stages, self._stages = self._stages, {}
+            elapsed = time.monotonic() - self._turn_started
+            self._turn_started = time.monotonic()
+            turn, self.turn = self.turn, self.turn + 1
+        if stages:
+            breakdown = {name: round(seconds * 1000, 1) for name, seconds in stages.items()}
+            logger.info(f"Turn {turn} timings: {breakdown} of {elapsed * 1000:.0f}ms",
+                        extra={"turn": turn, "stages_ms": breakdown, "turn_ms": round(elapsed * 1000, 1),
+                               "call_context": self.call_context})
+
+def start_trace(call_id, trace_id=None):
+    """Make a new CallTrace current for this thread (and for threads started with traced())."""
+    trace = CallTrace(call_id, trace_id)
+    current_trace.set(trace)
+    return trace
+
+def finish_trace():
+    trace = current_trace.get()
+    if trace is not None:
+        trace.new_turn()
+        current_trace.set(None)
+
+def get_trace():
+    return current_trace.get()
+
+@contextmanager
+def stage(name):
+    """Time the with-block as one stage of the current turn."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        trace = current_trace.get()
+        call_context = trace.call_context if trace is not None else OTHER_CONTEXT
+        TURN_STAGE_SECONDS.labels(stage=name, call_context=call_context).observe(elapsed)
+        if trace is not None:
+            trace.add(name, elapsed)
+
+def traced(target):
+    """Wrap a thread target so it runs with the starting thread's trace."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(target, *args, **kwargs)
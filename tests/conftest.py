@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Mirror the runtime layout: packages live under src/, IVR modules import their
+# siblings from src/ivr/ directly.
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+for path in (os.path.join(ROOT, 'src', 'ivr'), os.path.join(ROOT, 'src')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,85 @@
+import pytest
+from types import SimpleNamespace
+import utils.admission as admission
+from utils.admission import ACQUIRE_SCRIPT, Overloaded, SlotPool, shed_flow
+from utils.config_registry import ConfigError, check_shed_flows, compile_flow
+
+class SlotRedis:
+    """The admission scripts over in-memory holders and queue (no expiry), in Lua's order."""
+    def __init__(self):
+        self.holders, self.queue = [], []
+
+    def register_script(self, script):
+        return self._acquire if script == ACQUIRE_SCRIPT else self._usage
+
+    def _acquire(self, keys, args):
+        token, limit, reserved, priority, max_queue = args[0], args[1], args[2], args[3], args[6]
+        cap = limit if priority else limit - reserved
+        ahead = 0 if priority else (self.queue.index(token) if token in self.queue else len(self.queue))
+        if len(self.holders) + ahead < cap:
+            self.holders.append(token)
+            if token in self.queue:
+                self.queue.remove(token)
+            return [1, len(self.holders), len(self.queue)]
+        if not priority and token not in self.queue:
+            if len(self.queue) >= max_queue:
+                return [-1, len(self.holders), len(self.queue)]
+            self.queue.append(token)
+        return [0, len(self.holders), len(self.queue)]
+
+    def _usage(self, keys, args):
+        return [len(self.holders), len(self.queue)]
+
+    def zrem(self, key, token):
+        for members in (self.holders, self.queue):
+            if token in members:
+                members.remove(token)
+
+class DownRedis:
+    def register_script(self, script):
+        def run(keys, args):
+            raise ConnectionError("redis down")
+        return run
+
+def test_owner_calls_get_the_reserved_slots_and_others_are_shed():
+    redis = SlotRedis()
+    pool = SlotPool(redis, 'llm', 3, reserved=1, queue_seconds=0.05, max_queue=1, poll_seconds=0.01)
+    tokens = [pool.acquire(), pool.acquire()]
+    with pytest.raises(Overloaded):
+        pool.acquire()
+    assert redis.queue == []  # A shed waiter leaves the queue
+    owner = pool.acquire(priority=True)
+    assert len(redis.holders) == 3
+    pool.release(tokens[0])
+    with pytest.raises(Overloaded):
+        pool.acquire()  # The free slot is the owner's reserve
+    pool.release(owner)
+    assert pool.acquire() is not None
+    assert pool.usage() == (2, 0)
+
+def test_admission_fails_open_without_redis():
+    pool = SlotPool(DownRedis(), 'stt', 1)
+    assert pool.acquire() is None
+    pool.release(None)
+    assert pool.usage() == (0, 0)
+
+def test_new_calls_take_the_shed_flow_only_under_load(monkeypatch):
+    settings = dict(admission.DEFAULT_ADMISSION, slots={'llm': 10}, shed_flows={'caller_unknown': 'busy'})
+    monkeypatch.setattr(admission, 'admission_settings', lambda: settings)
+    usage = [(3, 0)]
+    monkeypatch.setattr(admission, 'get_slot_pool', lambda name: SimpleNamespace(limit=10, usage=lambda: usage[0]))
+    assert shed_flow('caller_unknown') is None
+    assert shed_flow('caller_unknown', force=True) == 'busy'
+    usage[0] = (8, 1)
+    assert shed_flow('caller_unknown') == 'busy'
+    assert shed_flow('internal') is None
+
+def test_shed_flows_and_state_intents_are_checked_at_load():
+    with pytest.raises(ConfigError, match="undefined flow"):
+        check_shed_flows({'admission': {'shed_flows': {'caller_unknown': 'nowhere'}}}, {}, 'resilience.yml')
+    ask = {'action': 'listen', 'intent': 'sales_call', 'transitions': {'speech': 'done', 'silence': 'done'}}
+    with pytest.raises(ConfigError, match="only transfer and hangup take an intent"):
+        compile_flow('f', {'intents': 'unknown', 'start': 'ask', 'states': {'ask': ask, 'done': {}}}, 'f')
+    with pytest.raises(ConfigError, match="no intent 'later'"):
+        compile_flow('f', {'intents': 'unknown', 'start': 'bye', 'states': {
+            'bye': {'action': 'hangup', 'intent': 'later'}}}, 'f', intents={})
@@ -0,0 +1,54 @@
+import io
+import wave
+import numpy as np
+from audio_util import load_utterance, resample, speech_bounds, ulaw_decode, ulaw_encode
+
+RATE = 8000
+
+def _recording(path, samples):
+    with wave.open(str(path), 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(RATE)
+        out.writeframes(np.clip(samples, -32768, 32767).astype('<i2').tobytes())
+
+def _noise(seconds, rng):
+    return rng.normal(0, 30, int(seconds * RATE))
+
+def test_mulaw_matches_g711():
+    assert ulaw_decode(bytes([0xFF, 0x7F, 0x80, 0x00])).tolist() == [0, 0, 32124, -32124]
+    samples = np.arange(-32000, 32000, 7)
+    decoded = ulaw_decode(ulaw_encode(samples)).astype(np.int32)
+    # Quantization error grows with the segment: about 1/16 of the value.
+    assert np.all(np.abs(decoded - samples) <= np.abs(samples) // 16 + 16)
+
+def test_vad_keeps_the_speech_and_its_padding():
+    rng = np.random.default_rng(3)
+    samples = _noise(4, rng)
+    t = np.arange(RATE) / RATE
+    samples[RATE:2 * RATE] += 5000 * np.sin(2 * np.pi * 200 * t)
+    start, end = speech_bounds(samples.astype(np.int16), RATE)
+    assert (start, end) == (RATE - 1600, 2 * RATE + 1600)
+    assert speech_bounds(_noise(4, rng).astype(np.int16), RATE) is None
+
+def test_upsampling_keeps_the_tone():
+    t = np.arange(RATE) / RATE
+    up = resample((8000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16), RATE, 16000)
+    assert len(up) == 2 * RATE
+    spectrum = np.abs(np.fft.rfft(up))
+    assert np.argmax(spectrum) == 440  # 1 Hz bins over one second
+
+def test_recordings_are_trimmed_in_memory_and_removed(tmp_path):
+    rng = np.random.default_rng(5)
+    speech = _noise(5, rng)
+    speech[RATE:3 * RATE] += 4000 * np.sin(2 * np.pi * 150 * np.arange(2 * RATE) / RATE)
+    path = tmp_path / "call_turn.wav"
+    _recording(path, speech)
+    utterance = load_utterance(str(path))
+    assert not path.exists()
+    assert utterance.recorded_seconds == 5 and abs(utterance.seconds - 2.4) < 0.05
+    assert utterance.sample_rate == 16000 and len(utterance.pcm) == int(utterance.seconds * 16000) * 2
+
+    _recording(path, _noise(3, rng))
+    assert not load_utterance(str(path)).has_speech
+    assert load_utterance(str(path)) is None  # Already removed
@@ -0,0 +1,32 @@
+import os
+from sqlalchemy import create_engine, inspect
+from db import bootstrap
+from db.bootstrap import bootstrap_schema, check_schema_version, read_schema_version
+from db import db as db_module
+from db.db import Database
+from db.models import SCHEMA_REVISION
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+def test_calls_only_check_the_recorded_revision(tmp_path, monkeypatch):
+    monkeypatch.setattr(bootstrap, '_schema_ok', None)
+    migrations = []
+    monkeypatch.setattr(db_module, 'bootstrap_schema', migrations.append)
+    engine = create_engine(f"sqlite:///{tmp_path}/ivr.db")
+    Database(startup_mode='check', engine=engine).close()
+    assert migrations == [] and not inspect(engine).has_table('chat_history')
+
+def test_the_bootstrap_builds_the_schema_and_records_its_revision(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)  # alembic.ini and src/db/migrations
+    monkeypatch.setattr(bootstrap, '_schema_ok', None)
+    version_file = str(tmp_path / "schema_version")
+    assert check_schema_version(version_file) is False  # Never bootstrapped
+
+    engine = create_engine(f"sqlite:///{tmp_path}/ivr.db")
+    assert bootstrap_schema(engine, version_file) == SCHEMA_REVISION
+    assert inspect(engine).has_table('chat_history')
+    assert read_schema_version(version_file) == SCHEMA_REVISION
+    monkeypatch.setattr(bootstrap, '_schema_ok', None)
+    assert check_schema_version(version_file) is True
+    # Running it again on the existing schema only upgrades.
+    assert bootstrap_schema(engine, version_file) == SCHEMA_REVISION
@@ -0,0 +1,58 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from prometheus_client import REGISTRY
+import call_setup
+from call_setup import CallSetup
+from caller_directory import OWNER, CallerEntry
+
+class SlowHistory:
+    def __init__(self, seconds, error=None):
+        self.seconds = seconds
+        self.error = error
+        self.calls = 0
+
+    def recent(self, caller_cli, limit=None, budget=None):
+        self.calls += 1
+        time.sleep(self.seconds)
+        if self.error:
+            raise self.error
+        return [{"role": "user", "content": "hi"}]
+
+def owner_resources(history):
+    directory = SimpleNamespace(lookup=lambda number: CallerEntry(number, OWNER))
+    llm_client = SimpleNamespace(warm=threading.Event().set)
+    return SimpleNamespace(caller_directory=directory, history=history, llm_client=llm_client)
+
+def hidden(task):
+    return REGISTRY.get_sample_value('call_setup_hidden_seconds_total', {'task': task}) or 0.0
+
+def test_history_loads_while_the_greeting_plays(monkeypatch):
+    monkeypatch.setattr(call_setup, 'warm_speech', lambda call_context, streaming: 0)
+    history = SlowHistory(0.2)
+    before = hidden('history')
+    setup = CallSetup.start(owner_resources(history), '+15550000000', executor=ThreadPoolExecutor(4))
+    assert setup.result('caller').category == OWNER
+    time.sleep(0.3)  # The greeting
+    started = time.monotonic()
+    assert setup.result('history', lambda: []) == [{"role": "user", "content": "hi"}]
+    assert time.monotonic() - started < 0.1
+    assert history.calls == 1
+    assert hidden('history') - before > 0.15
+    setup.finish()
+
+def test_failed_or_missing_tasks_run_on_the_call_path(monkeypatch):
+    monkeypatch.setattr(call_setup, 'warm_speech', lambda call_context, streaming: 0)
+    history = SlowHistory(0, error=ConnectionError("redis down"))
+    setup = CallSetup.start(owner_resources(history), '+15550000000', executor=ThreadPoolExecutor(4))
+    setup.result('caller')
+    assert setup.result('history', lambda: ['fallback']) == ['fallback']
+    assert setup.result('never_started', lambda: 'done here') == 'done here'
+    setup.finish()
+
+def test_likely_prompts_come_from_the_compiled_flows():
+    assert call_setup.likely_prompts('internal') == ()
+    assert call_setup.likely_prompts('caller_unknown') == (
+        "No speech recognized, please try again.", "Transferring your call...", "Sales call detected; hanging up.")
+    assert call_setup.likely_prompts('caller_unknown') is call_setup.likely_prompts('caller_unknown')
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+import pytest
+from caller_directory import (
+    ALLOWED, BLOCKED, OWNER, UNKNOWN, CallerDirectory, normalize_number, range_to_prefixes,
+)
+
+class Registry:
+    def __init__(self, **lists):
+        self.set(**lists)
+
+    def set(self, fingerprint='v1', allowed=(), owners=(), blocked=(), prefixes=(), ranges=()):
+        self.config = SimpleNamespace(fingerprint=fingerprint, allowed_callers=allowed, owner_callers=owners,
+                                      blocked_callers=blocked, blocked_prefixes=prefixes, blocked_ranges=ranges)
+
+    def get(self):
+        return self.config
+
+@pytest.mark.parametrize('raw, number', [
+    ("+1 (555) 123-4567", "+15551234567"),
+    ("0044 20 7946 0958", "+442079460958"),
+    ("+44.20.7946.0958", "+442079460958"),
+    ("555-123-4567", "+15551234567"),  # National: the default country code
+    ("15551234567", "+15551234567"),
+    ("1234567", None),
+    ("+1555ABC4567", None),
+    ("", None),
+])
+def test_numbers_normalize_to_e164(raw, number):
+    assert normalize_number(raw) == number
+
+def test_ranges_become_the_fewest_prefixes():
+    assert range_to_prefixes("5550100", "5550299") == ["55501", "55502"]
+    assert range_to_prefixes("5550150", "5550249") == ["555015", "555016", "555017", "555018", "555019",
+                                                      "555020", "555021", "555022", "555023", "555024"]
+
+def test_exact_numbers_win_over_prefix_rules_and_the_strongest_category_wins():
+    registry = Registry(allowed=["5551230000", "+15559990000"], owners=["+1 555 123 0000"],
+                        blocked=["+15559990000"], prefixes=["+1900", "+190055"], ranges=[("+15550100000", "+15550199999")])
+    directory = CallerDirectory(registry)
+    assert directory.category("(555) 123-0000") == OWNER
+    assert directory.category("+15559990000") == BLOCKED
+    assert directory.category("+19005551234") == BLOCKED  # Nested prefixes: the longest one matches
+    assert directory.category("+19001234567") == BLOCKED
+    assert directory.category("+15550142222") == BLOCKED  # Inside the range
+    assert directory.category("+15550200000") == UNKNOWN
+
+def test_unknown_and_invalid_callers():
+    directory = CallerDirectory(Registry(prefixes=["+1900555"]))
+    assert directory.category("+19005551234") == BLOCKED
+    assert directory.lookup("+19005").number is None
+    unknown = directory.lookup("+19005561234")  # Leaves the trie one digit short of the rule
+    assert unknown.category == UNKNOWN and unknown.number == "+19005561234"
+    assert directory.lookup("+447700900123").category == UNKNOWN
+    assert directory.lookup("anonymous").category == UNKNOWN
+
+def test_a_changed_config_or_table_rebuilds_the_index():
+    registry = Registry(allowed=["+15551230000"])
+    rows = [("+15557770000", "Aunt May")]
+    stamp = ['1']
+    directory = CallerDirectory(registry, db_loader=lambda: list(rows), db_fingerprint=lambda: stamp[0])
+    assert directory.lookup("+15557770000").name == "Aunt May"
+
+    rows.append(("+15558880000", "Uncle Ben"))
+    directory._reload_if_changed()  # Same fingerprints: the old index stays
+    assert directory.category("+15558880000") == UNKNOWN
+    stamp[0] = '2'
+    directory._reload_if_changed()
+    assert directory.category("+15558880000") == ALLOWED
+
+    registry.set(fingerprint='v2', blocked=["+15551230000"])
+    directory._reload_if_changed()
+    assert directory.category("+15551230000") == BLOCKED
+    assert len(directory) == 3
+
+def test_a_failed_rebuild_keeps_the_previous_index():
+    registry = Registry(allowed=["+15551230000"])
+    directory = CallerDirectory(registry)
+    registry.set(fingerprint='v2', ranges=[("+15559", "+155501")])
+    assert directory.reload() is False
+    assert directory.category("+15551230000") == ALLOWED
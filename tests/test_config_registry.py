@@ -0,0 +1,73 @@
+import os
+import pickle
+import shutil
+import time
+import pytest
+from utils.config_registry import SNAPSHOT_FORMAT, ConfigError, ConfigRegistry, Intent
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+@pytest.fixture
+def config_dir(tmp_path):
+    for name in os.listdir(os.path.join(ROOT, 'config')):
+        if name.endswith('.yml'):
+            shutil.copy(os.path.join(ROOT, 'config', name), tmp_path / name)
+    return tmp_path
+
+def touch(path, text):
+    path.write_text(text)
+    # Make sure the stamp moves even on filesystems with coarse mtimes.
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+def test_snapshot_is_typed_and_read_only(config_dir):
+    config = ConfigRegistry(str(config_dir)).get()
+    intents = config.intent_set("known")
+    assert intents.intents["speak_to_dad"].extension == "200"
+    assert intents.fast_path_threshold == 0.75
+    assert config.call_flow["caller_allowed"].targets("ask") == ("classify", "no_speech")
+    assert config.intent_set("missing").intents == {}
+    with pytest.raises(TypeError):
+        config.greetings["internal"] = {}
+
+def test_bad_edit_keeps_last_good_snapshot(config_dir):
+    registry = ConfigRegistry(str(config_dir), check_interval=0)
+    good = registry.get()
+    touch(config_dir / "owner_callers.yml", "owner_callers: [unclosed\n")
+    assert registry.get() is good
+    assert registry.reload() is False
+
+    touch(config_dir / "owner_callers.yml", 'owner_callers: ["+15559990000"]\n')
+    assert registry.get().owner_callers == ("+15559990000",)
+
+def test_stored_snapshot_skips_yaml_until_files_change(config_dir, tmp_path):
+    snapshot_path = str(tmp_path / "snapshot.msgpack")
+    first = ConfigRegistry(str(config_dir), snapshot_path=snapshot_path).get()
+    again = ConfigRegistry(str(config_dir), snapshot_path=snapshot_path).get()
+    assert again == first and again.loaded_at == first.loaded_at
+    assert isinstance(again.intent_set("known").intents["speak_to_dad"], Intent)
+    assert again.call_flow["caller_allowed"].targets("ask") == ("classify", "no_speech")
+    with pytest.raises(TypeError):
+        again.llm["timeout_seconds"] = 1
+
+    time.sleep(0.01)
+    touch(config_dir / "allowed_callers.yml", 'allowed_callers: ["+15551230000"]\n')
+    assert ConfigRegistry(str(config_dir), snapshot_path=snapshot_path).get().allowed_callers == ("+15551230000",)
+
+class Payload:
+    ran = False
+
+    def __reduce__(self):
+        return (setattr, (Payload, 'ran', True))
+
+def test_snapshot_files_are_never_unpickled(config_dir, tmp_path):
+    snapshot_path = tmp_path / "snapshot.msgpack"
+    snapshot_path.write_bytes(pickle.dumps({'format': SNAPSHOT_FORMAT, 'snapshot': Payload()}))
+    config = ConfigRegistry(str(config_dir), snapshot_path=str(snapshot_path)).get()
+    assert not Payload.ran
+    assert config.intent_set("known").intents["speak_to_dad"].extension == "200"
+
+def test_invalid_config_without_snapshot_fails_fast(config_dir):
+    touch(config_dir / "known_caller_intents.yml", "fast_path_threshold: 3\nintents: {}\n")
+    with pytest.raises(ConfigError):
+        ConfigRegistry(str(config_dir))
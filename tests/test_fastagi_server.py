@@ -0,0 +1,72 @@
+import socket
+import threading
+import pytest
+import fastagi_server
+from fastagi_server import FastAGIRequestHandler, FastAGIServer
+
+HANDSHAKE = (
+    "agi_network: yes\n"
+    "agi_network_script: ivr\n"
+    "agi_channel: SIP/trunk-00000001\n"
+    "agi_callerid: +15550001111\n"
+    "agi_uniqueid: 1700000000.1\n"
+    "\n"
+)
+
+class FakeHandler:
+    """Stands in for IVRHandler: records the call, sends one command and may fail."""
+    calls = []
+    error = None
+
+    def __init__(self, agi, resources=None):
+        self.agi = agi
+
+    def handle_call(self):
+        FakeHandler.calls.append(dict(self.agi.env))
+        self.agi.verbose("call started")
+        if FakeHandler.error is not None:
+            raise FakeHandler.error
+
+@pytest.fixture
+def server(monkeypatch):
+    FakeHandler.calls, FakeHandler.error = [], None
+    monkeypatch.setattr(fastagi_server, 'IVRHandler', FakeHandler)
+    monkeypatch.setattr(fastagi_server, 'get_shared_resources', lambda: None)
+    server = FastAGIServer(('127.0.0.1', 0), FastAGIRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def call(server, replies):
+    """Run one FastAGI session; returns the commands the server sent and whether it closed the socket."""
+    with socket.create_connection(server.server_address, timeout=5) as sock:
+        stream = sock.makefile('rw', encoding='utf-8', newline='\n')
+        stream.write(HANDSHAKE)
+        stream.flush()
+        commands = []
+        for reply in replies:
+            commands.append(stream.readline())
+            stream.write(reply)
+            stream.flush()
+        closed = stream.readline() == ''
+    return commands, closed
+
+def test_the_handshake_reaches_the_handler_and_commands_go_over_the_socket(server):
+    commands, closed = call(server, ["200 result=1\n"])
+    assert commands == ['VERBOSE "call started" 1\n']
+    assert closed
+    assert FakeHandler.calls[0]['agi_callerid'] == "+15550001111"
+    assert FakeHandler.calls[0]['agi_network_script'] == "ivr"
+
+def test_in_band_hangup_notices_are_not_taken_for_results(server):
+    commands, closed = call(server, ["HANGUP\n200 result=1\n"])
+    assert commands == ['VERBOSE "call started" 1\n'] and closed
+
+def test_a_failing_handler_closes_its_connection_and_the_server_keeps_serving(server):
+    FakeHandler.error = RuntimeError("boom")
+    assert call(server, ["200 result=1\n"]) == (['VERBOSE "call started" 1\n'], True)
+    FakeHandler.error = None
+    assert call(server, ["200 result=1\n"])[1]
+    assert len(FakeHandler.calls) == 2
@@ -0,0 +1,157 @@
+import time
+from types import SimpleNamespace
+import pytest
+from prometheus_client import REGISTRY
+import flow_engine
+from agi_handler import IVRHandler
+from call_state import CallState, get_call_flow
+from flow_engine import FlowEngine
+from speech_input import CallerInput
+from llm.llm_client import LLMClient
+from utils.config_registry import ConfigError, compile_flow
+from utils.rate_limiter import Decision
+
+class FakeAGI:
+    def __init__(self, digits=()):
+        self.env = {'agi_callerid': '+15550001111'}
+        self.played = []
+        self.variables = {}
+        self.hung_up = False
+        self.digits = list(digits)
+
+    def wait_for_digit(self, timeout):
+        return self.digits.pop(0) if self.digits else ''
+
+    def verbose(self, message, level=1):
+        pass
+
+    def set_variable(self, name, value):
+        self.variables[name] = value
+
+    def hangup(self):
+        self.hung_up = True
+
+class Sessions:
+    def __init__(self):
+        self.updates = []
+
+    def update_session(self, call_id, changes, removed=()):
+        self.updates.append(dict(changes))
+
+class Press(str):
+    """A keypad digit the caller presses in place of speaking."""
+
+def run(monkeypatch, flow_name, utterances, sessions=None, digits=()):
+    agi = FakeAGI(digits)
+    said = iter(utterances)
+    monkeypatch.setattr(flow_engine, 'play_prompt', lambda agi, text, **kwargs: agi.played.append(text))
+
+    def capture_input(agi, call_id, tag, keys='', budget=None):
+        heard = next(said)
+        assert not isinstance(heard, Press) or heard in keys
+        return CallerInput(heard, "", time.monotonic()) if isinstance(heard, Press) else (
+            CallerInput('', heard, time.monotonic()))
+
+    monkeypatch.setattr(flow_engine, 'capture_input', capture_input)
+    resources = type('Resources', (), {'sessions': sessions})() if sessions is not None else None
+    engine = FlowEngine(agi, get_call_flow(flow_name), llm=None, call_id='call-1', resources=resources)
+    return agi, engine.run()
+
+def test_unknown_caller_flow_retries_then_acts_on_the_intent(monkeypatch):
+    sessions = Sessions()
+    agi, state = run(monkeypatch, 'caller_unknown', ["", "We're calling about your car's extended warranty"],
+                     sessions)
+    assert agi.played == ["How can we help you?", "No speech recognized, please try again.",
+                          "How can we help you?", "It appears this is a sales call. Goodbye."]
+    assert agi.hung_up and state.current_state == 'sales_call' and state.intent == 'sales_call'
+    assert [update['state'] for update in sessions.updates] == ['no_speech', 'ask', 'classify', 'sales_call']
+    # The history is only written when it changed.
+    assert [len(update.get('history', ())) for update in sessions.updates] == [0, 0, 0, 2]
+
+def test_allowed_caller_flow_gives_up_after_three_silent_turns(monkeypatch):
+    agi, state = run(monkeypatch, 'caller_allowed', ["", "", ""])
+    assert agi.played[-1] == "Sorry, we cannot help with your request. Goodbye!"
+    assert agi.played.count("No speech recognized, please try again.") == 3
+    assert agi.hung_up and state.current_state == 'cannot_help'
+    assert state.visits[state.flow.index['ask']] == 3
+
+def test_transfer_sets_the_intents_extension(monkeypatch):
+    agi, _ = run(monkeypatch, 'caller_allowed', ["can I talk to dad"])
+    assert agi.variables == {"TRANSFER_EXTENSION": "200"}
+    assert agi.played[-1] == "Transferring your call to Dad."
+
+def test_invalid_flows_are_rejected_at_load():
+    ask = {'action': 'listen', 'transitions': {'speech': 'done', 'silence': 'ask'}}
+    with pytest.raises(ConfigError, match="no state with max_visits"):
+        compile_flow('f', {'start': 'ask', 'states': {'ask': ask, 'done': {}}}, 'f')
+    with pytest.raises(ConfigError, match="undefined state 'resolution'"):
+        compile_flow('f', {'start': 'a', 'states': {'a': {'transitions': {'next': 'resolution'}}}}, 'f')
+    with pytest.raises(ConfigError, match="unreachable state"):
+        compile_flow('f', {'start': 'a', 'states': {'a': {}, 'b': {}}}, 'f')
+    with pytest.raises(ConfigError, match="no state for outcome silence"):
+        compile_flow('f', {'start': 'a', 'states': {'a': {'action': 'listen', 'transitions': {'speech': 'a'}}}}, 'f')
+
+def test_call_state_transition_checks_the_table():
+    state = CallState(get_call_flow('caller_unknown'))
+    state.transition('no_speech')
+    assert state.current_state == 'no_speech'
+    with pytest.raises(ValueError):
+        state.transition('transfer')
+
+def test_shed_flows_act_on_their_fixed_intent_without_listening(monkeypatch):
+    agi, state = run(monkeypatch, 'caller_unknown_busy', [])
+    assert agi.played == ["We are very busy right now. Please call again later. Goodbye."]
+    assert agi.hung_up and state.intent == 'call_back_later'
+    menu = "Or press 1 to speak to Dad, or 2 to speak to Browny."
+    agi, _ = run(monkeypatch, 'caller_allowed_busy', [])
+    assert agi.played == ["All our lines are busy right now.", menu, menu, "Transferring your call to Dad."]
+    assert agi.variables == {"TRANSFER_EXTENSION": "200"}
+    agi, _ = run(monkeypatch, 'caller_allowed_busy', [], digits=['9', '2'])
+    assert agi.variables == {"TRANSFER_EXTENSION": "300"}
+
+def sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+def test_keypad_digit_resolves_the_intent_without_stt_or_llm(monkeypatch):
+    labels = {'flow': 'caller_allowed', 'path': 'dtmf'}
+    before = sample('flow_calls_total', labels)
+    agi, state = run(monkeypatch, 'caller_allowed', [Press('2')])
+    assert agi.played == ["How can we help you today? Please state your request.",
+                          "Or press 1 to speak to Dad, or 2 to speak to Browny.",
+                          "Transferring your call to Browny."]
+    assert agi.variables == {"TRANSFER_EXTENSION": "300"}
+    assert state.history[0] == {"role": "user", "content": "(pressed 2)"}
+    assert sample('flow_calls_total', labels) == before + 1
+    assert sample('flow_intent_seconds_count', {'flow': 'caller_allowed', 'input': 'dtmf'}) >= 1
+
+def test_digit_pressed_during_the_prompt_skips_the_menu_and_recording(monkeypatch):
+    monkeypatch.setattr(flow_engine, 'capture_input', lambda *args, **kwargs: pytest.fail("recorded"))
+    agi = FakeAGI()
+    pressed = iter(['1'])
+
+    def play_prompt(agi, text, escape_digits='', **kwargs):
+        agi.played.append(text)
+        return next(pressed, '') if escape_digits else ''
+
+    monkeypatch.setattr(flow_engine, 'play_prompt', play_prompt)
+    FlowEngine(agi, get_call_flow('caller_allowed'), llm=None, call_id='call-1').run()
+    assert agi.played == ["How can we help you today? Please state your request.", "Transferring your call to Dad."]
+    assert agi.variables == {"TRANSFER_EXTENSION": "200"}
+
+def test_rate_limited_llm_mid_call_finishes_on_the_shed_flow(monkeypatch):
+    llm = LLMClient(redis_client=SimpleNamespace(register_script=lambda script: None))
+    llm.response_cache = None
+    llm.rate_limiter = SimpleNamespace(
+        acquire=lambda rules, lease=None: Decision(False, 60.0, "llm:caller:+15550001111"))
+    handler = IVRHandler.__new__(IVRHandler)
+    handler.agi, handler.llm_client, handler.call_id, handler.caller_id = FakeAGI(), llm, 'call-1', '+15550001111'
+    handler.budget = handler.resources = handler.setup = None
+    handler.trace = SimpleNamespace(call_context='caller_unknown')
+    handler._route = lambda: handler._run_flow('caller_unknown')
+    monkeypatch.setattr(flow_engine, 'play_prompt', lambda agi, text, **kwargs: agi.played.append(text))
+    monkeypatch.setattr(flow_engine, 'capture_input', lambda *args, **kwargs: CallerInput(
+        '', "I have a question about my account", time.monotonic()))
+    handler._handle_call()
+    assert handler.agi.played == ["How can we help you?",
+                                  "We are very busy right now. Please call again later. Goodbye."]
+    assert handler.agi.hung_up
@@ -0,0 +1,107 @@
+import json
+from db.history_cache import HistoryCache
+
+class ListRedis:
+    """Redis lists in a dict, with the pipeline HistoryCache writes through."""
+    def __init__(self):
+        self.lists = {}
+
+    def lrange(self, key, start, end):
+        items = self.lists.get(key, [])
+        start = max(len(items) + start, 0) if start < 0 else start
+        end = len(items) + end if end < 0 else end
+        return items[start:end + 1]
+
+    def rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(value.encode() for value in values)
+
+    def rpushx(self, key, value):
+        if key in self.lists:
+            self.rpush(key, value)
+
+    def ltrim(self, key, start, end):
+        if key in self.lists:
+            self.lists[key] = self.lrange(key, start, end)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.lists.pop(key, None)
+
+    def expire(self, key, seconds):
+        pass
+
+    def pipeline(self):
+        return Pipeline(self)
+
+class Pipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((getattr(self.redis, name), args, kwargs))
+
+    def execute(self):
+        return [fn(*args, **kwargs) for fn, args, kwargs in self.calls]
+
+class BrokenPipeline(Pipeline):
+    def execute(self):
+        raise ConnectionError("Redis went away")
+
+class FakeDatabase:
+    def __init__(self, turns=()):
+        self.turns = list(turns)
+        self.queries = 0
+
+    def get_conversation_history(self, caller_cli, limit, budget=None):
+        self.queries += 1
+        return [dict(turn) for turn in self.turns[-limit:]]
+
+    def add_chat_history(self, caller_cli, call_id, role, message, session_data=None):
+        self.turns.append({"role": role, "message": message})
+
+def turn(n):
+    return {"role": "user", "message": f"turn {n}"}
+
+def messages(history):
+    return [entry["message"] for entry in history]
+
+def make_cache(turns=(), window=3):
+    redis, db = ListRedis(), FakeDatabase(turns)
+    return HistoryCache(redis, lambda: db, window=window), redis, db
+
+def test_a_miss_fills_the_window_and_the_next_read_hits():
+    cache, redis, db = make_cache([turn(n) for n in range(5)])
+    assert messages(cache.recent("+15550000000")) == ["turn 2", "turn 3", "turn 4"]
+    assert len(redis.lists["history:+15550000000"]) == 3
+    assert messages(cache.recent("+15550000000", limit=2)) == ["turn 3", "turn 4"]
+    assert db.queries == 1
+
+def test_appends_write_through_and_trim_to_the_window():
+    cache, redis, db = make_cache([turn(n) for n in range(3)])
+    cache.recent("+15550000000")
+    cache.append("+15550000000", "call-1", "user", "turn 3")
+    cache.append("+15550000000", "call-1", "user", "turn 4")
+    assert messages(cache.recent("+15550000000")) == ["turn 2", "turn 3", "turn 4"]
+    assert len(redis.lists["history:+15550000000"]) == 3
+    assert db.queries == 1 and messages(db.turns)[-1] == "turn 4"
+
+def test_appends_do_not_start_a_partial_window():
+    cache, redis, db = make_cache([turn(n) for n in range(3)])
+    cache.append("+15550000000", "call-1", "user", "turn 3")
+    assert "history:+15550000000" not in redis.lists
+    assert messages(cache.recent("+15550000000")) == ["turn 1", "turn 2", "turn 3"]
+
+def test_failed_cache_writes_drop_the_window():
+    cache, redis, db = make_cache([turn(n) for n in range(3)])
+    cache.recent("+15550000000")
+    redis.pipeline = lambda: BrokenPipeline(redis)
+    cache.append("+15550000000", "call-1", "user", "turn 3")
+    assert "history:+15550000000" not in redis.lists
+
+def test_corrupt_entries_are_dropped_and_reloaded():
+    cache, redis, db = make_cache([turn(n) for n in range(3)])
+    redis.rpush("history:+15550000000", json.dumps(turn(9)), '{"role": "us')
+    assert messages(cache.recent("+15550000000")) == ["turn 0", "turn 1", "turn 2"]
+    assert db.queries == 1
+    assert [json.loads(item) for item in redis.lists["history:+15550000000"]] == db.turns
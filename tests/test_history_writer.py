@@ -0,0 +1,42 @@
+import threading
+import time
+from sqlalchemy import create_engine
+from db.db import Database
+from db.history_writer import ChatHistoryWriter
+from db.models import Base
+
+def test_turns_are_batched_and_flushed_on_close(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/history.db")
+    Base.metadata.create_all(engine)
+    db = Database(startup_mode='skip', engine=engine)
+    batches = []
+    insert = db.insert_chat_history
+    db.history_writer.write_batch = lambda rows: (batches.append(len(rows)), insert(rows))
+    db.history_writer.flush_interval = 5.0  # Only size and close() trigger flushes here
+    db.history_writer.max_batch = 50
+
+    for i in range(120):
+        db.add_chat_history("+15550000000", "call-1", "user", f"turn {i}")
+    db.close()
+
+    assert sum(batches) == 120 and max(batches) == 50
+    history = Database(startup_mode='skip', engine=engine).get_conversation_history("+15550000000", limit=3)
+    assert [entry["message"] for entry in history] == ["turn 117", "turn 118", "turn 119"]
+
+def test_full_queue_falls_back_to_a_synchronous_write():
+    release = threading.Event()
+    written = []
+
+    def slow_write(rows):
+        release.wait(5)
+        written.extend(row["n"] for row in rows)
+
+    writer = ChatHistoryWriter(slow_write, max_batch=1, flush_interval=0, max_queue=1, put_timeout=0.05)
+    writer.enqueue({"n": 0})  # Taken by the flusher, which then blocks
+    time.sleep(0.05)
+    writer.enqueue({"n": 1})  # Fills the queue
+    threading.Timer(0.2, release.set).start()
+    writer.enqueue({"n": 2})  # Queue full: written inline once the database frees up
+    assert 2 in written
+    writer.close()
+    assert sorted(written) == [0, 1, 2]
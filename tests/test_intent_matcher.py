@@ -0,0 +1,82 @@
+import json
+import time
+from types import SimpleNamespace
+import pytest
+from prometheus_client import REGISTRY
+import flow_engine
+from call_state import get_call_flow
+from flow_engine import FlowEngine
+from intent_matcher import IntentMatcher, get_intent_matcher
+from speech_input import CallerInput
+
+INTENTS = {
+    "speak_to_dad": SimpleNamespace(phrases=("talk to dad",), keywords=("dad", "father")),
+    "sales_call": SimpleNamespace(phrases=("extended warranty",), keywords=("offer", "warranty")),
+}
+
+def fast_path(caller_type, result):
+    return REGISTRY.get_sample_value('intent_fast_path_total', {'caller_type': caller_type, 'result': result}) or 0.0
+
+def test_phrases_and_keywords_score_and_ambiguity_is_penalized():
+    matcher = IntentMatcher(INTENTS)
+    assert matcher.match("Can I TALK to Dad, please?") == ("speak_to_dad", pytest.approx(1.0))  # Phrase + keyword
+    assert matcher.match("is my father or dad around") == ("speak_to_dad", pytest.approx(0.6))
+    intent, confidence = matcher.match("talk to dad about the offer")
+    assert intent == "speak_to_dad" and confidence == pytest.approx(1.0 - 0.5 * 0.3)
+    assert matcher.match("hello there") == (None, 0.0)
+
+def test_the_threshold_is_inclusive():
+    text = "is my father or dad around"  # Two keywords: 0.6
+    assert IntentMatcher(INTENTS, threshold=0.6).route(text, "known") == "speak_to_dad"
+    assert IntentMatcher(INTENTS, threshold=0.61).route(text, "known") is None
+
+def test_route_counts_hits_and_misses_per_caller_type():
+    matcher = IntentMatcher(INTENTS)
+    hits, misses = fast_path("known", "hit"), fast_path("known", "miss")
+    matcher.route("talk to dad", "known")
+    matcher.route("what's the weather like", "known")
+    assert fast_path("known", "hit") == hits + 1
+    assert fast_path("known", "miss") == misses + 1
+
+def test_each_caller_type_routes_only_its_own_intents():
+    assert get_intent_matcher("known").route("can I talk to dad", "known") == "speak_to_dad"
+    assert get_intent_matcher("unknown").route("can I talk to dad", "unknown") is None
+    assert get_intent_matcher("unknown").route("about your car's extended warranty", "unknown") == "sales_call"
+    assert get_intent_matcher("known") is get_intent_matcher("known")
+
+class FakeLLM:
+    def __init__(self, reply):
+        self.reply = reply
+        self.prompts = []
+
+    def get_response(self, prompt, timeout=None, budget=None):
+        self.prompts.append(prompt)
+        return {"text": json.dumps(self.reply)}
+
+class FakeAGI:
+    def __init__(self):
+        self.env = {'agi_callerid': '+15550001111'}
+        self.played = []
+        self.variables = {}
+
+    def verbose(self, message, level=1):
+        pass
+
+    def set_variable(self, name, value):
+        self.variables[name] = value
+
+def classify(monkeypatch, text, llm):
+    agi = FakeAGI()
+    monkeypatch.setattr(flow_engine, 'play_prompt', lambda agi, text, **kwargs: agi.played.append(text))
+    monkeypatch.setattr(flow_engine, 'capture_input', lambda *args, **kwargs: CallerInput('', text, time.monotonic()))
+    state = FlowEngine(agi, get_call_flow('caller_allowed'), llm=llm, call_id='call-1').run()
+    return agi, state
+
+def test_the_llm_is_asked_only_when_the_matcher_is_not_confident(monkeypatch):
+    llm = FakeLLM({"intent": "speak_to_browny", "message": "Transferring your call to Browny."})
+    agi, state = classify(monkeypatch, "could you talk to dad", llm)
+    assert state.intent == "speak_to_dad" and llm.prompts == []
+    agi, state = classify(monkeypatch, "I'd like a word with the dog's owner", llm)
+    assert state.intent == "speak_to_browny"
+    assert [prompt["current_input"] for prompt in llm.prompts] == ["I'd like a word with the dog's owner"]
+    assert agi.variables == {"TRANSFER_EXTENSION": "300"}
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import pytest
+import yaml
+from llm.fake_server import FakeLLMServer
+from llm.llm_client import FALLBACK_REPLY, LLMClient
+from utils import resilience
+from utils.resilience import OPEN, CircuitBreaker, DependencyUnavailable
+
+REPLY = json.dumps({"intent": "chat", "message": "The alarm is set."})
+PROMPT = {"caller_id": "+15550000000", "call_context": "internal", "chat_history": [],
+          "current_input": "is the alarm on"}
+
+class BreakerRedis:
+    """The Redis calls CircuitBreaker makes, backed by a dict (no expiry)."""
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, *keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value).encode()
+        return True
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+        return int(self.data[key])
+
+    def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    def pipeline(self):
+        return Pipeline(self)
+
+    def register_script(self, script):
+        return None
+
+class Pipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+class MemoryCache:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, prompt):
+        return self.entries.get(prompt['current_input'])
+
+    def put(self, prompt, response):
+        self.entries[prompt['current_input']] = response
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker('llm', BreakerRedis(), fail_max=2, refresh_seconds=0)
+    monkeypatch.setitem(resilience._breakers, 'llm', breaker)
+    return breaker
+
+def make_client(tmp_path, server, **config):
+    path = tmp_path / 'llm_config.yml'
+    path.write_text(yaml.safe_dump(dict({"api_endpoint": server.url, "api_key": "test", "timeout_seconds": 2,
+                                         "max_retries": 0}, **config)))
+    client = LLMClient(config_path=str(path), redis_client=BreakerRedis())
+    client._check_rate_limits = lambda prompt, timeout=None: timeout
+    return client
+
+def test_client_errors_do_not_trip_the_breaker(tmp_path, breaker):
+    with FakeLLMServer(REPLY, error_rate=1.0, error_status=400) as server:
+        client = make_client(tmp_path, server)
+        for _ in range(3):
+            assert client.get_response(PROMPT)["text"] == FALLBACK_REPLY
+        assert breaker.state != OPEN
+        server.error_status = 503
+        for _ in range(2):
+            assert client.get_response(PROMPT)["text"] == FALLBACK_REPLY
+    assert breaker.state == OPEN
+
+def test_async_path_shares_the_breaker_and_the_cache(tmp_path, breaker):
+    async def ask(client):
+        try:
+            return await client.get_response_async(PROMPT)
+        finally:
+            await client.aclose()
+
+    with FakeLLMServer(REPLY) as server:
+        client = make_client(tmp_path, server, http2=True)
+        client.response_cache = MemoryCache()
+        assert asyncio.run(ask(client))["text"] == REPLY
+        assert asyncio.run(ask(client))["text"] == REPLY
+        assert len(server.requests) == 1
+
+        client.response_cache = None
+        server.error_rate = 1.0
+        for _ in range(2):
+            assert asyncio.run(ask(client))["text"] == FALLBACK_REPLY
+        assert breaker.state == OPEN
+        with pytest.raises(DependencyUnavailable):
+            asyncio.run(ask(client))
@@ -0,0 +1,57 @@
+import json
+import requests
+from llm.fake_server import FakeLLMServer
+from llm.streaming import JSONFieldStream, SentenceSplitter, iter_sse_deltas
+from playback import play_streaming_reply
+
+REPLY = json.dumps({
+    "intent": "chat",
+    "message": "Good evening. The garage door is closed and the alarm is set. Anything else?",
+})
+
+class FakeAGI:
+    def __init__(self):
+        self.played = []
+        self.env = {}
+
+    def verbose(self, message, level=1):
+        pass
+
+    def stream_file(self, filename, escape_digits='', sample_offset=0):
+        with open(filename + '.wav') as f:
+            self.played.append(f.read())
+        return ''
+
+def _fake_synthesize(text, output_file, **kwargs):
+    with open(output_file, 'w') as f:
+        f.write(text)
+    return True
+
+def test_message_field_is_extracted_across_split_escapes():
+    stream = JSONFieldStream('message')
+    raw = '{"intent": "x", "message": "Say \\"hi\\" \\u00e9 now"}'
+    out = ''.join(stream.feed(raw[i:i + 3]) for i in range(0, len(raw), 3))
+    assert out == 'Say "hi" é now'
+    assert stream.closed
+
+def test_sentence_splitter_merges_short_fragments():
+    splitter = SentenceSplitter(min_chars=10)
+    assert splitter.feed("Hi. There you go. And ") == ["Hi. There you go."]
+    assert splitter.flush() == ["And"]
+
+def test_streamed_reply_plays_sentence_by_sentence():
+    with FakeLLMServer(REPLY, token_delay=0.001) as server:
+        response = requests.post(server.url, json={"messages": [], "stream": True}, stream=True)
+        agi = FakeAGI()
+        raw, spoken = play_streaming_reply(agi, iter_sse_deltas(response.iter_lines()), "internal",
+                                           synthesize=_fake_synthesize)
+    assert json.loads(raw) == json.loads(REPLY)
+    assert spoken == 2
+    assert agi.played == ["Good evening. The garage door is closed and the alarm is set.", "Anything else?"]
+
+def test_fake_server_injects_errors_and_answers_per_request():
+    with FakeLLMServer(lambda body: body["messages"][-1]["content"].upper(), error_rate=1.0) as server:
+        assert requests.post(server.url, json={"messages": [{"role": "user", "content": "hi"}]}).status_code == 503
+        server.error_rate = 0.0
+        response = requests.post(server.url, json={"messages": [{"role": "user", "content": "hi"}]})
+    assert response.json()["choices"][0]["message"]["content"] == "HI"
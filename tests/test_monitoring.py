@@ -0,0 +1,69 @@
+import glob
+import logging
+import os
+import subprocess
+import sys
+from prometheus_client.multiprocess import MultiProcessCollector
+from monitoring import compact
+from utils.logger import logger
+from utils.tracing import finish_trace, stage, start_trace
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CALL = """
+import os, sys
+sys.path[:0] = [os.path.join(sys.argv[1], 'src'), os.path.join(sys.argv[1], 'src', 'ivr')]
+from prometheus_client import Gauge
+from utils.tracing import start_trace, stage
+start_trace('call').set_context('caller_unknown')
+with stage('stt'):
+    pass
+Gauge('test_in_flight', 'In flight', multiprocess_mode='livesum').set(1)
+"""
+
+def _run_calls(metrics_dir, count):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(metrics_dir), LOG_LEVEL='ERROR')
+    for _ in range(count):
+        subprocess.run([sys.executable, '-c', CALL, ROOT], env=env, check=True, cwd=ROOT)
+
+def _stt_count(metrics_dir):
+    for metric in MultiProcessCollector.merge(glob.glob(os.path.join(metrics_dir, '*.db'))):
+        for sample in metric.samples:
+            if sample.name == 'ivr_turn_stage_seconds_count' and sample.labels['stage'] == 'stt':
+                return sample.value
+    return 0
+
+def test_exited_processes_are_folded_into_the_archive(tmp_path):
+    _run_calls(tmp_path, 3)
+    assert len(glob.glob(os.path.join(tmp_path, 'histogram_*.db'))) == 3
+    assert compact(tmp_path) >= 3
+    assert [os.path.basename(f) for f in glob.glob(os.path.join(tmp_path, '*.db'))] == ['histogram_archive.db']
+    assert _stt_count(tmp_path) == 3
+
+    _run_calls(tmp_path, 2)
+    compact(tmp_path)
+    assert _stt_count(tmp_path) == 5  # Totals keep growing across compactions
+
+def test_log_lines_and_turn_timings_carry_the_trace():
+    class Capture(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.records = []
+
+        def emit(self, record):
+            self.records.append(record)
+
+    capture = Capture()
+    capture.addFilter(logger.handlers[0].filters[0])
+    logger.addHandler(capture)
+    try:
+        trace = start_trace('call-7')
+        trace.set_context('internal')
+        with stage('llm'):
+            logger.warning("inside the call")
+        finish_trace()
+    finally:
+        logger.removeHandler(capture)
+    assert all(record.trace_id == trace.trace_id for record in capture.records)
+    timings = [record for record in capture.records if hasattr(record, 'stages_ms')]
+    assert list(timings[0].stages_ms) == ['llm'] and timings[0].call_context == 'internal'
@@ -0,0 +1,54 @@
+from llm.prompt_builder import PromptBuilder, SUMMARY_HEADER, message_tokens
+
+class DictRedis:
+    """The two Redis calls PromptBuilder makes, backed by a dict."""
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+def conversation(turns):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Turn {i}: could you check whether the parcel for order {i} has shipped yet?"})
+        history.append({"role": "llm", "content": f"Order {i} left the warehouse this morning and should arrive tomorrow."})
+    return history
+
+def build(builder, history, text="What about the next one?", caller_id="+15550000000"):
+    return builder.build({"caller_id": caller_id, "chat_history": history, "current_input": text,
+                          "call_context": "internal"}, {"llm": "assistant"})
+
+def test_prompt_size_stays_bounded_as_the_conversation_grows():
+    builder = PromptBuilder("Answer as JSON.", DictRedis(), contexts={"internal": 600}, summary_tokens=150)
+    sizes = []
+    for turns in (1, 10, 50, 200):
+        messages = build(builder, conversation(turns))
+        sizes.append(sum(message_tokens(m) for m in messages))
+        assert messages[-1] == {"role": "user", "content": "What about the next one?"}
+    assert max(sizes) <= 600
+    assert sizes[-1] - sizes[-2] < 30  # Flat once compaction kicks in
+
+def test_system_prefix_is_stable_and_older_turns_are_summarized():
+    redis = DictRedis()
+    builder = PromptBuilder("Answer as JSON.", redis, contexts={"internal": 400}, summary_tokens=150)
+    short = build(builder, conversation(2))
+    long = build(builder, conversation(40))
+    assert short[0] == long[0] and "Valid values" in long[0]["content"]
+    assert long[1]["role"] == "system" and long[1]["content"].startswith(SUMMARY_HEADER)
+    assert "+15550000000" in "".join(redis.data)
+
+    # The stored summary carries into the caller's next call, even with little history.
+    next_call = build(builder, conversation(1), caller_id="+15550000000")
+    assert next_call[1]["content"] == long[1]["content"]
+
+def test_turns_are_not_summarized_twice():
+    redis = DictRedis()
+    builder = PromptBuilder("Answer as JSON.", redis, contexts={"internal": 400}, summary_tokens=400)
+    history = conversation(12)
+    first = build(builder, history)[1]["content"]
+    again = build(builder, history)[1]["content"]
+    assert first == again
@@ -0,0 +1,80 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import pytest
+from prometheus_client import REGISTRY
+from utils import rate_limiter
+from utils.rate_limiter import Rate, RateLimiter
+
+# The GCRA script runs for real, on fakeredis' Lua interpreter.
+pytest.importorskip('lupa')
+fakeredis = pytest.importorskip('fakeredis')
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+def redis_calls():
+    return REGISTRY.get_sample_value('rate_limit_redis_calls_total') or 0.0
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeRedis(server=fakeredis.FakeServer())
+
+def test_a_burst_is_allowed_then_the_rate_applies(redis):
+    limiter = RateLimiter(redis)
+    rules = {"caller:1": Rate(2, 60, burst=5)}
+    assert [limiter.acquire(rules).allowed for _ in range(6)] == [True] * 5 + [False]
+
+def test_denials_say_which_key_and_when_to_retry(redis):
+    limiter = RateLimiter(redis)
+    rules = {"caller:1": Rate(1, 60), "global": Rate(100, 60)}
+    assert limiter.acquire(rules).allowed
+    decision = limiter.acquire(rules)
+    assert not decision.allowed
+    assert decision.limited_key == "caller:1"
+    assert decision.retry_after == pytest.approx(60, abs=0.5)
+    # Nothing is charged on a denial: the global key still has its full burst less one.
+    assert all(limiter.acquire({"global": Rate(100, 60)}).allowed for _ in range(99))
+    assert not limiter.acquire({"global": Rate(100, 60)}).allowed
+
+def test_leased_tokens_are_served_locally_until_they_expire(redis, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter, 'time', SimpleNamespace(monotonic=clock.monotonic))
+    limiter = RateLimiter(redis, lease_ttl=1.0)
+    rules, lease = {"global": Rate(100, 60)}, {"global": 5}
+    before = redis_calls()
+    assert all(limiter.acquire(rules, lease).allowed for _ in range(5))
+    assert redis_calls() - before == 1
+    clock.now += 1.5  # The lease expires
+    assert limiter.acquire(rules, lease).allowed
+    assert redis_calls() - before == 2
+    assert limiter._leases["global"][0] == 4
+
+def test_leased_tokens_come_back_when_another_key_denies(redis):
+    limiter = RateLimiter(redis)
+    rules, lease = {"caller:1": Rate(1, 60), "global": Rate(100, 60)}, {"global": 3}
+    assert limiter.acquire(rules, lease).allowed
+    assert limiter._leases["global"][0] == 2
+    assert not limiter.acquire(rules, lease).allowed
+    assert limiter._leases["global"][0] == 2
+
+@pytest.mark.parametrize('lease', [None, {"global": 3}])
+def test_concurrent_workers_never_exceed_the_rate(redis, lease):
+    # Four workers, each with its own limiter (and leases), sharing one Redis.
+    limiters = [RateLimiter(redis) for _ in range(4)]
+    rules = {"global": Rate(10, 60)}
+    start = threading.Barrier(8)
+
+    def worker(limiter):
+        start.wait()
+        return sum(limiter.acquire(rules, lease).allowed for _ in range(10))
+
+    with ThreadPoolExecutor(8) as pool:
+        allowed = sum(pool.map(worker, limiters * 2))
+    assert allowed <= 10
+    if lease is None:
+        assert allowed == 10
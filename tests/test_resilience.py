@@ -0,0 +1,165 @@
+import pytest
+from utils.resilience import (
+    CLOSED, HALF_OPEN, OPEN, CallBudget, CircuitBreaker, DependencyUnavailable, guarded,
+)
+
+class DictRedis:
+    """The Redis calls CircuitBreaker makes, backed by a dict (no expiry)."""
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, *keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value).encode()
+        return True
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+        return int(self.data[key])
+
+    def pexpire(self, key, ms):
+        return True
+
+    def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    def pipeline(self):
+        return Pipeline(self)
+
+class Pipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def breaker(name, redis):
+    return CircuitBreaker(name, redis, fail_max=3, refresh_seconds=0)
+
+def test_failures_in_one_worker_open_the_breaker_for_all():
+    redis = DictRedis()
+    first, second = breaker("llm", redis), breaker("llm", redis)
+    for _ in range(3):
+        assert first.before_call() is False
+        first.record_failure()
+    assert second.state == OPEN
+    with pytest.raises(DependencyUnavailable):
+        second.before_call()
+
+def test_one_worker_probes_after_the_reset_timeout():
+    redis = DictRedis()
+    first, second = breaker("stt", redis), breaker("stt", redis)
+    for _ in range(3):
+        first.record_failure()
+    redis.delete(first.key('open'))  # Reset timeout elapsed
+    assert first.state == HALF_OPEN and second.state == HALF_OPEN
+    assert first.before_call() is True
+    with pytest.raises(DependencyUnavailable):
+        second.before_call()
+    first.record_success(probe=True)
+    assert second.state == CLOSED
+    assert second.before_call() is False
+
+def test_failed_probe_reopens_the_breaker():
+    redis = DictRedis()
+    cb = breaker("tts", redis)
+    for _ in range(3):
+        cb.record_failure()
+    redis.delete(cb.key('open'))
+    probe = cb.before_call()
+    cb.record_failure(probe)
+    assert cb.state == OPEN
+
+class ExpiringRedis(DictRedis):
+    """DictRedis whose PX and PEXPIRE deadlines pass as clock.now advances."""
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+        self.deadlines = {}
+
+    def _purge(self):
+        for key, deadline in list(self.deadlines.items()):
+            if deadline <= self.clock.now:
+                self.data.pop(key, None)
+                del self.deadlines[key]
+
+    def set(self, key, value, nx=False, px=None):
+        self._purge()
+        result = super().set(key, value, nx, px)
+        if result and px is not None:
+            self.deadlines[key] = self.clock.now + px / 1000
+        return result
+
+    def incr(self, key):
+        self._purge()
+        return super().incr(key)
+
+    def pexpire(self, key, ms):
+        self.deadlines[key] = self.clock.now + ms / 1000
+        return True
+
+def test_sparse_failures_do_not_add_up_past_the_window():
+    clock = Clock()
+    cb = CircuitBreaker("llm", ExpiringRedis(clock), fail_max=3, failure_window_seconds=30, refresh_seconds=0)
+    for _ in range(6):
+        cb.record_failure()
+        clock.now += 20  # One failure every 20 s never makes 3 in one 30 s window
+    assert cb.state == CLOSED
+    for _ in range(3):
+        cb.record_failure()
+    assert cb.state == OPEN
+
+def test_breaker_without_redis_stays_closed():
+    cb = CircuitBreaker("db", None, fail_max=1, refresh_seconds=0)
+    cb.record_failure()
+    assert cb.before_call() is False
+
+def test_slices_shrink_with_the_turn_and_stop_at_the_minimum():
+    clock = Clock()
+    budget = CallBudget(60, 10, {"llm": 8, "tts": 4}, min_slice_seconds=0.5, clock=clock)
+    assert budget.slice("llm") == 8
+    clock.now += 7
+    assert budget.slice("llm") == pytest.approx(3)
+    assert budget.slice("tts") == pytest.approx(3)
+    clock.now += 2.8
+    with pytest.raises(DependencyUnavailable):
+        budget.slice("tts")
+    budget.start_turn()
+    assert budget.slice("tts") == 4
+
+def test_turns_never_outlive_the_call():
+    clock = Clock()
+    budget = CallBudget(12, 10, {"llm": 8}, clock=clock)
+    clock.now += 9
+    budget.start_turn()
+    assert budget.slice("llm") == pytest.approx(3)
+
+def test_guarded_yields_the_slice_and_skips_spent_dependencies():
+    clock = Clock()
+    budget = CallBudget(60, 5, {"db": 1}, min_slice_seconds=0.2, clock=clock)
+    with guarded("db", budget, default_timeout=30) as timeout:
+        assert timeout == 1
+    with guarded("db", None, default_timeout=30) as timeout:
+        assert timeout == 30
+    clock.now += 4.9
+    with pytest.raises(DependencyUnavailable):
+        with guarded("db", budget):
+            pass
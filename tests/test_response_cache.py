@@ -0,0 +1,109 @@
+import json
+from llm.response_cache import LLMResponseCache
+
+class CacheRedis:
+    def __init__(self, data=()):
+        self.data = dict(data)
+        self.index = {}
+        self.reads = 0
+
+    def get(self, key):
+        self.reads += 1
+        return self.data.get(key)
+
+    def setex(self, key, seconds, value):
+        self.data[key] = value.encode()
+
+    def zadd(self, key, mapping):
+        self.index.update(mapping)
+
+    def zcard(self, key):
+        return len(self.index)
+
+    def zpopmin(self, key, count):
+        popped = sorted(self.index.items(), key=lambda item: item[1])[:count]
+        for member, _ in popped:
+            del self.index[member]
+        return popped
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def pipeline(self):
+        return Pipeline(self)
+
+class Pipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((getattr(self.redis, name), args, kwargs))
+
+    def execute(self):
+        return [fn(*args, **kwargs) for fn, args, kwargs in self.calls]
+
+def prompt(text, history=(), call_context="caller_unknown"):
+    return {"call_context": call_context, "chat_history": list(history), "current_input": text}
+
+def reply(intent, message="Goodbye."):
+    return {"text": json.dumps({"intent": intent, "message": message})}
+
+def test_corrupt_redis_entries_are_dropped_as_misses():
+    prompt = {"call_context": "caller_unknown", "chat_history": [], "current_input": "is this the garage"}
+    key = LLMResponseCache(None).key_for(prompt)
+    redis = CacheRedis({key: b'{"text": "{\\"intent\\": \\"sales'})
+    cache = LLMResponseCache(redis)
+    assert cache.get(prompt) is None
+    assert key not in redis.data
+    redis.data[key] = b'{"text": "hello"}'
+    assert cache.get(prompt) == {"text": "hello"}
+
+def test_keys_ignore_filler_punctuation_and_assistant_turns():
+    key_for = LLMResponseCache(None).key_for
+    key = key_for(prompt("Is this the garage?"))
+    assert key_for(prompt("um, is this... the GARAGE")) == key
+    assert key_for(prompt("is this the garage", [{"role": "assistant", "content": "How can we help you?"},
+                                                 {"role": "user", "content": "is this the garage"}])) == key
+    assert key_for(prompt("is this the garage", [{"role": "user", "message": "hello"}])) != key
+    assert key_for(prompt("is this the garage", call_context="caller_allowed")) != key
+    assert key_for(prompt("is this the garage", call_context="internal")) is None
+    assert key_for(prompt("um, uh...")) is None
+
+def test_editing_the_intents_changes_the_keys(monkeypatch):
+    cache = LLMResponseCache(None)
+    key = cache.key_for(prompt("is this the garage"))
+    intents = cache._intent_config("caller_unknown")[1]
+    monkeypatch.setattr(cache, '_intent_config', lambda call_context: ("edited", intents))
+    assert cache.key_for(prompt("is this the garage")) != key
+
+def test_only_replies_naming_a_configured_intent_are_stored():
+    redis = CacheRedis()
+    cache = LLMResponseCache(redis)
+    assert not cache.put(prompt("win a cruise"), {"text": "not json"})
+    assert not cache.put(prompt("win a cruise"), {"text": json.dumps(["sales_call"])})
+    assert not cache.put(prompt("win a cruise"), reply("speak_to_dad"))  # A known caller intent
+    assert cache.get(prompt("win a cruise")) is None and redis.data == {}
+    assert cache.put(prompt("win a cruise"), reply("sales_call"))
+    assert LLMResponseCache(redis).get(prompt("win a cruise")) == reply("sales_call")
+
+def test_the_local_tier_serves_hot_keys_and_evicts_the_least_recent():
+    redis = CacheRedis()
+    cache = LLMResponseCache(redis, local_max_entries=2)
+    for text in ("one", "two"):
+        cache.put(prompt(text), reply("sales_call", text))
+    assert cache.get(prompt("one")) == reply("sales_call", "one")
+    assert redis.reads == 0
+    cache.put(prompt("three"), reply("sales_call", "three"))  # Pushes out "two", the least recently used
+    assert cache.get(prompt("one")) and cache.get(prompt("three")) and redis.reads == 0
+    assert cache.get(prompt("two")) == reply("sales_call", "two")
+    assert redis.reads == 1
+
+def test_redis_entries_are_capped_oldest_first():
+    redis = CacheRedis()
+    cache = LLMResponseCache(redis, max_entries=2)
+    for text in ("one", "two", "three"):
+        cache.put(prompt(text), reply("sales_call", text))
+    assert LLMResponseCache(redis).get(prompt("one")) is None
+    assert LLMResponseCache(redis).get(prompt("three")) == reply("sales_call", "three")
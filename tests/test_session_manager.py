@@ -0,0 +1,102 @@
+from cryptography.fernet import Fernet
+from redis.exceptions import WatchError
+from session_manger import SessionManager
+
+class HashRedis:
+    """Redis hashes in a dict, with the pipeline SessionManager writes through."""
+    def __init__(self):
+        self.hashes = {}
+        # Run once after the next read made under WATCH: another worker writing in between.
+        self.after_watched_read = None
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def hmget(self, key, fields):
+        return [self.hget(key, field.encode()) for field in fields]
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(
+            (name.encode() if isinstance(name, str) else name, value) for name, value in mapping.items())
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field.encode(), None)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.hashes.pop(key, None)
+
+    def expire(self, key, seconds):
+        pass
+
+    def pipeline(self, transaction=True):
+        return Pipeline(self)
+
+class Pipeline:
+    """Queues commands; after watch() and until multi() they run at once, as in redis-py."""
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+        self.watched = {}
+        self.immediate = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.watched, self.immediate = {}, False
+
+    def watch(self, *keys):
+        self.watched = {key: dict(self.redis.hashes.get(key, {})) for key in keys}
+        self.immediate = True
+
+    def multi(self):
+        self.immediate = False
+
+    def __getattr__(self, name):
+        fn = getattr(self.redis, name)
+        if self.immediate:
+            return lambda *args, **kwargs: self._read(fn, *args, **kwargs)
+        return lambda *args, **kwargs: self.calls.append((fn, args, kwargs))
+
+    def _read(self, fn, *args, **kwargs):
+        result = fn(*args, **kwargs)
+        interleave, self.redis.after_watched_read = self.redis.after_watched_read, None
+        if interleave:
+            interleave()
+        return result
+
+    def execute(self):
+        if any(self.redis.hashes.get(key, {}) != before for key, before in self.watched.items()):
+            raise WatchError("Watched variable changed.")
+        return [fn(*args, **kwargs) for fn, args, kwargs in self.calls]
+
+def test_saves_do_not_diff_against_a_copy_another_worker_replaced(monkeypatch):
+    monkeypatch.setenv('SESSION_KEY', Fernet.generate_key().decode())
+    redis = HashRedis()
+    ours, theirs = SessionManager(redis), SessionManager(redis)
+    ours.save_session('call-1', {'state': 'ask', 'retries': 0})
+    assert ours.get_session('call-1') == {'state': 'ask', 'retries': 0}
+    theirs.update_session('call-1', {'state': 'classify'})
+    # Back to the value our stale copy holds: it must still be written.
+    ours.save_session('call-1', {'state': 'ask', 'retries': 1})
+    assert theirs.get_session('call-1') == {'state': 'ask', 'retries': 1}
+    # With a current copy only the changed field is written.
+    ours.get_session('call-1')
+    ours.save_session('call-1', {'state': 'ask', 'retries': 2})
+    assert theirs.get_session('call-1', ['retries']) == {'retries': 2}
+
+def test_a_write_between_the_version_check_and_the_save_is_not_diffed_against(monkeypatch):
+    monkeypatch.setenv('SESSION_KEY', Fernet.generate_key().decode())
+    redis = HashRedis()
+    ours, theirs = SessionManager(redis), SessionManager(redis)
+    ours.save_session('call-1', {'state': 'ask', 'retries': 0})
+    # The version check passes, then another worker writes before our diff lands.
+    redis.after_watched_read = lambda: theirs.update_session('call-1', {'state': 'classify', 'retries': 5})
+    ours.save_session('call-1', {'state': 'ask', 'retries': 1})
+    assert theirs.get_session('call-1') == {'state': 'ask', 'retries': 1}
+    assert ours.get_session('call-1') == {'state': 'ask', 'retries': 1}
@@ -0,0 +1,60 @@
+import threading
+import time
+import pytest
+from utils.speech_pool import PooledSpeech, SpeechPool
+
+class Factory:
+    """Builds numbered PooledSpeech objects and records the timeouts it was given."""
+    def __init__(self):
+        self.built = 0
+        self.timeouts = []
+        self.lock = threading.Lock()
+
+    def __call__(self, timeout):
+        with self.lock:
+            self.built += 1
+            self.timeouts.append(timeout)
+            return PooledSpeech(self.built)
+
+def wait_for(condition, seconds=2.0):
+    deadline = time.monotonic() + seconds
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_reusable_objects_are_handed_out_again():
+    factory = Factory()
+    pool = SpeechPool('tts', factory, size=1)
+    with pool.lease() as first:
+        pass
+    with pool.lease() as second:
+        pass
+    assert first == second == 1 and factory.built == 1
+
+def test_single_use_objects_are_replaced_in_the_background():
+    factory = Factory()
+    pool = SpeechPool('stt', factory, size=2, reusable=False, check_interval_seconds=60).start()
+    wait_for(lambda: pool.idle_count() == 2)
+    with pool.lease() as target:
+        assert target in (1, 2)
+    wait_for(lambda: pool.idle_count() == 2)
+    assert factory.built == 3
+    assert factory.timeouts == [3.0] * 3  # Background builds get connect_timeout_seconds
+    pool.close()
+
+def test_idle_disconnected_and_failed_objects_are_not_reused():
+    factory = Factory()
+    pool = SpeechPool('tts', factory, size=2, max_idle_seconds=60)
+    items = [pool.acquire(timeout=0.5) for _ in range(3)]
+    assert factory.timeouts == [0.5] * 3  # Cold builds are bounded by the caller's time
+    items[1].connected = False
+    pool.release(items[0])
+    pool.release(items[1])
+    pool.release(items[2], ok=False)
+    assert pool.idle_count() == 1
+    items[0].idle_since -= 120
+    with pytest.raises(RuntimeError):
+        with pool.lease() as target:
+            assert target == 4  # The idle one was closed instead
+            raise RuntimeError("synthesis failed")
+    assert pool.idle_count() == 0 and factory.built == 4
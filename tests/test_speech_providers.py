@@ -0,0 +1,117 @@
+import os
+import time
+from types import SimpleNamespace
+import pytest
+import utils.cpu_pool as cpu_pool
+from utils.cpu_pool import CPUPool
+from utils.resilience import DependencyUnavailable
+from stt import providers as stt_providers
+from tts import providers as tts_providers
+
+def use_speech_config(monkeypatch, module, speech):
+    monkeypatch.setattr(module, 'get_config', lambda: SimpleNamespace(speech=speech))
+
+class Engine:
+    """An STT engine that returns its name, or raises error, and records what it was sent."""
+    def __init__(self, name, error=None):
+        self.name = name
+        self.error = error
+        self.calls = 0
+
+    def __call__(self, pcm, sample_rate, budget):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.name
+
+def test_stt_engine_follows_context_length_and_fallback(monkeypatch):
+    use_speech_config(monkeypatch, stt_providers, {'providers': {'stt': {
+        'default': 'cloud', 'short': 'local', 'short_max_seconds': 1.0, 'fallback': 'local',
+        'contexts': {'internal': {'short': None}},
+    }}})
+    cloud, local = Engine('cloud'), Engine('local')
+    monkeypatch.setattr(stt_providers, 'STT_ENGINES', {'cloud': cloud, 'local': local})
+    half_second, two_seconds = bytes(16000), bytes(64000)
+
+    assert stt_providers.recognize(half_second, 16000, 'caller_unknown') == 'local'
+    assert stt_providers.recognize(two_seconds, 16000, 'caller_unknown') == 'cloud'
+    assert stt_providers.recognize(half_second, 16000, 'internal') == 'cloud'
+
+    cloud.error = TimeoutError("stt did not finish within 3.00s")
+    assert stt_providers.recognize(two_seconds, 16000, 'caller_unknown') == 'local'
+    local.error = DependencyUnavailable('local', "breaker open")
+    with pytest.raises(DependencyUnavailable):
+        stt_providers.recognize(two_seconds, 16000, 'caller_unknown')
+
+def test_streamed_turns_follow_the_context_engine_and_fallback(monkeypatch):
+    use_speech_config(monkeypatch, stt_providers, {'providers': {'stt': {
+        'default': 'cloud', 'fallback': 'local', 'contexts': {'internal': {'default': 'local'}},
+    }}})
+    local, streamed = Engine('local'), []
+
+    def cloud(read_chunk, budget, max_duration_ms):
+        while read_chunk():
+            streamed.append('chunk')
+            if len(streamed) == 2:
+                raise ConnectionError("stream dropped")
+        return 'cloud'
+
+    monkeypatch.setattr(stt_providers, 'STT_ENGINES', {'cloud': Engine('cloud'), 'local': local})
+    monkeypatch.setattr(stt_providers, 'STREAMING_ENGINES', {'cloud': cloud})
+    assert stt_providers.streaming_engine('caller_unknown') == 'cloud'
+    assert stt_providers.streaming_engine('internal') is None  # Recorded for the local engine
+
+    chunks = iter([b'\x00' * 320] * 4)
+    assert stt_providers.recognize_stream(lambda: next(chunks, b''), 'caller_unknown') == 'local'
+    assert local.calls == 1 and streamed == ['chunk', 'chunk']
+
+    def refused(read_chunk, budget, max_duration_ms):
+        raise DependencyUnavailable('stt', "circuit breaker open")
+
+    monkeypatch.setitem(stt_providers.STREAMING_ENGINES, 'cloud', refused)
+    assert stt_providers.recognize_stream(lambda: b'', 'caller_unknown') is None  # Record the turn instead
+    assert stt_providers.recognize(bytes(16000), 16000, 'caller_unknown', skip=('cloud',)) == 'local'
+
+def test_tts_voice_names_its_engine(monkeypatch, tmp_path):
+    use_speech_config(monkeypatch, tts_providers, {
+        'providers': {'tts': {'default': 'azure', 'fallback': 'espeak',
+                              'contexts': {'caller_unknown': {'default': 'piper'}}}},
+        'engines': {'piper': {'voice': 'en_US-amy-low'}},
+    })
+    monkeypatch.setattr(tts_providers.local_tts, 'get_config', lambda: SimpleNamespace(speech={}))
+    assert tts_providers.voices_for('internal') == [tts_providers.DEFAULT_VOICE, 'espeak:en-us']
+    assert tts_providers.all_voices() == [tts_providers.DEFAULT_VOICE, 'espeak:en-us', 'piper:en_US-lessac-low']
+
+    rendered = []
+
+    def piper(text, output_file, voice, audio_format, budget=None):
+        raise RuntimeError("Piper voice not found")
+
+    def espeak(text, output_file, voice, audio_format, budget=None):
+        rendered.append((text, voice))
+        return True
+
+    monkeypatch.setattr(tts_providers, 'LOCAL_TTS_ENGINES', {'piper': piper, 'espeak': espeak})
+    monkeypatch.setattr(tts_providers, 'voices_for', lambda context: ['piper:en_US-lessac-low', 'espeak:en-us'])
+    assert tts_providers.synthesize_for_context("Hello", str(tmp_path / 'hello.wav'), 'caller_unknown')
+    assert rendered == [("Hello", 'en-us')]
+
+def test_cpu_pool_runs_in_other_processes_and_times_out():
+    pool = CPUPool('test', workers=1)
+    try:
+        assert pool.start().run(os.getpid) != os.getpid()
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            pool.run(time.sleep, 2, timeout=0.1)
+        assert time.monotonic() - started < 1
+    finally:
+        pool.close()
+
+def test_cpu_pools_split_the_cores_among_prefork_workers(monkeypatch):
+    monkeypatch.setattr(cpu_pool.os, 'sched_getaffinity', lambda pid: set(range(8)), raising=False)
+    monkeypatch.setattr(cpu_pool, '_siblings', 1)
+    assert CPUPool('test').workers == 8
+    cpu_pool.configure_cpu_pools(4)
+    assert CPUPool('test').workers == 2 and CPUPool('test', workers=3).workers == 3
+    cpu_pool.configure_cpu_pools(16)
+    assert cpu_pool.default_workers() == 1
@@ -0,0 +1,124 @@
+import io
+from types import SimpleNamespace
+from stt.streaming import AzureStreamingRecognizer, FakeStreamingRecognizer, stream_utterance
+from utils.speech_pool import PooledSpeech, SpeechPool
+import pytest
+import speech_input
+import utils.admission as admission
+from speech_input import capture_input, capture_utterance
+
+def _reader(total_bytes, chunk=320):
+    audio = io.BytesIO(b"\x00\x01" * (total_bytes // 2))
+    return lambda: audio.read(chunk)
+
+def test_stream_ends_on_endpointing_with_partials():
+    recognizer = FakeStreamingRecognizer("I want to speak to dad", speech_bytes=9600, bytes_per_word=1600)
+    text = stream_utterance(_reader(80000), recognizer, max_duration_ms=5000)
+    assert text == "I want to speak to dad"
+    assert recognizer.partials[0] == "I"
+    assert recognizer.partials[-1] == "I want to speak to dad"
+    # Stopped at the endpoint, well before the 5 s of available audio.
+    assert recognizer.received == 9600
+    assert recognizer.stopped
+
+def test_stream_respects_safety_cap_on_silence():
+    recognizer = FakeStreamingRecognizer("", speech_bytes=10 ** 9)
+    assert stream_utterance(_reader(160000), recognizer, max_duration_ms=1000) == ""
+    assert recognizer.received == 16000
+
+def test_capture_utterance_uses_streaming_path():
+    class FakeAGI:
+        env = {'agi_enhanced': '1.0'}
+
+    recognizer = FakeStreamingRecognizer("sales call", speech_bytes=3200)
+    text = capture_utterance(FakeAGI(), "call-1", "unknown",
+                             recognizer_factory=lambda: recognizer, read_chunk=_reader(32000))
+    assert text == "sales call"
+
+def test_streamed_turns_hold_an_stt_slot(monkeypatch):
+    class FakeAGI:
+        env = {'agi_enhanced': '1.0'}
+
+    class Pool:
+        held = []
+
+        def acquire(self, priority=False, wait=None, call_context=None):
+            self.held.append('stt')
+            return 'token'
+
+        def release(self, token):
+            self.held.remove('stt')
+
+    pool = Pool()
+    monkeypatch.setattr(admission, 'get_slot_pool', lambda dependency: pool if dependency == 'stt' else None)
+    held = []
+    recognizer = FakeStreamingRecognizer("sales call", speech_bytes=3200)
+    recognizer.start = lambda **kwargs: held.append(list(pool.held))  # Slots held while streaming
+    capture_utterance(FakeAGI(), "call-1", "unknown", recognizer_factory=lambda: recognizer, read_chunk=_reader(32000))
+    assert held == [['stt']] and pool.held == []
+
+def test_eagi_turns_are_recorded_when_the_engine_is_local(monkeypatch):
+    class FakeAGI:
+        env = {'agi_enhanced': '1.0'}
+
+        def record_file(self, filename, format, escape_digits, timeout, silence):
+            self.recorded = True
+            return ''
+
+    monkeypatch.setattr(speech_input, 'streaming_engine', lambda call_context: None)
+    monkeypatch.setattr(speech_input, 'recognize_stream', lambda *args, **kwargs: pytest.fail("streamed"))
+    agi = FakeAGI()
+    heard = capture_input(agi, "call-1", "caller_unknown")
+    assert agi.recorded and (heard.digit, heard.text) == ('', "")
+
+def test_keypad_digit_ends_a_recorded_turn_without_stt(monkeypatch):
+    class FakeAGI:
+        env = {'agi_enhanced': '0.0'}
+
+        def record_file(self, filename, format, escape_digits, timeout, silence):
+            self.escape_digits = escape_digits
+            return '2'
+
+    monkeypatch.setattr(speech_input, 'recognize', lambda *args, **kwargs: pytest.fail("sent to STT"))
+    agi = FakeAGI()
+    heard = capture_input(agi, "call-1", "caller_allowed", keys='12')
+    assert (heard.digit, heard.text) == ('2', "")
+    assert agi.escape_digits == "#12"
+
+class Signal:
+    def connect(self, handler):
+        pass
+
+class PushedRecognizer:
+    """The parts of an SDK recognizer and its push stream a streamed turn uses."""
+    def __init__(self):
+        self.recognizing = self.recognized = self.canceled = self.session_stopped = Signal()
+        self.pushed = 0
+        self.closed = self.stopped = False
+
+    def start_continuous_recognition_async(self):
+        return SimpleNamespace(get=lambda: None)
+
+    def stop_continuous_recognition_async(self):
+        self.stopped = True
+        return SimpleNamespace(get=lambda: None)
+
+    def write(self, chunk):
+        self.pushed += len(chunk)
+
+    def close(self):
+        self.closed = True
+
+def test_streamed_turns_use_the_pre_connected_recognizers():
+    built = []
+
+    def connect(timeout):
+        built.append(PushedRecognizer())
+        return PooledSpeech((built[-1], built[-1]))
+
+    pool = SpeechPool('stt', connect, size=1, reusable=False)
+    pool.prefill()  # While the greeting plays
+    stream_utterance(_reader(3200), AzureStreamingRecognizer(pool))
+    assert len(built) == 1 and built[0].pushed == 3200
+    assert built[0].closed and built[0].stopped
+    assert pool.idle_count() == 0  # Used once, then replaced
@@ -0,0 +1,64 @@
+import os
+import pytest
+from tts.cache import TTSCache
+
+class Synth:
+    """Writes size bytes per prompt, checking it never writes the final path directly."""
+    def __init__(self, size=100, fail=False):
+        self.size = size
+        self.fail = fail
+        self.calls = []
+
+    def __call__(self, text, output_file, voice=None, audio_format=None, **kwargs):
+        self.calls.append((text, voice))
+        assert os.path.basename(output_file).startswith('.tmp-')
+        with open(output_file, 'wb') as f:
+            f.write(b'\0' * self.size)
+        return not self.fail
+
+def age(path, seconds):
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime - seconds, stat.st_mtime - seconds))
+
+def files(cache_dir):
+    return sorted(name for _, _, names in os.walk(cache_dir) for name in names if name.endswith('.wav'))
+
+def test_prompts_are_cached_by_text_voice_and_format(tmp_path):
+    synth = Synth()
+    cache = TTSCache(str(tmp_path), voice='en-US-A', audio_format='wav8', synthesize=synth)
+    path = cache.synthesize("Goodbye.")
+    assert cache.synthesize("Goodbye.") == path and cache.get("Goodbye.") == path
+    assert len(synth.calls) == 1
+    other_voice = cache.synthesize("Goodbye.", voice='en-GB-B')
+    assert other_voice != path
+    assert cache.path_for("Goodbye.", audio_format='wav16') not in (path, other_voice)
+    key = TTSCache.key("Goodbye.", 'en-US-A', 'wav8')
+    assert path == os.path.join(str(tmp_path), key[:2], f"{key}.wav")
+
+def test_failed_synthesis_leaves_nothing_behind(tmp_path):
+    cache = TTSCache(str(tmp_path), synthesize=Synth(fail=True))
+    with pytest.raises(Exception):
+        cache.synthesize("Goodbye.")
+    assert cache.get("Goodbye.") is None
+    assert [name for _, _, names in os.walk(tmp_path) for name in names if name.startswith('.tmp-')] == []
+
+def test_least_recently_used_prompts_are_evicted(tmp_path):
+    cache = TTSCache(str(tmp_path), max_bytes=1000, synthesize=Synth(size=300))
+    first, second, third = (cache.synthesize(text) for text in ("one", "two", "three"))
+    for i, path in enumerate((first, second, third)):
+        age(path, 100 - i)
+    cache.get("one")  # Now the most recently used
+    cache.synthesize("four")  # 1200 bytes: the oldest go until at most 900 are left
+    assert cache.get("two") is None
+    assert cache.get("one") == first and cache.get("three") == third and cache.get("four")
+
+def test_the_directory_is_only_scanned_when_the_cap_may_be_crossed(tmp_path, monkeypatch):
+    cache = TTSCache(str(tmp_path), max_bytes=1000, synthesize=Synth(size=100))
+    scans = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, '_entries', lambda: scans.append(1) or entries())
+    for i in range(10):
+        cache.synthesize(f"prompt {i}")
+    assert len(scans) == 1  # The first write, to learn the size
+    cache.synthesize("prompt 10")
+    assert len(scans) == 2 and len(files(tmp_path)) == 9